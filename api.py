@@ -0,0 +1,227 @@
+"""JSON API for Warbler, version 1.
+
+Mounted at /api/v1. It serves the same data as the HTML views, from the
+same query layer (queries.py, timeline.py, search.py), as compact JSON:
+
+    GET /api/v1/timeline                    the logged-in user's home feed
+    GET /api/v1/users?ids=1,2,3             several users in one request
+    GET /api/v1/users?q=term                username search
+    GET /api/v1/users                       all users, in id order
+    GET /api/v1/users/<id>                  a profile
+    GET /api/v1/users/<id>/messages         a user's messages
+    GET /api/v1/users/<id>/followers        users following them
+    GET /api/v1/users/<id>/following        users they follow
+    GET /api/v1/users/<id>/likes            messages they've liked
+    GET /api/v1/messages?ids=1,2,3          several messages in one request
+    GET /api/v1/messages/<id>               a message
+
+Lists come back as {"items": [...], "next": ..., "prev": ...}, where
+`next` and `prev` are the query args for the neighbouring pages (e.g.
+{"before": "..."}) or null. Authentication is the same session cookie
+the site uses; endpoints whose pages require a login answer 401 without
+one. Messages carry a `liked` flag for the logged-in user.
+"""
+
+from functools import wraps
+
+from flask import Blueprint, abort, g, jsonify, request
+from werkzeug.exceptions import HTTPException
+
+from models import User, Message
+from pagination import (Page, cursor_args, parse_message_cursor,
+                        parse_user_cursor)
+import queries
+import search
+import timeline
+
+# Most ids accepted by one batched lookup.
+MAX_BATCH_SIZE = 100
+
+bp = Blueprint('api', __name__, url_prefix='/api/v1')
+
+
+@bp.errorhandler(HTTPException)
+def handle_http_error(error):
+    """Answer errors in JSON rather than HTML."""
+
+    return jsonify(error=error.description), error.code
+
+
+def login_required(view):
+    """Answer 401 unless a user is logged in."""
+
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        if not g.user:
+            abort(401, "Login required.")
+        return view(*args, **kwargs)
+
+    return wrapper
+
+
+def batch_ids():
+    """Parse the comma-separated `ids` query arg; None if it is absent.
+
+    Aborts 400 if the ids are malformed or there are too many.
+    """
+
+    ids = request.args.get('ids')
+    if ids is None:
+        return None
+
+    try:
+        ids = list(dict.fromkeys(int(id) for id in ids.split(',') if id))
+    except ValueError:
+        abort(400, "ids must be comma-separated integers.")
+
+    if len(ids) > MAX_BATCH_SIZE:
+        abort(400, f"At most {MAX_BATCH_SIZE} ids per request.")
+
+    return ids
+
+
+##############################################################################
+# Serializers
+
+
+def user_summary(user):
+    """The fields of `user` shown next to their messages and in lists."""
+
+    return {
+        'id': user.id,
+        'username': user.username,
+        'image_url': user.image_url,
+    }
+
+
+def user_json(user):
+    """The full public profile of `user`."""
+
+    return dict(
+        user_summary(user),
+        header_image_url=user.header_image_url,
+        bio=user.bio,
+        location=user.location,
+        messages_count=user.messages_count,
+        followers_count=user.followers_count,
+        following_count=user.following_count,
+        likes_count=user.likes_count,
+    )
+
+
+def message_json(msg, liked_ids):
+    return {
+        'id': msg.id,
+        'text': msg.text,
+        'timestamp': msg.timestamp.isoformat(),
+        'user': user_summary(msg.user),
+        'likes_count': msg.likes_count,
+        'liked': msg.id in liked_ids,
+    }
+
+
+def viewer_liked(messages):
+    """Ids among `messages` liked by the logged-in user."""
+
+    return queries.liked_ids(g.user.id, messages) if g.user else set()
+
+
+def users_response(page):
+    return jsonify(items=[user_summary(user) for user in page],
+                   next=page.next, prev=page.prev)
+
+
+def messages_response(page):
+    liked_ids = viewer_liked(page)
+    return jsonify(items=[message_json(msg, liked_ids) for msg in page],
+                   next=page.next, prev=page.prev)
+
+
+##############################################################################
+# Endpoints
+
+
+@bp.route('/timeline')
+@login_required
+def timeline_index():
+    """A page of the logged-in user's home timeline."""
+
+    before, after = cursor_args(parse_message_cursor)
+    return messages_response(
+        timeline.timeline_page(g.user.id, before=before, after=after))
+
+
+@bp.route('/users')
+def users_index():
+    """Users by `ids`, a username search by `q`, or a page of all users."""
+
+    ids = batch_ids()
+    if ids is not None:
+        return jsonify(items=[user_json(user)
+                              for user in queries.users_by_id(ids)])
+
+    term = request.args.get('q')
+    if term:
+        return users_response(Page(search.search_users(term)))
+
+    before, after = cursor_args(parse_user_cursor)
+    return users_response(queries.users_page(before=before, after=after))
+
+
+@bp.route('/users/<int:user_id>')
+def users_show(user_id):
+    return jsonify(user_json(User.query.get_or_404(user_id)))
+
+
+@bp.route('/users/<int:user_id>/messages')
+def users_messages(user_id):
+    User.query.get_or_404(user_id)
+    before, after = cursor_args(parse_message_cursor)
+    return messages_response(
+        queries.user_messages_page(user_id, before=before, after=after))
+
+
+@bp.route('/users/<int:user_id>/followers')
+@login_required
+def users_followers(user_id):
+    User.query.get_or_404(user_id)
+    before, after = cursor_args(parse_user_cursor)
+    return users_response(
+        queries.followers_page(user_id, before=before, after=after))
+
+
+@bp.route('/users/<int:user_id>/following')
+@login_required
+def users_following(user_id):
+    User.query.get_or_404(user_id)
+    before, after = cursor_args(parse_user_cursor)
+    return users_response(
+        queries.following_page(user_id, before=before, after=after))
+
+
+@bp.route('/users/<int:user_id>/likes')
+@login_required
+def users_likes(user_id):
+    User.query.get_or_404(user_id)
+    before, after = cursor_args(parse_message_cursor)
+    return messages_response(
+        queries.liked_messages_page(user_id, before=before, after=after))
+
+
+@bp.route('/messages')
+def messages_index():
+    """Messages by `ids`."""
+
+    ids = batch_ids()
+    if ids is None:
+        abort(400, "ids is required.")
+
+    messages = queries.messages_by_id(ids)
+    liked_ids = viewer_liked(messages)
+    return jsonify(items=[message_json(msg, liked_ids) for msg in messages])
+
+
+@bp.route('/messages/<int:message_id>')
+def messages_show(message_id):
+    msg = Message.query.get_or_404(message_id)
+    return jsonify(message_json(msg, viewer_liked([msg])))
@@ -1,45 +1,59 @@
-import os
+import math
 
-from flask import Flask, render_template, request, flash, redirect, session, g
+from flask import (Blueprint, Flask, render_template, request, flash,
+                   redirect, session, g)
 from flask_debugtoolbar import DebugToolbarExtension
 from sqlalchemy.exc import IntegrityError
 
+import config
 from forms import UserAddForm, UserEditForm, LoginForm, MessageForm
-from models import db, connect_db, User, Message, Likes
+from models import db, connect_db, User, Message
+import api
+import cache
+import counters
+import fragments
+import httpcache
+import instrumentation
+import jobs
+import migrations
+import passwords
+import queries
+import ratelimit
+import relationships
+import replicas
+import search
+import streaming
+import timeline
+from pagination import (Page, cursor_args, page_url, parse_message_cursor,
+                        parse_user_cursor)
 
 CURR_USER_KEY = "curr_user"
 
-app = Flask(__name__)
-
-# Get DB_URI from environ variable (useful for production/testing) or,
-# if not set there, use development local db.
-app.config['SQLALCHEMY_DATABASE_URI'] = (
-    os.environ.get('DATABASE_URL', 'postgres:///warbler'))
-
-app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-app.config['SQLALCHEMY_ECHO'] = True
-app.config['DEBUG_TB_INTERCEPT_REDIRECTS'] = False
-app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY', "it's a secret")
-toolbar = DebugToolbarExtension(app)
-
-connect_db(app)
+views = Blueprint('views', __name__)
 
 
 ##############################################################################
 # User signup/login/logout
 
 
-@app.before_request
+@views.before_app_request
 def add_user_to_g():
     """If we're logged in, add curr user to Flask global."""
 
     if CURR_USER_KEY in session:
-        g.user = User.query.get(session[CURR_USER_KEY])
+        g.user = cache.get_user(session[CURR_USER_KEY])
 
     else:
         g.user = None
 
 
+@views.app_context_processor
+def add_follow_graph():
+    """Let templates ask whether the logged-in user follows someone."""
+
+    return {'follow_graph': relationships.follow_graph()}
+
+
 def do_login(user):
     """Log in user."""
 
@@ -53,7 +67,7 @@ def do_logout():
         del session[CURR_USER_KEY]
 
 
-@app.route('/signup', methods=["GET", "POST"])
+@views.route('/signup', methods=["GET", "POST"])
 def signup():
     """Handle user signup.
 
@@ -89,17 +103,25 @@ def signup():
         return render_template('users/signup.html', form=form)
 
 
-@app.route('/login', methods=["GET", "POST"])
+@views.route('/login', methods=["GET", "POST"])
 def login():
     """Handle user login."""
 
     form = LoginForm()
 
     if form.validate_on_submit():
+        wait = ratelimit.login_retry_after(form.username.data)
+        if wait:
+            flash("Too many login attempts. Please try again later.", 'danger')
+            return (render_template('users/login.html', form=form), 429,
+                    {'Retry-After': str(math.ceil(wait))})
+
         user = User.authenticate(form.username.data,
                                  form.password.data)
 
         if user:
+            # Saves the hash if it was upgraded to the current cost.
+            db.session.commit()
             do_login(user)
             flash(f"Hello, {user.username}!", "success")
             return redirect("/")
@@ -109,7 +131,7 @@ def login():
     return render_template('users/login.html', form=form)
 
 
-@app.route('/logout')
+@views.route('/logout')
 def logout():
     """Handle logout of user."""
 
@@ -123,39 +145,56 @@ def logout():
 ##############################################################################
 # General user routes:
 
-@app.route('/users')
+@views.route('/users')
+@replicas.read_only
 def list_users():
     """Page with listing of users.
 
-    Can take a 'q' param in querystring to search by that username.
+    Can take a 'q' param in querystring to search by that username
+    (ranked, capped at search.SEARCH_LIMIT results); otherwise takes
+    'before'/'after' cursors to page through all users.
     """
 
-    search = request.args.get('q')
+    term = request.args.get('q')
 
-    if not search:
-        users = User.query.all()
+    if term:
+        users = Page(search.search_users(term))
     else:
-        users = User.query.filter(User.username.like(f"%{search}%")).all()
+        before, after = cursor_args(parse_user_cursor)
+        users = queries.users_page(before=before, after=after)
 
     return render_template('users/index.html', users=users)
 
 
-@app.route('/users/<int:user_id>')
+@views.route('/users/<int:user_id>')
+@replicas.read_only
 def users_show(user_id):
     """Show user profile."""
 
     user = User.query.get_or_404(user_id)
+    before, after = cursor_args(parse_message_cursor)
+
+    if streaming.streaming_enabled():
+        messages = queries.user_messages_page(user_id, before=before,
+                                              after=after, stream=True)
+        return streaming.stream_template('users/show.html', user=user,
+                                         messages=messages)
+
+    messages = queries.user_messages_page(user_id, before=before, after=after)
+
+    unchanged = httpcache.not_modified(
+        httpcache.row_version(user),
+        [msg.id for msg in messages],
+        g.user and g.user.id != user.id
+        and relationships.follow_graph().is_following(user))
+    if unchanged:
+        return unchanged
 
-    messages = (Message
-                .query
-                .filter(Message.user_id == user_id)
-                .order_by(Message.timestamp.desc())
-                .limit(100)
-                .all())
     return render_template('users/show.html', user=user, messages=messages)
 
 
-@app.route('/users/<int:user_id>/following')
+@views.route('/users/<int:user_id>/following')
+@replicas.read_only
 def show_following(user_id):
     """Show list of people this user is following."""
 
@@ -164,10 +203,13 @@ def show_following(user_id):
         return redirect("/")
 
     user = User.query.get_or_404(user_id)
-    return render_template('users/following.html', user=user)
+    before, after = cursor_args(parse_user_cursor)
+    users = queries.following_page(user_id, before=before, after=after)
+    return render_template('users/following.html', user=user, users=users)
 
 
-@app.route('/users/<int:user_id>/followers')
+@views.route('/users/<int:user_id>/followers')
+@replicas.read_only
 def users_followers(user_id):
     """Show list of followers of this user."""
 
@@ -176,10 +218,12 @@ def users_followers(user_id):
         return redirect("/")
 
     user = User.query.get_or_404(user_id)
-    return render_template('users/followers.html', user=user)
+    before, after = cursor_args(parse_user_cursor)
+    users = queries.followers_page(user_id, before=before, after=after)
+    return render_template('users/followers.html', user=user, users=users)
 
 
-@app.route('/users/follow/<int:follow_id>', methods=['POST'])
+@views.route('/users/follow/<int:follow_id>', methods=['POST'])
 def add_follow(follow_id):
     """Add a follow for the currently-logged-in user."""
 
@@ -187,14 +231,17 @@ def add_follow(follow_id):
         flash("Unauthorized access.", "danger")
         return redirect("/")
 
-    followed_user = User.query.get_or_404(follow_id)
-    g.user.following.append(followed_user)
-    db.session.commit()
+    if relationships.follow(g.user.id, follow_id):
+        db.session.commit()
+        cache.invalidate_user(g.user.id, follow_id)
+        replicas.stick_to_primary()
+    else:
+        User.query.get_or_404(follow_id)
 
     return redirect(f"/users/{g.user.id}/following")
 
 
-@app.route('/users/stop-following/<int:follow_id>', methods=['POST'])
+@views.route('/users/stop-following/<int:follow_id>', methods=['POST'])
 def stop_following(follow_id):
     """Have currently-logged-in-user stop following this user."""
 
@@ -202,16 +249,17 @@ def stop_following(follow_id):
         flash("Unauthorized access.", "danger")
         return redirect("/")
 
-    followed_user = User.query.get(follow_id)
-    g.user.following.remove(followed_user)
-    db.session.commit()
+    if relationships.unfollow(g.user.id, follow_id):
+        db.session.commit()
+        cache.invalidate_user(g.user.id, follow_id)
+        replicas.stick_to_primary()
 
     return redirect(f"/users/{g.user.id}/following")
 
 
 # Likes routes
 
-@app.route('/users/add_like/<int:message_id>', methods=["POST"])
+@views.route('/users/add_like/<int:message_id>', methods=["POST"])
 def add_like(message_id):
     """Add a like to a message."""
 
@@ -219,29 +267,21 @@ def add_like(message_id):
         flash("Unauthorized access.", "danger")
         return redirect("/")
 
-    if Message.query.get(message_id).user.id == g.user.id:
-        flash("Cannot add likes for your own messages.", "warning")
-        return redirect("/")
-
-    if Likes.query.filter_by(message_id=message_id, user_id=g.user.id).first():
-        like = Likes.query.filter_by(
-            message_id=message_id, user_id=g.user.id).first()
-        db.session.delete(like)
-        db.session.commit()
-
-        return redirect("/")
-
+    if relationships.toggle_like(g.user.id, message_id) is None:
+        # Nothing changed; only now is it worth finding out why.
+        msg = Message.query.get_or_404(message_id)
+        if msg.user_id == g.user.id:
+            flash("Cannot add likes for your own messages.", "warning")
     else:
-        # if Likes.query.
-        like = Likes(user_id=g.user.id, message_id=message_id)
-
-        db.session.add(like)
         db.session.commit()
+        cache.invalidate_user(g.user.id)
+        replicas.stick_to_primary()
 
-        return redirect("/")
+    return redirect("/")
 
 
-@app.route('/users/<int:user_id>/likes')
+@views.route('/users/<int:user_id>/likes')
+@replicas.read_only
 def users_likes(user_id):
     """Show list of liked warbles for this user."""
 
@@ -250,10 +290,12 @@ def users_likes(user_id):
         return redirect("/")
 
     user = User.query.get_or_404(user_id)
-    return render_template('users/likes.html', user=user)
+    before, after = cursor_args(parse_message_cursor)
+    messages = queries.liked_messages_page(user_id, before=before, after=after)
+    return render_template('users/likes.html', user=user, messages=messages)
 
 
-@app.route('/users/profile', methods=["GET", "POST"])
+@views.route('/users/profile', methods=["GET", "POST"])
 def profile():
     """Update profile for current user."""
 
@@ -265,27 +307,29 @@ def profile():
     form = UserEditForm(obj=user)
 
     if form.validate_on_submit():
+        if not user.check_password(request.form["password"]):
+            flash("Invalid password. Profile not updated", "danger")
+            return redirect(f"/users/{g.user.id}")
+
         user.username = request.form["username"]
         user.email = request.form["email"]
         user.image_url = request.form["image_url"]
         user.header_image_url = request.form["header_image_url"]
         user.bio = request.form["bio"]
-        password = request.form["password"]
 
-        if User.authenticate(user.username, password):
-            db.session.add(user)
-            db.session.commit()
-            flash("Profile updated.", "success")
+        db.session.add(user)
+        db.session.commit()
+        cache.invalidate_user(user.id)
+        replicas.stick_to_primary()
+        fragments.invalidate_user(user.id)
+        flash("Profile updated.", "success")
 
-            return redirect(f"/users/{g.user.id}")
-        else:
-            flash("Invalid password. Profile not updated", "danger")
-            return redirect(f"/users/{g.user.id}")
+        return redirect(f"/users/{g.user.id}")
 
     return render_template("users/edit.html", form=form, user=user)
 
 
-@app.route('/users/delete', methods=["POST"])
+@views.route('/users/delete', methods=["POST"])
 def delete_user():
     """Delete user."""
 
@@ -295,8 +339,14 @@ def delete_user():
 
     do_logout()
 
+    user_id = g.user.id
+    counted_by = counters.user_deleted(user_id)
     db.session.delete(g.user)
+    db.session.flush()
+    counters.recount_later(**counted_by)
     db.session.commit()
+    cache.invalidate_user(user_id)
+    fragments.invalidate_user(user_id)
 
     return redirect("/signup")
 
@@ -304,7 +354,7 @@ def delete_user():
 ##############################################################################
 # Messages routes:
 
-@app.route('/messages/new', methods=["GET", "POST"])
+@views.route('/messages/new', methods=["GET", "POST"])
 def messages_add():
     """Add a message:
 
@@ -320,22 +370,55 @@ def messages_add():
     if form.validate_on_submit():
         msg = Message(text=form.text.data)
         g.user.messages.append(msg)
+        db.session.flush()
+        counters.adjust(User, g.user.id, messages_count=1)
+        timeline.push_message(msg)
         db.session.commit()
+        cache.invalidate_user(g.user.id)
+        replicas.stick_to_primary()
 
         return redirect(f"/users/{g.user.id}")
 
     return render_template('messages/new.html', form=form)
 
 
-@app.route('/messages/<int:message_id>', methods=["GET"])
+@views.route('/messages/search')
+def messages_search():
+    """Search warbles.
+
+    Takes a 'q' param in querystring with the words to look for, and
+    'before'/'after' cursors to page through the results.
+    """
+
+    term = request.args.get('q', '')
+    before, after = cursor_args(search.parse_search_cursor)
+
+    messages = search.search_messages(term, before=before, after=after)
+    liked_ids = queries.liked_ids(g.user.id, messages) if g.user else set()
+
+    return render_template('messages/search.html', messages=messages,
+                           liked_ids=liked_ids, q=term)
+
+
+@views.route('/messages/<int:message_id>', methods=["GET"])
+@replicas.read_only
 def messages_show(message_id):
     """Show a message."""
 
     msg = Message.query.get_or_404(message_id)
+
+    unchanged = httpcache.not_modified(
+        httpcache.row_version(msg),
+        httpcache.row_version(msg.user),
+        g.user and g.user.id != msg.user_id
+        and relationships.follow_graph().is_following(msg.user))
+    if unchanged:
+        return unchanged
+
     return render_template('messages/show.html', message=msg)
 
 
-@app.route('/messages/<int:message_id>/delete', methods=["POST"])
+@views.route('/messages/<int:message_id>/delete', methods=["POST"])
 def messages_destroy(message_id):
     """Delete a message."""
 
@@ -344,8 +427,14 @@ def messages_destroy(message_id):
         return redirect("/")
 
     msg = Message.query.get_or_404(message_id)
+    author_id = msg.user_id
+    counters.message_deleted(msg)
+    timeline.remove_message(msg.id)
     db.session.delete(msg)
     db.session.commit()
+    cache.invalidate_user(author_id)
+    replicas.stick_to_primary()
+    fragments.invalidate_message(message_id)
 
     return redirect(f"/users/{g.user.id}")
 
@@ -354,45 +443,73 @@ def messages_destroy(message_id):
 # Homepage and error pages
 
 
-@app.route('/')
+@views.route('/')
+@replicas.read_only
 def homepage():
     """Show homepage:
 
     - anon users: no messages
-    - logged in: 100 most recent messages of followed_users
+    - logged in: a page of messages from the user's timeline, newest
+      first; 'before'/'after' cursors page through older/newer messages
     """
 
     if g.user:
+        before, after = cursor_args(parse_message_cursor)
+
+        if streaming.streaming_enabled():
+            messages = timeline.timeline_page(g.user.id, before=before,
+                                              after=after, stream=True)
 
-        following_ids = [user.id for user in g.user.following]
-        following_ids.append(g.user.id)
+            # Filled in a batch at a time as the rows are fetched.
+            liked_ids = set()
+            messages.on_batch(lambda batch: liked_ids.update(
+                queries.liked_ids(g.user.id, batch)))
 
-        messages = (Message
-                    .query
-                    .filter(Message.user_id.in_(following_ids))
-                    .order_by(Message.timestamp.desc())
-                    .limit(100)
-                    .all())
+            return streaming.stream_template('home.html', messages=messages,
+                                             liked_ids=liked_ids)
 
-        return render_template('home.html', messages=messages)
+        messages = timeline.timeline_page(g.user.id, before=before, after=after)
+
+        return render_template('home.html', messages=messages,
+                               liked_ids=queries.liked_ids(g.user.id, messages))
 
     else:
         return render_template('home-anon.html')
 
 
 ##############################################################################
-# Turn off all caching in Flask
-#   (useful for dev; in production, this kind of stuff is typically
-#   handled elsewhere)
-#
-# https://stackoverflow.com/questions/34066804/disabling-caching-in-flask
-
-@ app.after_request
-def add_header(req):
-    """Add non-caching headers on every request."""
-
-    req.headers["Cache-Control"] = "no-cache, no-store, must-revalidate"
-    req.headers["Pragma"] = "no-cache"
-    req.headers["Expires"] = "0"
-    req.headers['Cache-Control'] = 'public, max-age=0'
-    return req
+# App factory
+
+
+def create_app(profile=None):
+    """Create the Warbler app with the named config profile (see config.py)."""
+
+    app = Flask(__name__)
+    app.config.from_object(config.get_profile(profile))
+
+    if app.config['DEBUG_TOOLBAR']:
+        DebugToolbarExtension(app)
+
+    connect_db(app)
+    instrumentation.init_instrumentation(app)
+    cache.init_user_cache(app)
+    fragments.init_fragment_cache(app)
+    passwords.init_app(app)
+    ratelimit.init_rate_limits(app)
+    httpcache.init_app(app)
+
+    app.add_template_global(page_url)
+    app.register_blueprint(views)
+    app.register_blueprint(api.bp)
+    app.cli.add_command(counters.reconcile_command)
+    app.cli.add_command(migrations.db_cli)
+    app.cli.add_command(jobs.jobs_cli)
+
+    return app
+
+
+# The app for the profile in $WARBLER_ENV, for `flask run` and WSGI servers.
+app = create_app()
+
+# Database work outside an app context (scripts, tests) uses this app.
+db.app = app
@@ -0,0 +1,238 @@
+"""ASGI entry point for Warbler.
+
+Serve the app from an asyncio event loop with any ASGI server, e.g.:
+
+    uvicorn asgi:application
+
+Flask 1.0 views and SQLAlchemy 1.2 sessions are synchronous, so there are
+no async views or async database driver here. Instead the event loop owns
+every connection: it reads each request and writes each response at
+whatever pace the client manages, and a thread is only handed the request
+once its body has arrived, for as long as the view runs. Thousands of
+slow clients can then be in flight on a handful of threads, where a
+threaded WSGI server would tie up a thread per client for the whole
+exchange.
+
+Views run on two bounded thread pools. The read-heavy views in
+READ_ENDPOINTS get ASGI_READ_THREADS threads of their own, so a burst of
+logins (bcrypt) or writes can't starve them; everything else shares
+ASGI_THREADS. Keep the total within the database connection pool.
+
+A view's output is handed to the event loop as it is produced, so streamed
+pages (see streaming.py) still reach the client early, but the thread
+never waits on a slow client: the rest of the page is buffered instead.
+"""
+
+import asyncio
+import io
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+from werkzeug.exceptions import HTTPException
+
+from app import app
+
+READ_ENDPOINTS = {
+    'views.homepage',
+    'views.users_show',
+    'views.messages_show',
+    'views.list_users',
+}
+
+# Larger request bodies are refused; Warbler's forms are tiny.
+MAX_BODY_SIZE = 1024 * 1024
+
+
+class ClientDisconnected(Exception):
+    """The client went away before sending the whole request."""
+
+
+def build_environ(scope, body):
+    """The WSGI environ for ASGI HTTP connection `scope`."""
+
+    server = scope.get('server') or ('localhost', 80)
+    client = scope.get('client') or ('', 0)
+
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', '').encode().decode('latin-1'),
+        'PATH_INFO': scope['path'].encode().decode('latin-1'),
+        'QUERY_STRING': scope['query_string'].decode('latin-1'),
+        'SERVER_NAME': server[0],
+        'SERVER_PORT': str(server[1]),
+        'SERVER_PROTOCOL': f"HTTP/{scope['http_version']}",
+        'REMOTE_ADDR': client[0],
+        'CONTENT_LENGTH': str(len(body)),
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': io.BytesIO(body),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False,
+    }
+
+    for name, value in scope['headers']:
+        name = name.decode('latin-1').upper().replace('-', '_')
+        value = value.decode('latin-1')
+
+        if name == 'CONTENT_TYPE':
+            environ['CONTENT_TYPE'] = value
+        elif name != 'CONTENT_LENGTH':
+            key = f'HTTP_{name}'
+            if key in environ:
+                # Cookie headers split up (as HTTP/2 allows) join with "; ".
+                sep = '; ' if key == 'HTTP_COOKIE' else ','
+                value = f"{environ[key]}{sep}{value}"
+            environ[key] = value
+
+    return environ
+
+
+class ASGIApp:
+    """Serve WSGI app `wsgi_app` over ASGI (see module docstring)."""
+
+    def __init__(self, wsgi_app, read_threads=None, threads=None):
+        self.wsgi_app = wsgi_app
+        config = wsgi_app.config
+
+        self.read_pool = ThreadPoolExecutor(
+            read_threads or config['ASGI_READ_THREADS'],
+            thread_name_prefix='warbler-read')
+        self.pool = ThreadPoolExecutor(
+            threads or config['ASGI_THREADS'],
+            thread_name_prefix='warbler')
+
+    def executor_for(self, scope):
+        """The thread pool for a request to `scope`'s path."""
+
+        try:
+            endpoint, args = (self.wsgi_app.url_map.bind('localhost')
+                              .match(scope['path'], scope['method']))
+        except HTTPException:
+            return self.pool
+
+        return self.read_pool if endpoint in READ_ENDPOINTS else self.pool
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self.lifespan(receive, send)
+        elif scope['type'] == 'http':
+            await self.http(scope, receive, send)
+        else:
+            raise ValueError(f"Unsupported ASGI scope type {scope['type']!r}")
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+
+            elif message['type'] == 'lifespan.shutdown':
+                self.read_pool.shutdown()
+                self.pool.shutdown()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    async def read_body(self, receive):
+        """The request body, or None if it is larger than MAX_BODY_SIZE.
+
+        Raises ClientDisconnected if the client leaves before it is all in.
+        """
+
+        body = bytearray()
+
+        while True:
+            message = await receive()
+            if message['type'] == 'http.disconnect':
+                raise ClientDisconnected()
+
+            body += message.get('body', b'')
+            if len(body) > MAX_BODY_SIZE:
+                return None
+            if not message.get('more_body'):
+                break
+
+        return bytes(body)
+
+    async def http(self, scope, receive, send):
+        try:
+            body = await self.read_body(receive)
+        except ClientDisconnected:
+            # Nobody to answer, and a partial body isn't a request.
+            return
+
+        if body is None:
+            await send({'type': 'http.response.start', 'status': 413,
+                        'headers': [(b'content-type', b'text/plain')]})
+            await send({'type': 'http.response.body',
+                        'body': b"Request body too large"})
+            return
+
+        loop = asyncio.get_running_loop()
+        output = asyncio.Queue()
+        done = loop.run_in_executor(
+            self.executor_for(scope), self.run_wsgi,
+            build_environ(scope, body), loop, output)
+
+        while True:
+            message = await output.get()
+            if message is None:
+                break
+            await send(message)
+
+        # Raises whatever the view raised outside the response.
+        await done
+
+    def run_wsgi(self, environ, loop, output):
+        """Run the WSGI app on this thread, passing its output to `loop`.
+
+        The whole response is produced on one thread, since Flask keeps
+        the request context (e.g. for stream_with_context) in thread
+        locals.
+        """
+
+        def emit(message):
+            loop.call_soon_threadsafe(output.put_nowait, message)
+
+        response = {}
+
+        def start_response(status, headers, exc_info=None):
+            response['status'] = int(status.split(' ', 1)[0])
+            response['headers'] = [(name.lower().encode('latin-1'),
+                                    value.encode('latin-1'))
+                                   for name, value in headers]
+            return write
+
+        def start():
+            if not response.get('started'):
+                response['started'] = True
+                emit({'type': 'http.response.start',
+                      'status': response['status'],
+                      'headers': response['headers']})
+
+        def write(data):
+            start()
+            emit({'type': 'http.response.body', 'body': bytes(data),
+                  'more_body': True})
+
+        try:
+            iterable = self.wsgi_app(environ, start_response)
+            try:
+                for chunk in iterable:
+                    if chunk:
+                        write(chunk)
+            finally:
+                if hasattr(iterable, 'close'):
+                    iterable.close()
+
+            start()
+            emit({'type': 'http.response.body', 'body': b'',
+                  'more_body': False})
+
+        finally:
+            emit(None)
+
+
+application = ASGIApp(app)
@@ -0,0 +1,6 @@
+"""Benchmarks for Warbler.
+
+Run each one as a module from the repository root, e.g.:
+
+    python -m benchmarks.user_search --help
+"""
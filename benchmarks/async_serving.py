@@ -0,0 +1,136 @@
+"""Benchmark the ASGI entry point against thread-per-request WSGI.
+
+Simulates --clients slow clients at once, each taking --delay seconds to
+send its request and read the response (half each), all asking for the
+same read-heavy page. Both modes get --threads threads to run views on:
+
+- wsgi: a threaded WSGI server, where each connection holds one of the
+  threads for the whole exchange, slow transfers included;
+- asgi: asgi.ASGIApp, where the event loop waits on the clients and a
+  thread is only taken while the view runs.
+
+    python -m benchmarks.async_serving --clients 50 200 1000 --threads 10
+
+Runs in-process, with sleeps standing in for the network, so it measures
+the serving model rather than any particular server.
+"""
+
+import argparse
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks.common import use_database, percentile, PASSWORD_HASH
+
+PATH = "/messages/1"
+
+
+def seed(db):
+    from models import User, Message
+
+    db.drop_all()
+    db.create_all()
+    db.session.add(User(id=1, username="user1", email="user1@example.com",
+                        password=PASSWORD_HASH))
+    db.session.flush()
+    db.session.add(Message(id=1, text="a warble worth waiting for", user_id=1))
+    db.session.commit()
+
+
+def run_wsgi(app, clients, threads, delay):
+    """Return (elapsed s, latency samples in ms)."""
+
+    # Every client connects at once, so latency includes waiting for a
+    # thread to accept the connection.
+    start = time.perf_counter()
+
+    def exchange():
+        time.sleep(delay / 2)
+        res = app.test_client().get(PATH)
+        assert res.status_code == 200, res.status_code
+        time.sleep(delay / 2)
+        return (time.perf_counter() - start) * 1000
+
+    with ThreadPoolExecutor(threads) as pool:
+        samples = list(pool.map(lambda _: exchange(), range(clients)))
+
+    return time.perf_counter() - start, samples
+
+
+def run_asgi(app, clients, threads, delay):
+    """Return (elapsed s, latency samples in ms)."""
+
+    from asgi import ASGIApp
+
+    application = ASGIApp(app, read_threads=threads, threads=threads)
+
+    scope = {
+        'type': 'http', 'http_version': '1.1', 'method': 'GET',
+        'scheme': 'http', 'path': PATH, 'root_path': '',
+        'query_string': b'', 'server': ('localhost', 80),
+        'client': ('127.0.0.1', 5000), 'headers': [],
+    }
+
+    async def exchange():
+        status = []
+
+        async def receive():
+            await asyncio.sleep(delay / 2)
+            return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+        async def send(message):
+            if message['type'] == 'http.response.start':
+                status.append(message['status'])
+            elif not message.get('more_body'):
+                await asyncio.sleep(delay / 2)
+
+        await application(dict(scope), receive, send)
+        assert status == [200], status
+        return (time.perf_counter() - start) * 1000
+
+    async def run_all():
+        return await asyncio.gather(*(exchange() for _ in range(clients)))
+
+    start = time.perf_counter()
+    samples = asyncio.run(run_all())
+    elapsed = time.perf_counter() - start
+
+    application.read_pool.shutdown()
+    application.pool.shutdown()
+
+    return elapsed, samples
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--clients', type=int, nargs='+',
+                        default=[50, 200, 1000])
+    parser.add_argument('--threads', type=int, default=10)
+    parser.add_argument('--delay', type=float, default=0.2,
+                        help="seconds each client spends on the network")
+    parser.add_argument('--database', help="database URL to benchmark against")
+    args = parser.parse_args()
+
+    app = use_database(args.database)
+    app.config['DEBUG_TB_ENABLED'] = False
+    # Queries queue behind the GIL under this much concurrency; don't log it.
+    app.config['SLOW_QUERY_MS'] = float('inf')
+
+    from models import db
+
+    with app.app_context():
+        seed(db)
+
+    print(f"{'clients':>8} {'mode':>5} {'req/s':>8} {'p50 ms':>8} "
+          f"{'p95 ms':>8}")
+
+    for clients in args.clients:
+        for mode, run in [('wsgi', run_wsgi), ('asgi', run_asgi)]:
+            elapsed, samples = run(app, clients, args.threads, args.delay)
+            print(f"{clients:>8} {mode:>5} {clients / elapsed:>8.1f} "
+                  f"{percentile(samples, 50):>8.0f} "
+                  f"{percentile(samples, 95):>8.0f}")
+
+
+if __name__ == '__main__':
+    main()
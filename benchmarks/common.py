@@ -0,0 +1,58 @@
+"""Helpers shared by the benchmarks."""
+
+import os
+import time
+from contextlib import contextmanager
+
+DEFAULT_DATABASE_URL = 'sqlite:////tmp/warbler-bench.db'
+
+# A bcrypt hash of "password", so benchmark users can log in.
+PASSWORD_HASH = '$2b$12$Q1PUFjhN/AWRQ21LbGYvjeLpZZB6lfZ1BPwifHALGO6oIbyC3CmJe'
+
+
+def use_database(url=None):
+    """Point the app at the benchmark database and return the app."""
+
+    from app import app
+
+    app.config['SQLALCHEMY_DATABASE_URI'] = (
+        url or os.environ.get('BENCH_DATABASE_URL', DEFAULT_DATABASE_URL))
+    app.config['SQLALCHEMY_ECHO'] = False
+    return app
+
+
+def percentile(samples, pct):
+    """Return the `pct` percentile of `samples` (nearest-rank)."""
+
+    ordered = sorted(samples)
+    if not ordered:
+        return 0.0
+    rank = max(0, min(len(ordered) - 1, round(pct / 100 * len(ordered)) - 1))
+    return ordered[rank]
+
+
+@contextmanager
+def stopwatch(samples):
+    """Append the elapsed time of the block, in ms, to `samples`."""
+
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        samples.append((time.perf_counter() - start) * 1000)
+
+
+def insert_batches(table, rows, batch_size=10000):
+    """Insert an iterable of row dicts into `table` in executemany batches."""
+
+    from models import db
+
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= batch_size:
+            db.session.execute(table.insert(), batch)
+            batch = []
+    if batch:
+        db.session.execute(table.insert(), batch)
+    db.session.commit()
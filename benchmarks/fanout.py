@@ -0,0 +1,238 @@
+"""Benchmark pushed vs pulled home timeline delivery.
+
+Measures the two costs TIMELINE_PULL_THRESHOLD trades against each other
+(see timeline.py):
+
+- posting: writing a message and its timeline entries, for authors with
+  each of --followers followers, pushed to every follower or pulled;
+- reading: a page of the home timeline of a user following each of
+  --pulled popular authors, with their messages pushed to it or pulled
+  and merged at read time.
+
+    python -m benchmarks.fanout --followers 100 1000 10000 --pulled 0 1 5 20
+
+It then suggests the threshold at which a pushed post would take
+--post-budget ms.
+"""
+
+import argparse
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+from sqlalchemy import event
+
+from benchmarks.common import (use_database, percentile, stopwatch,
+                               insert_batches, PASSWORD_HASH)
+
+VIEWER_ID = 1
+NUM_REGULAR = 50
+REGULAR_MESSAGES = 20
+POPULAR_MESSAGES = 200
+
+# Id ranges of the users playing each part.
+REGULAR_BASE = 1000
+POPULAR_BASE = 2000
+AUTHOR_BASE = 3000
+FOLLOWER_BASE = 100000
+
+# Followers counted by popular authors in the read benchmark.
+POPULAR = 10 ** 9
+
+
+def users(ids, prefix):
+    return ({'id': id, 'username': f"{prefix}{id}",
+             'email': f"{prefix}{id}@example.com", 'password': PASSWORD_HASH,
+             'image_url': "/static/images/default-pic.png",
+             'header_image_url': "/static/images/warbler-hero.jpg"}
+            for id in ids)
+
+
+def messages(author_ids, count):
+    started = datetime(2020, 1, 1)
+    return ({'text': f"warble {i} by {author_id}", 'user_id': author_id,
+             'timestamp': started + timedelta(minutes=i * 7 + author_id % 7),
+             'likes_count': 0}
+            for author_id in author_ids for i in range(count))
+
+
+def seed(db, follower_counts, max_pulled):
+    from models import User, Message, Follows
+    import counters
+    import timeline
+
+    db.drop_all()
+    db.create_all()
+
+    regular = range(REGULAR_BASE, REGULAR_BASE + NUM_REGULAR)
+    popular = range(POPULAR_BASE, POPULAR_BASE + max_pulled)
+    authors = range(AUTHOR_BASE, AUTHOR_BASE + len(follower_counts))
+    followers = range(FOLLOWER_BASE, FOLLOWER_BASE + max(follower_counts))
+
+    insert_batches(User.__table__, users([VIEWER_ID], "viewer"))
+    insert_batches(User.__table__, users(regular, "regular"))
+    insert_batches(User.__table__, users(popular, "popular"))
+    insert_batches(User.__table__, users(authors, "author"))
+    insert_batches(User.__table__, users(followers, "follower"))
+
+    insert_batches(Message.__table__, messages(regular, REGULAR_MESSAGES))
+    insert_batches(Message.__table__, messages(popular, POPULAR_MESSAGES))
+
+    insert_batches(Follows.__table__, (
+        {'user_being_followed_id': id, 'user_following_id': VIEWER_ID}
+        for id in regular))
+    insert_batches(Follows.__table__, (
+        {'user_being_followed_id': author_id, 'user_following_id': id}
+        for author_id, count in zip(authors, follower_counts)
+        for id in followers[:count]))
+
+    counters.reconcile()
+    User.query.filter(User.id.in_(popular)).update(
+        {User.followers_count: POPULAR}, synchronize_session=False)
+    timeline.rebuild()
+    db.session.commit()
+
+    return authors, popular
+
+
+@contextmanager
+def count_queries(db, counts):
+    """Append the number of statements run in the block to `counts`."""
+
+    statements = []
+
+    def before_cursor_execute(*args):
+        statements.append(args[2])
+
+    event.listen(db.engine, 'before_cursor_execute', before_cursor_execute)
+    try:
+        yield
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', before_cursor_execute)
+        counts.append(len(statements))
+
+
+def time_posts(app, db, author_id, threshold, posts):
+    """ms samples for posting as `author_id` with `threshold` in force."""
+
+    from models import Message
+    import timeline
+
+    app.config['TIMELINE_PULL_THRESHOLD'] = threshold
+    samples = []
+
+    for i in range(posts):
+        with stopwatch(samples):
+            msg = Message(text=f"post {i}", user_id=author_id)
+            db.session.add(msg)
+            db.session.flush()
+            timeline.push_message(msg)
+        db.session.rollback()
+
+    return samples
+
+
+def time_reads(app, db, threshold, reads):
+    """(ms samples, query counts) for reading the viewer's timeline."""
+
+    import timeline
+
+    app.config['TIMELINE_PULL_THRESHOLD'] = threshold
+    samples, counts = [], []
+
+    for _ in range(reads):
+        with count_queries(db, counts), stopwatch(samples):
+            list(timeline.timeline_page(VIEWER_ID))
+        db.session.rollback()
+
+    return samples, counts
+
+
+def follow_popular(db, popular, count, pushed):
+    """Have the viewer follow the first `count` of `popular`, with their
+    messages in its timeline if `pushed`."""
+
+    from models import Follows
+    import timeline
+
+    Follows.query.filter(
+        Follows.user_following_id == VIEWER_ID,
+        Follows.user_being_followed_id.in_(popular),
+    ).delete(synchronize_session=False)
+
+    for author_id in popular:
+        timeline.prune(VIEWER_ID, author_id)
+
+    for author_id in popular[:count]:
+        db.session.add(Follows(user_being_followed_id=author_id,
+                               user_following_id=VIEWER_ID))
+        if pushed:
+            timeline.backfill(VIEWER_ID, author_id)
+
+    db.session.commit()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--followers', type=int, nargs='+',
+                        default=[100, 1000, 10000])
+    parser.add_argument('--pulled', type=int, nargs='+',
+                        default=[0, 1, 5, 20])
+    parser.add_argument('--posts', type=int, default=10)
+    parser.add_argument('--reads', type=int, default=20)
+    parser.add_argument('--post-budget', type=float, default=100,
+                        help="ms a pushed post may take")
+    parser.add_argument('--database', help="database URL to benchmark against")
+    args = parser.parse_args()
+
+    app = use_database(args.database)
+    app.config['SLOW_QUERY_MS'] = float('inf')
+
+    from models import db
+
+    with app.app_context():
+        print("seeding...")
+        authors, popular = seed(db, args.followers, max(args.pulled))
+
+        print(f"\n{'followers':>10} {'pushed ms':>10} {'pulled ms':>10}")
+        per_follower = []
+
+        for author_id, count in zip(authors, args.followers):
+            pushed = percentile(
+                time_posts(app, db, author_id, count + 1, args.posts), 50)
+            pulled = percentile(
+                time_posts(app, db, author_id, count, args.posts), 50)
+            per_follower.append((pushed - pulled) / count)
+            print(f"{count:>10} {pushed:>10.1f} {pulled:>10.1f}")
+
+        print(f"\n{'pulled':>10} {'pushed ms':>10} {'pulled ms':>10} "
+              f"{'queries':>8}")
+
+        per_author = []
+
+        for count in args.pulled:
+            follow_popular(db, popular, count, pushed=True)
+            pushed, _ = time_reads(app, db, POPULAR + 1, args.reads)
+
+            follow_popular(db, popular, count, pushed=False)
+            pulled, queries = time_reads(app, db, POPULAR, args.reads)
+
+            pushed, pulled = percentile(pushed, 50), percentile(pulled, 50)
+            if count:
+                per_author.append((pulled - pushed) / count)
+            print(f"{count:>10} {pushed:>10.1f} {pulled:>10.1f} "
+                  f"{max(queries):>8}")
+
+        if per_author:
+            print(f"\nmerging costs {per_author[-1]:.1f} ms per read for each "
+                  f"pulled author followed")
+
+        # The largest audience gives the least noisy per-follower cost.
+        cost = max(per_follower[-1], 1e-6)
+        print(f"\nfan-out costs {cost * 1000:.1f} us per follower; a pushed "
+              f"post stays within {args.post_budget:g} ms up to about "
+              f"{args.post_budget / cost:,.0f} followers "
+              f"(TIMELINE_PULL_THRESHOLD)")
+
+
+if __name__ == '__main__':
+    main()
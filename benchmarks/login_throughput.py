@@ -0,0 +1,106 @@
+"""Benchmark login throughput under concurrency.
+
+Runs --clients threads that each log in --logins times, once with bcrypt
+inline on the request threads (--workers 0) and once per pool size in
+--workers. While the logins run, another thread keeps requesting a cheap
+page, to show how much a burst of logins slows everything else down:
+
+    python -m benchmarks.login_throughput --workers 0 2 4 --rounds 12
+"""
+
+import argparse
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks.common import use_database, percentile, stopwatch
+
+NUM_USERS = 50
+
+
+def log_in_repeatedly(app, username, count, samples):
+    client = app.test_client()
+    for _ in range(count):
+        with stopwatch(samples):
+            res = client.post("/login", data={"username": username,
+                                              "password": "password"})
+        assert res.status_code == 302, res.status_code
+
+
+def poll(app, stop, samples):
+    """Request a page that needs no password work until `stop` is set."""
+
+    client = app.test_client()
+    while not stop.is_set():
+        with stopwatch(samples):
+            client.get("/login")
+
+
+def run(app, clients, logins):
+    """Return (logins/s, login samples, other-page samples)."""
+
+    login_samples = []
+    page_samples = []
+    stop = threading.Event()
+
+    poller = threading.Thread(target=poll, args=(app, stop, page_samples))
+    poller.start()
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(clients) as pool:
+        for i in range(clients):
+            pool.submit(log_in_repeatedly, app, f"user{i % NUM_USERS}",
+                        logins, login_samples)
+    elapsed = time.perf_counter() - start
+
+    stop.set()
+    poller.join()
+
+    return len(login_samples) / elapsed, login_samples, page_samples
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--workers', type=int, nargs='+', default=[0, 2, 4])
+    parser.add_argument('--clients', type=int, default=16)
+    parser.add_argument('--logins', type=int, default=5)
+    parser.add_argument('--rounds', type=int, default=12)
+    parser.add_argument('--database', help="database URL to benchmark against")
+    args = parser.parse_args()
+
+    app = use_database(args.database)
+    app.config['WTF_CSRF_ENABLED'] = False
+    app.config['DEBUG_TB_ENABLED'] = False
+    app.config['RATELIMIT_ENABLED'] = False
+
+    from models import db, User
+    import passwords
+
+    hasher = passwords.get_hasher(app)
+    hasher.configure(rounds=args.rounds, workers=0)
+
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        pw_hash = hasher.hash("password")
+        db.session.add_all([User(id=i + 1, username=f"user{i}",
+                                 email=f"user{i}@example.com",
+                                 password=pw_hash)
+                            for i in range(NUM_USERS)])
+        db.session.commit()
+
+    print(f"{'workers':>8} {'logins/s':>9} {'login p50':>10} {'login p95':>10}"
+          f" {'page p50':>9} {'page p95':>9}  (ms)")
+
+    for workers in args.workers:
+        hasher.configure(workers=workers)
+        rate, logins, pages = run(app, args.clients, args.logins)
+        hasher.shutdown()
+
+        print(f"{workers:>8} {rate:>9.1f} {percentile(logins, 50):>10.1f} "
+              f"{percentile(logins, 95):>10.1f} {percentile(pages, 50):>9.1f} "
+              f"{percentile(pages, 95):>9.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,115 @@
+"""Benchmark full-text message search over a large seeded corpus.
+
+Seeds --messages synthetic warbles (a million by default), then times
+first-page searches, deep pages reached by following cursors, and the
+incremental index cost of inserting and deleting messages:
+
+    python -m benchmarks.message_search --messages 1000000
+"""
+
+import argparse
+import random
+from datetime import datetime, timedelta
+
+from benchmarks.common import (use_database, percentile, stopwatch,
+                               insert_batches, PASSWORD_HASH)
+
+# Zipf-ish vocabulary: earlier words are picked far more often.
+VOCABULARY = """
+time year people way day man thing woman life child world school state
+family student group country problem hand part place case week company
+system program question work government number night point home water
+room mother area money story fact month lot right study book eye job
+word business issue side kind head house service friend father power
+hour game line end member law car city community name president team
+minute idea kid body information back parent face others level office
+door health person art war history party result change morning reason
+research girl guy moment air teacher force education warbler pumpkin
+""".split()
+WEIGHTS = [1 / (rank + 1) for rank in range(len(VOCABULARY))]
+
+NUM_USERS = 1000
+
+
+def text(rng):
+    words = rng.choices(VOCABULARY, WEIGHTS, k=rng.randint(4, 18))
+    return ' '.join(words)[:140]
+
+
+def message_rows(count, rng):
+    start = datetime(2020, 1, 1)
+    for i in range(count):
+        yield dict(id=i + 1, text=text(rng), user_id=rng.randint(1, NUM_USERS),
+                   timestamp=start + timedelta(seconds=i * 30))
+
+
+def report(label, samples):
+    print(f"{label:<28} {percentile(samples, 50):>8.2f} "
+          f"{percentile(samples, 95):>8.2f} {max(samples):>8.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--messages', type=int, default=1000000)
+    parser.add_argument('--queries', type=int, default=100)
+    parser.add_argument('--depth', type=int, default=10,
+                        help="pages to follow for the deep-page timings")
+    parser.add_argument('--database', help="database URL to benchmark against")
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    app = use_database(args.database)
+
+    from models import db, User, Message
+    from search import search_messages, parse_search_cursor
+
+    rng = random.Random(args.seed)
+
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+
+        insert_batches(User.__table__, (
+            dict(id=i, username=f"user{i}", email=f"user{i}@example.com",
+                 password=PASSWORD_HASH)
+            for i in range(1, NUM_USERS + 1)))
+
+        load = []
+        with stopwatch(load):
+            insert_batches(Message.__table__, message_rows(args.messages, rng))
+        print(f"Seeded {args.messages} messages in {load[0] / 1000:.1f}s\n")
+
+        terms = [' '.join(rng.sample(VOCABULARY, rng.randint(1, 2)))
+                 for _ in range(args.queries)]
+
+        print(f"{'':<28} {'p50 ms':>8} {'p95 ms':>8} {'max ms':>8}")
+
+        first, deep = [], []
+        for term in terms:
+            with stopwatch(first):
+                page = search_messages(term)
+
+            for _ in range(args.depth):
+                if not page.next:
+                    break
+                cursor = parse_search_cursor(page.next['before'])
+                with stopwatch(deep):
+                    page = search_messages(term, before=cursor)
+
+        report("first page", first)
+        if deep:
+            report(f"pages 2-{args.depth + 1}", deep)
+
+        writes = []
+        for i in range(args.queries):
+            msg = Message(text=text(rng), user_id=1)
+            with stopwatch(writes):
+                db.session.add(msg)
+                db.session.commit()
+                db.session.delete(msg)
+                db.session.commit()
+        report("insert + delete (indexed)", writes)
+
+
+if __name__ == '__main__':
+    main()
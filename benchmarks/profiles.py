@@ -0,0 +1,111 @@
+"""Benchmark startup time and per-request overhead of each config profile.
+
+Builds the app with each profile in --profiles, against the same
+database, and times app creation and then --requests requests to a few
+logged-in pages. The dev profile runs in debug mode, as `flask run` does
+during development, so its numbers include query echo and the debug
+toolbar; prod has neither:
+
+    python -m benchmarks.profiles --profiles dev prod --requests 200
+
+Connection pool settings only apply to Postgres; pass a Postgres URL with
+--database to include them.
+"""
+
+import argparse
+import contextlib
+import os
+import time
+
+from benchmarks.common import (DEFAULT_DATABASE_URL, percentile, stopwatch,
+                               PASSWORD_HASH)
+
+NUM_USERS = 50
+MESSAGES_PER_USER = 20
+PAGES = ["/", "/users", "/users/1", "/users/1/following"]
+
+
+def seed(db):
+    from models import User, Message, Follows
+    import counters
+    import timeline
+
+    db.drop_all()
+    db.create_all()
+
+    db.session.add_all([User(id=i, username=f"user{i}",
+                             email=f"user{i}@example.com",
+                             password=PASSWORD_HASH)
+                        for i in range(1, NUM_USERS + 1)])
+    db.session.flush()
+    db.session.add_all([Message(text=f"warble {i}-{j}", user_id=i)
+                        for i in range(1, NUM_USERS + 1)
+                        for j in range(MESSAGES_PER_USER)])
+    db.session.add_all([Follows(user_being_followed_id=i, user_following_id=1)
+                        for i in range(2, NUM_USERS + 1)])
+    counters.reconcile()
+    timeline.rebuild()
+    db.session.commit()
+
+
+def run(profile, database, requests):
+    """Return (startup ms, per-request samples) for `profile`."""
+
+    from app import create_app, CURR_USER_KEY
+    from models import db
+
+    # Flask reads the debug flag from the environment as the app is made.
+    os.environ['FLASK_DEBUG'] = '1' if profile == 'dev' else '0'
+
+    started = time.perf_counter()
+    app = create_app(profile)
+    startup = (time.perf_counter() - started) * 1000
+
+    app.config['SQLALCHEMY_DATABASE_URI'] = database
+
+    samples = []
+
+    with app.app_context():
+        seed(db)
+
+        client = app.test_client()
+        with client.session_transaction() as sess:
+            sess[CURR_USER_KEY] = 1
+
+        for i in range(requests):
+            with stopwatch(samples):
+                res = client.get(PAGES[i % len(PAGES)])
+            assert res.status_code == 200, res.status_code
+
+        db.session.remove()
+        db.get_engine(app).dispose()
+
+    return startup, samples
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--profiles', nargs='+', default=['dev', 'prod'])
+    parser.add_argument('--requests', type=int, default=200)
+    parser.add_argument('--database', help="database URL to benchmark against")
+    args = parser.parse_args()
+
+    database = args.database or os.environ.get('BENCH_DATABASE_URL',
+                                               DEFAULT_DATABASE_URL)
+
+    print(f"{'profile':>8} {'startup ms':>11} {'mean ms':>8} {'p50 ms':>8} "
+          f"{'p95 ms':>8}")
+
+    for profile in args.profiles:
+        # Echoed queries still get formatted and written, just not shown.
+        with open(os.devnull, 'w') as devnull, \
+                contextlib.redirect_stdout(devnull):
+            startup, samples = run(profile, database, args.requests)
+
+        print(f"{profile:>8} {startup:>11.1f} "
+              f"{sum(samples) / len(samples):>8.2f} "
+              f"{percentile(samples, 50):>8.2f} {percentile(samples, 95):>8.2f}")
+
+
+if __name__ == '__main__':
+    main()
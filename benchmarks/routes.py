@@ -0,0 +1,395 @@
+"""Load-test every route in app.py.
+
+Seeds a database at the chosen --scale (individual sizes can be
+overridden), then runs each scenario below with --vus concurrent virtual
+users, each logged in as a different user and making --requests requests.
+Reports throughput, latency percentiles and queries per request:
+
+    python -m benchmarks.routes --scale small --vus 8 --requests 25
+
+Routes are driven in-process through the Flask test client, or with --url
+over HTTP against a server already running on the same --database (start
+it with PERF_HEADERS set to get query counts, and skip seeding with
+--no-seed if it is already seeded).
+
+Results can be saved as a baseline and later runs checked against it; a
+scenario whose median latency grows by more than --tolerance, or whose
+mean queries per request grows by more than half a query (writes take
+different paths depending on the random mix), fails the run with exit
+status 1. (Tail latencies are reported but not checked: with concurrent
+writers they swing too much from run to run to fail on.)
+
+    python -m benchmarks.routes --save-baseline benchmarks/baselines/routes-small.json
+    python -m benchmarks.routes --baseline benchmarks/baselines/routes-small.json
+
+Signing up, logging out and deleting an account are left out: they would
+change who the virtual users are half way through a run.
+"""
+
+import argparse
+import http.cookiejar
+import json
+import random
+import re
+import sys
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+from benchmarks.common import use_database, percentile, insert_batches
+
+SCALES = {
+    'small': dict(users=200, messages=20, follows=20, likes=20),
+    'medium': dict(users=2000, messages=50, follows=50, likes=50),
+    'large': dict(users=20000, messages=50, follows=200, likes=100),
+}
+
+WORDS = "warble pumpkin morning coffee river garden music city".split()
+
+Scenario = namedtuple('Scenario', ['name', 'method', 'request'])
+
+
+##############################################################################
+# Scenarios: each `request(vu)` returns (path, form data or None).
+
+
+def any_user(vu):
+    return vu.rng.randint(1, vu.sizes['users'])
+
+
+def any_message(vu):
+    return vu.rng.randint(1, vu.sizes['users'] * vu.sizes['messages'])
+
+
+def others_message(vu):
+    """A message by someone other than the virtual user."""
+
+    while True:
+        message_id = any_message(vu)
+        if (message_id - 1) // vu.sizes['messages'] + 1 != vu.user_id:
+            return message_id
+
+
+SCENARIOS = [
+    Scenario('homepage', 'GET', lambda vu: ("/", None)),
+    Scenario('list_users', 'GET', lambda vu: ("/users", None)),
+    Scenario('search_users', 'GET',
+             lambda vu: (f"/users?q=user{vu.rng.randint(1, 99)}", None)),
+    Scenario('users_show', 'GET',
+             lambda vu: (f"/users/{any_user(vu)}", None)),
+    Scenario('show_following', 'GET',
+             lambda vu: (f"/users/{any_user(vu)}/following", None)),
+    Scenario('users_followers', 'GET',
+             lambda vu: (f"/users/{any_user(vu)}/followers", None)),
+    Scenario('users_likes', 'GET',
+             lambda vu: (f"/users/{any_user(vu)}/likes", None)),
+    Scenario('messages_show', 'GET',
+             lambda vu: (f"/messages/{any_message(vu)}", None)),
+    Scenario('messages_search', 'GET',
+             lambda vu: (f"/messages/search?q={vu.rng.choice(WORDS)}", None)),
+    Scenario('messages_add_form', 'GET', lambda vu: ("/messages/new", None)),
+    Scenario('profile_form', 'GET', lambda vu: ("/users/profile", None)),
+    Scenario('login_form', 'GET', lambda vu: ("/login", None)),
+    Scenario('signup_form', 'GET', lambda vu: ("/signup", None)),
+    Scenario('login', 'POST',
+             lambda vu: ("/login", {'username': f"user{vu.user_id}",
+                                    'password': "password"})),
+    Scenario('add_like', 'POST',
+             lambda vu: (f"/users/add_like/{others_message(vu)}", None)),
+    Scenario('add_follow', 'POST',
+             lambda vu: (f"/users/follow/{any_user(vu)}", None)),
+    Scenario('stop_following', 'POST',
+             lambda vu: (f"/users/stop-following/{any_user(vu)}", None)),
+    Scenario('messages_add', 'POST',
+             lambda vu: ("/messages/new",
+                         {'text': f"{vu.rng.choice(WORDS)} from the benchmark"})),
+]
+
+
+##############################################################################
+# Virtual users
+
+
+class TestClientUser:
+    """A virtual user calling the app in-process."""
+
+    def __init__(self, app, user_id, sizes, rng):
+        from app import CURR_USER_KEY
+
+        self.user_id = user_id
+        self.sizes = sizes
+        self.rng = rng
+        self.client = app.test_client()
+        with self.client.session_transaction() as sess:
+            sess[CURR_USER_KEY] = user_id
+
+    def request(self, method, path, data=None):
+        """Return (status, queries or None)."""
+
+        res = self.client.open(path, method=method, data=data)
+        queries = res.headers.get('X-DB-Queries')
+        return res.status_code, int(queries) if queries else None
+
+
+class NoRedirects(urllib.request.HTTPRedirectHandler):
+    def redirect_request(self, *args, **kwargs):
+        return None
+
+
+class HTTPUser:
+    """A virtual user calling a running server, with its own cookies."""
+
+    CSRF_TOKEN = re.compile(r'name="csrf_token" type="hidden" value="([^"]+)"')
+
+    def __init__(self, base_url, user_id, sizes, rng):
+        self.base_url = base_url.rstrip('/')
+        self.user_id = user_id
+        self.sizes = sizes
+        self.rng = rng
+        self.opener = urllib.request.build_opener(
+            urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar()),
+            NoRedirects)
+
+        with self.opener.open(self.base_url + "/login") as res:
+            match = self.CSRF_TOKEN.search(res.read().decode())
+        self.csrf_token = match.group(1) if match else None
+
+        status, _ = self.request('POST', "/login", {
+            'username': f"user{user_id}", 'password': "password"})
+        if status != 302:
+            raise RuntimeError(f"user{user_id} could not log in ({status})")
+
+    def request(self, method, path, data=None):
+        """Return (status, queries or None)."""
+
+        body = None
+        if method == 'POST':
+            data = dict(data or {})
+            if self.csrf_token:
+                data['csrf_token'] = self.csrf_token
+            body = urllib.parse.urlencode(data).encode()
+
+        req = urllib.request.Request(self.base_url + path, data=body,
+                                     method=method)
+        try:
+            with self.opener.open(req) as res:
+                res.read()
+                status, headers = res.status, res.headers
+        except urllib.error.HTTPError as e:
+            status, headers = e.code, e.headers
+
+        queries = headers.get('X-DB-Queries')
+        return status, int(queries) if queries else None
+
+
+##############################################################################
+# Seeding
+
+
+def seed(db, sizes, rng):
+    from models import User, Message, Follows, Likes
+    import counters
+    import passwords
+    import timeline
+
+    num_users = sizes['users']
+    per_user = sizes['messages']
+
+    db.drop_all()
+    db.create_all()
+
+    pw_hash = passwords.get_hasher().hash("password")
+    insert_batches(User.__table__, (
+        dict(id=i, username=f"user{i}", email=f"user{i}@example.com",
+             password=pw_hash, bio=f"I am user {i}")
+        for i in range(1, num_users + 1)))
+
+    start = datetime(2020, 1, 1)
+    insert_batches(Message.__table__, (
+        dict(id=(i - 1) * per_user + j + 1,
+             text=f"{rng.choice(WORDS)} {rng.choice(WORDS)} {j}",
+             user_id=i,
+             timestamp=start + timedelta(minutes=j * num_users + i))
+        for i in range(1, num_users + 1)
+        for j in range(per_user)))
+
+    def follows():
+        for i in range(1, num_users + 1):
+            for followed in rng.sample(range(1, num_users + 1),
+                                       min(sizes['follows'], num_users)):
+                if followed != i:
+                    yield dict(user_following_id=i,
+                               user_being_followed_id=followed)
+
+    def likes():
+        total = num_users * per_user
+        for i in range(1, num_users + 1):
+            own = range((i - 1) * per_user + 1, i * per_user + 1)
+            for message_id in set(rng.sample(range(1, total + 1),
+                                             min(sizes['likes'], total))):
+                if message_id not in own:
+                    yield dict(user_id=i, message_id=message_id)
+
+    insert_batches(Follows.__table__, follows())
+    insert_batches(Likes.__table__, likes())
+
+    counters.reconcile()
+    timeline.rebuild()
+    db.session.commit()
+
+
+##############################################################################
+# Running and reporting
+
+
+def run_scenario(scenario, vus, requests):
+    """Return the results of every virtual user running `scenario`."""
+
+    def drive(vu):
+        samples = []
+        for _ in range(requests):
+            path, data = scenario.request(vu)
+            start = time.perf_counter()
+            status, queries = vu.request(scenario.method, path, data)
+            samples.append(((time.perf_counter() - start) * 1000, queries))
+            if status >= 400:
+                raise RuntimeError(f"{scenario.method} {path}: {status}")
+        return samples
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(len(vus)) as pool:
+        samples = [sample for result in pool.map(drive, vus)
+                   for sample in result]
+    elapsed = time.perf_counter() - start
+
+    latencies = [ms for ms, queries in samples]
+    counts = [queries for ms, queries in samples if queries is not None]
+
+    return {
+        'rps': round(len(samples) / elapsed, 1),
+        'p50_ms': round(percentile(latencies, 50), 2),
+        'p95_ms': round(percentile(latencies, 95), 2),
+        'p99_ms': round(percentile(latencies, 99), 2),
+        'queries': round(sum(counts) / len(counts), 2) if counts else None,
+    }
+
+
+def regressions(results, baseline, tolerance):
+    """Describe each way `results` is worse than `baseline`."""
+
+    found = []
+
+    for name, result in results.items():
+        before = baseline.get('scenarios', {}).get(name)
+        if before is None:
+            continue
+
+        if result['p50_ms'] > before['p50_ms'] * (1 + tolerance):
+            found.append(f"{name}: p50 {result['p50_ms']}ms "
+                         f"(baseline {before['p50_ms']}ms)")
+
+        if (result['queries'] is not None and before['queries'] is not None
+                and result['queries'] > before['queries'] + 0.5):
+            found.append(f"{name}: {result['queries']} queries per request "
+                         f"(baseline {before['queries']})")
+
+    return found
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--scale', choices=SCALES, default='small')
+    for size in SCALES['small']:
+        parser.add_argument(f'--{size}', type=int,
+                            help=f"override the scale's number of {size}"
+                                 + (" per user" if size != 'users' else ""))
+    parser.add_argument('--vus', type=int, default=8,
+                        help="concurrent virtual users")
+    parser.add_argument('--requests', type=int, default=25,
+                        help="requests per virtual user per scenario")
+    parser.add_argument('--only', nargs='+', metavar='SCENARIO',
+                        choices=[s.name for s in SCENARIOS])
+    parser.add_argument('--url', help="drive a running server over HTTP")
+    parser.add_argument('--no-seed', action='store_true')
+    parser.add_argument('--database', help="database URL to benchmark against")
+    parser.add_argument('--bcrypt-rounds', type=int, default=4,
+                        help="cost of the seeded password hashes")
+    parser.add_argument('--baseline', help="fail on regressions from this file")
+    parser.add_argument('--save-baseline', help="write the results here")
+    parser.add_argument('--tolerance', type=float, default=0.5,
+                        help="allowed p50 growth over the baseline (0.5 = 50%%)")
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    sizes = {size: getattr(args, size) or default
+             for size, default in SCALES[args.scale].items()}
+    if args.vus > sizes['users']:
+        parser.error("--vus can't be more than the number of users")
+
+    app = use_database(args.database)
+    app.config.update(WTF_CSRF_ENABLED=False, DEBUG_TB_ENABLED=False,
+                      RATELIMIT_ENABLED=False, PERF_HEADERS=True)
+
+    from models import db
+    import passwords
+
+    passwords.get_hasher(app).configure(rounds=args.bcrypt_rounds, workers=0)
+
+    if not args.no_seed:
+        with app.app_context():
+            seed(db, sizes, random.Random(args.seed))
+
+    def make_vu(n):
+        rng = random.Random(f"{args.seed}-{n}")
+        user_id = n * (sizes['users'] // args.vus) + 1
+        if args.url:
+            return HTTPUser(args.url, user_id, sizes, rng)
+        return TestClientUser(app, user_id, sizes, rng)
+
+    vus = [make_vu(n) for n in range(args.vus)]
+
+    print(f"{'scenario':<18} {'req/s':>7} {'p50 ms':>8} {'p95 ms':>8} "
+          f"{'p99 ms':>8} {'queries':>8}")
+
+    results = {}
+    for scenario in SCENARIOS:
+        if args.only and scenario.name not in args.only:
+            continue
+
+        result = results[scenario.name] = run_scenario(scenario, vus,
+                                                       args.requests)
+        queries = result['queries'] if result['queries'] is not None else '-'
+        print(f"{scenario.name:<18} {result['rps']:>7} {result['p50_ms']:>8} "
+              f"{result['p95_ms']:>8} {result['p99_ms']:>8} {queries:>8}")
+
+    meta = dict(sizes, vus=args.vus, requests=args.requests,
+                target=args.url or 'test client')
+
+    if args.save_baseline:
+        with open(args.save_baseline, 'w') as f:
+            json.dump({'meta': meta, 'scenarios': results}, f, indent=2)
+            f.write('\n')
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+
+        if baseline.get('meta') != meta:
+            print(f"\nWarning: baseline was recorded with {baseline.get('meta')}")
+
+        found = regressions(results, baseline, args.tolerance)
+        if found:
+            print("\nRegressions:")
+            for line in found:
+                print(f"  {line}")
+            sys.exit(1)
+
+        print("\nNo regressions.")
+
+
+if __name__ == '__main__':
+    main()
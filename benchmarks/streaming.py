@@ -0,0 +1,104 @@
+"""Benchmark buffered vs streamed rendering of the home timeline.
+
+Requests a full page of the logged-in user's timeline --requests times in
+each mode and reports time to first byte, total time and peak Python
+memory allocated while the page is produced:
+
+    python -m benchmarks.streaming --requests 50
+"""
+
+import argparse
+import time
+import tracemalloc
+
+from benchmarks.common import use_database, percentile, PASSWORD_HASH
+from pagination import MESSAGES_PER_PAGE
+
+NUM_AUTHORS = 20
+
+
+def seed(db):
+    from models import User, Message, Follows
+    import counters
+    import timeline
+
+    db.drop_all()
+    db.create_all()
+
+    db.session.add_all([User(id=i, username=f"user{i}",
+                             email=f"user{i}@example.com",
+                             password=PASSWORD_HASH)
+                        for i in range(1, NUM_AUTHORS + 2)])
+    db.session.flush()
+    db.session.add_all([Message(text=f"warble {i}-{j} " + "x" * 100,
+                                user_id=i)
+                        for i in range(2, NUM_AUTHORS + 2)
+                        for j in range(MESSAGES_PER_PAGE)])
+    db.session.add_all([Follows(user_being_followed_id=i, user_following_id=1)
+                        for i in range(2, NUM_AUTHORS + 2)])
+    db.session.flush()
+    counters.reconcile()
+    timeline.rebuild()
+    db.session.commit()
+
+
+def run(client, requests):
+    """Return (first byte samples, total samples, peak KiB samples)."""
+
+    first_byte, total, peak = [], [], []
+
+    for _ in range(requests):
+        tracemalloc.start()
+        start = time.perf_counter()
+
+        res = client.get("/", buffered=False)
+        chunks = iter(res.response)
+        next(chunks)
+        first_byte.append((time.perf_counter() - start) * 1000)
+        for _ in chunks:
+            pass
+        res.close()
+        total.append((time.perf_counter() - start) * 1000)
+
+        peak.append(tracemalloc.get_traced_memory()[1] / 1024)
+        tracemalloc.stop()
+
+    return first_byte, total, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--requests', type=int, default=50)
+    parser.add_argument('--database', help="database URL to benchmark against")
+    args = parser.parse_args()
+
+    app = use_database(args.database)
+    app.config['DEBUG_TB_ENABLED'] = False
+
+    from app import CURR_USER_KEY
+    from models import db
+
+    with app.app_context():
+        seed(db)
+
+    client = app.test_client()
+    with client.session_transaction() as sess:
+        sess[CURR_USER_KEY] = 1
+
+    print(f"{'mode':>9} {'TTFB p50':>9} {'TTFB p95':>9} {'total p50':>10} "
+          f"{'total p95':>10} {'peak KiB':>9}")
+
+    for mode in ['buffered', 'streamed']:
+        app.config['STREAM_TEMPLATES'] = mode == 'streamed'
+        run(client, 3)  # warm up the caches
+
+        first_byte, total, peak = run(client, args.requests)
+
+        print(f"{mode:>9} {percentile(first_byte, 50):>9.1f} "
+              f"{percentile(first_byte, 95):>9.1f} "
+              f"{percentile(total, 50):>10.1f} {percentile(total, 95):>10.1f} "
+              f"{percentile(peak, 50):>9.0f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,89 @@
+"""Benchmark username search latency as the users table grows.
+
+Grows the users table through each size in --sizes and times a fixed mix
+of substring and short-prefix searches at every step. With the search
+indexes in place, latency should stay roughly flat from the smallest size
+to the largest:
+
+    python -m benchmarks.user_search --sizes 10000 100000 1000000
+"""
+
+import argparse
+import random
+import string
+
+from benchmarks.common import (use_database, percentile, stopwatch,
+                               insert_batches, PASSWORD_HASH)
+
+SYLLABLES = ['ka', 'lo', 'mi', 'ren', 'tor', 'via', 'zen', 'qu', 'sha',
+             'bel', 'dor', 'fin', 'gal', 'hux', 'jo', 'nym', 'pe', 'sto']
+
+
+def username(i, rng):
+    """Make a plausible, unique username."""
+
+    parts = rng.choices(SYLLABLES, k=rng.randint(2, 4))
+    return ''.join(parts) + str(i)
+
+
+def user_rows(start, stop, rng):
+    for i in range(start, stop):
+        name = username(i, rng)
+        yield dict(id=i + 1, username=name, email=f"{name}@example.com",
+                   password=PASSWORD_HASH)
+
+
+def search_terms(count, rng):
+    """A mix of substring terms and one- or two-letter prefixes."""
+
+    terms = []
+    for _ in range(count):
+        if rng.random() < 0.8:
+            syllables = rng.choices(SYLLABLES, k=2)
+            terms.append(''.join(syllables)[:rng.randint(3, 6)])
+        else:
+            terms.append(''.join(rng.choices(string.ascii_lowercase,
+                                             k=rng.randint(1, 2))))
+    return terms
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+',
+                        default=[10000, 100000, 1000000])
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('--database', help="database URL to benchmark against")
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    app = use_database(args.database)
+
+    from models import db, User
+    from search import search_users
+
+    rng = random.Random(args.seed)
+    terms = search_terms(args.queries, rng)
+
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+
+        print(f"{'users':>10} {'p50 ms':>8} {'p95 ms':>8} {'max ms':>8}")
+
+        loaded = 0
+        for size in sorted(args.sizes):
+            insert_batches(User.__table__, user_rows(loaded, size, rng))
+            loaded = size
+
+            samples = []
+            for term in terms:
+                with stopwatch(samples):
+                    search_users(term)
+            db.session.rollback()
+
+            print(f"{size:>10} {percentile(samples, 50):>8.2f} "
+                  f"{percentile(samples, 95):>8.2f} {max(samples):>8.2f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,140 @@
+"""Caching for Warbler.
+
+`LRUCache` is a small thread-safe LRU with an optional per-entry TTL. It
+is the in-process backend for the user cache below; any object with the
+same get/set/delete/clear methods (e.g. a wrapper around a shared store)
+can be plugged in instead via `init_user_cache(app, backend)`.
+
+The user cache keeps a snapshot of each user's row, keyed by id, so
+identifying the logged-in user on each request costs no database
+round-trip. Snapshots are plain dicts of column values (never the password
+hash), so they can live in an out-of-process store. Routes that change a
+user's row call `invalidate_user()`; counter changes that fan in from
+other users' actions (e.g. a deleted message losing its likes) are picked
+up when the entry's TTL runs out.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+
+from flask import current_app
+from sqlalchemy import event
+from sqlalchemy.orm import make_transient_to_detached
+
+from models import db, User
+
+USER_CACHE_SIZE = 10000
+USER_CACHE_TTL = 60
+
+# Columns that are never copied into the cache.
+PRIVATE_COLUMNS = {'password'}
+
+
+class LRUCache:
+    """A thread-safe least-recently-used cache with optional TTL."""
+
+    def __init__(self, maxsize=1024, ttl=None, clock=time.monotonic):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.clock = clock
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key, default=None):
+        """Return the value for `key`, or `default` if absent or expired."""
+
+        with self._lock:
+            try:
+                value, expires = self._entries[key]
+            except KeyError:
+                return default
+
+            if expires is not None and expires <= self.clock():
+                del self._entries[key]
+                return default
+
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        """Store `value` under `key`, evicting the oldest entry if full."""
+
+        expires = self.clock() + self.ttl if self.ttl is not None else None
+
+        with self._lock:
+            self._entries[key] = (value, expires)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def delete(self, key):
+        """Drop `key` if present."""
+
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        """Drop every entry."""
+
+        with self._lock:
+            self._entries.clear()
+
+
+def init_user_cache(app, backend=None):
+    """Install the user cache on `app` (in-process LRU by default)."""
+
+    if backend is None:
+        backend = LRUCache(maxsize=USER_CACHE_SIZE, ttl=USER_CACHE_TTL)
+
+    app.extensions['user_cache'] = backend
+    return backend
+
+
+def user_cache():
+    return current_app.extensions['user_cache']
+
+
+@event.listens_for(db.metadata, 'after_create')
+def clear_user_cache(*args, **kwargs):
+    """Rows cached from a schema that has just been (re)created are gone."""
+
+    db.get_app().extensions['user_cache'].clear()
+
+
+def snapshot(user):
+    """Copy the cacheable column values of `user` into a dict."""
+
+    return {column.key: getattr(user, column.key)
+            for column in User.__table__.columns
+            if column.key not in PRIVATE_COLUMNS}
+
+
+def get_user(user_id):
+    """Return the User with `user_id`, from the cache when possible.
+
+    A cached user is attached to the current session without a query;
+    columns left out of the snapshot load on first access.
+    """
+
+    cached = user_cache().get(user_id)
+
+    if cached is None:
+        user = User.query.get(user_id)
+        if user is not None:
+            user_cache().set(user_id, snapshot(user))
+        return user
+
+    user = User(**cached)
+    make_transient_to_detached(user)
+    return db.session.merge(user, load=False)
+
+
+def invalidate_user(*user_ids):
+    """Forget the cached rows of `user_ids`."""
+
+    for user_id in user_ids:
+        user_cache().delete(user_id)
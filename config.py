@@ -0,0 +1,124 @@
+"""Configuration profiles for Warbler.
+
+`create_app()` in app.py loads one of these by name, taken from its
+argument or the WARBLER_ENV environment variable:
+
+- dev (default): logs every query, installs the debug toolbar (shown
+  when Flask runs in debug mode), serves /__perf and runs jobs inline.
+- test: quiet, CSRF off, cheap password hashing and jobs done inline.
+- prod: no query echo, no toolbar, and a tuned connection pool.
+
+Values that differ between deployments (database and replica URLs,
+secret key) come from the environment.
+"""
+
+import os
+
+
+class Config:
+    SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL',
+                                             'postgres:///warbler')
+    SQLALCHEMY_TRACK_MODIFICATIONS = False
+    SQLALCHEMY_ECHO = False
+
+    # An optional read replica for the read-only views (see replicas.py),
+    # and how many seconds a user's reads stay on the primary after they
+    # write, so they see their own changes despite replication lag.
+    DATABASE_REPLICA_URL = os.environ.get('DATABASE_REPLICA_URL')
+    SQLALCHEMY_BINDS = ({'replica': DATABASE_REPLICA_URL}
+                        if DATABASE_REPLICA_URL else None)
+    REPLICA_STICKY_SECONDS = 10
+
+    # Extra create_engine() arguments (see models.WarblerSQLAlchemy);
+    # ignored for SQLite, whose pooling works differently.
+    DATABASE_POOL_OPTIONS = {}
+
+    SECRET_KEY = os.environ.get('SECRET_KEY', "it's a secret")
+    BCRYPT_LOG_ROUNDS = int(os.environ.get('BCRYPT_LOG_ROUNDS', 12))
+
+    DEBUG_TOOLBAR = False
+    DEBUG_TB_INTERCEPT_REDIRECTS = False
+
+    # Authors with at least this many followers have their messages merged
+    # into followers' home timelines as they are read, rather than copied
+    # into each one when posted (see timeline.py).
+    TIMELINE_PULL_THRESHOLD = 10000
+
+    # Stream the home timeline and profile pages to the client as they
+    # render (see streaming.py), at the cost of their ETags.
+    STREAM_TEMPLATES = False
+
+    # Statements slower than this many ms are logged (see
+    # instrumentation.py); /__perf reports latency by route when enabled,
+    # and responses carry X-DB-* headers in debug mode or with PERF_HEADERS.
+    SLOW_QUERY_MS = 100
+    PERF_ENDPOINT = False
+    PERF_HEADERS = False
+
+    # Timeline fan-out, backfill and prune run as background jobs (see
+    # jobs.py): at once within the request with JOBS_INLINE, otherwise by
+    # `flask jobs work`. A failing job is retried after JOB_RETRY_DELAY
+    # seconds, doubling each time, up to JOB_MAX_ATTEMPTS attempts; idle
+    # workers check for jobs every JOB_POLL_INTERVAL seconds.
+    JOBS_INLINE = False
+    JOB_MAX_ATTEMPTS = 5
+    JOB_RETRY_DELAY = 10
+    JOB_POLL_INTERVAL = 1
+
+    # Threads running views when served over ASGI (see asgi.py): one pool
+    # for the read-heavy pages and one for everything else.
+    ASGI_READ_THREADS = 10
+    ASGI_THREADS = 10
+
+
+class DevelopmentConfig(Config):
+    SQLALCHEMY_ECHO = True
+    DEBUG_TOOLBAR = True
+    PERF_ENDPOINT = True
+    JOBS_INLINE = True
+
+
+class TestingConfig(Config):
+    TESTING = True
+    SQLALCHEMY_DATABASE_URI = os.environ.get('TEST_DATABASE_URL',
+                                             'postgresql:///warbler-test')
+    SQLALCHEMY_BINDS = None
+    WTF_CSRF_ENABLED = False
+    BCRYPT_LOG_ROUNDS = 4
+    PASSWORD_WORKERS = 0
+    JOBS_INLINE = True
+
+
+class ProductionConfig(Config):
+    DATABASE_POOL_OPTIONS = {
+        # Connections kept open, plus how many more may be opened in a
+        # burst; size these to the number of threads per process.
+        'pool_size': int(os.environ.get('DATABASE_POOL_SIZE', 10)),
+        'max_overflow': int(os.environ.get('DATABASE_MAX_OVERFLOW', 10)),
+        # Seconds to wait for a free connection before failing.
+        'pool_timeout': 10,
+        # Replace connections before the server or a proxy drops them.
+        'pool_recycle': 1800,
+        # Check each connection as it is checked out, so a database
+        # restart costs one retry rather than a failed request.
+        'pool_pre_ping': True,
+    }
+
+
+PROFILES = {
+    'dev': DevelopmentConfig,
+    'test': TestingConfig,
+    'prod': ProductionConfig,
+}
+
+
+def get_profile(name=None):
+    """The config class for `name`, or for $WARBLER_ENV (default "dev")."""
+
+    name = name or os.environ.get('WARBLER_ENV', 'dev')
+
+    try:
+        return PROFILES[name]
+    except KeyError:
+        raise ValueError(f"Unknown config profile {name!r}; "
+                         f"expected one of {', '.join(PROFILES)}")
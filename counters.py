@@ -0,0 +1,134 @@
+"""Denormalized relationship counters for Warbler.
+
+`users` carries messages/followers/following/likes counts and `messages`
+carries a likes count. The write routes adjust them in the same
+transaction as the change they count; `reconcile()` recomputes every
+counter from scratch for after bulk loads or to repair drift.
+
+Those adjustments deliberately stay in the request rather than going to
+a background job: each is an UPDATE of one or two rows by primary key,
+and the page the route redirects to shows the new count. The exception
+is deleting a user, whose follows and likes were counted on any number
+of other rows: the request only lists those rows, and a job recounts
+them (see jobs.py).
+"""
+
+import click
+from flask.cli import with_appcontext
+
+from models import db, User, Message, Follows, Likes
+import jobs
+
+
+def adjust(model, id, **deltas):
+    """Add `deltas` (column name -> amount) to the counters of one row."""
+
+    model.query.filter(model.id == id).update(
+        {getattr(model, name): getattr(model, name) + delta
+         for name, delta in deltas.items()},
+        synchronize_session=False,
+    )
+
+
+def message_deleted(message):
+    """Adjust counters for a message that is about to be deleted."""
+
+    adjust(User, message.user_id, messages_count=-1)
+
+    likers = db.select([Likes.user_id]).where(Likes.message_id == message.id)
+    User.query.filter(User.id.in_(likers)).update(
+        {User.likes_count: User.likes_count - 1},
+        synchronize_session=False,
+    )
+
+
+def user_deleted(user_id):
+    """Rows whose counters count a user who is about to be deleted.
+
+    Returns a dict of the ids of the other users and messages that count
+    the user's follows and likes, for `recount_later()` once the deletion
+    is flushed (the database deletes those follows and likes with it).
+    """
+
+    received = Likes.__table__.join(Message.__table__,
+                                    Message.id == Likes.message_id)
+
+    users = db.union(
+        db.select([Follows.user_being_followed_id])
+        .where(Follows.user_following_id == user_id),
+        db.select([Follows.user_following_id])
+        .where(Follows.user_being_followed_id == user_id),
+        db.select([Likes.user_id])
+        .select_from(received)
+        .where(Message.user_id == user_id),
+    )
+    messages = db.select([Likes.message_id]).where(Likes.user_id == user_id)
+
+    return {
+        'user_ids': [id for (id,) in db.session.execute(users)
+                     if id != user_id],
+        'message_ids': [id for (id,) in db.session.execute(messages)],
+    }
+
+
+def recount_later(user_ids, message_ids):
+    """Queue a recount of the counters of some users and messages."""
+
+    if user_ids or message_ids:
+        jobs.enqueue('counters.recount', user_ids=user_ids,
+                     message_ids=message_ids)
+
+
+@jobs.task('counters.recount')
+def recount(user_ids, message_ids):
+    """Recompute the counters of some users and messages."""
+
+    reconcile(user_ids=user_ids, message_ids=message_ids)
+
+
+def reconcile(user_ids=None, message_ids=None):
+    """Recompute counters from the underlying tables.
+
+    By default every row's; otherwise only those of `user_ids` and
+    `message_ids`.
+    """
+
+    def count(column, *criteria):
+        return (db.select([db.func.count(column)])
+                .where(db.and_(*criteria))
+                .as_scalar())
+
+    users = User.__table__
+    messages = Message.__table__
+
+    def only(table, ids):
+        """An UPDATE of `table`'s rows with `ids`, or of all if None."""
+        update = table.update()
+        return update if ids is None else update.where(table.c.id.in_(ids))
+
+    if user_ids is None or user_ids:
+        db.session.execute(only(users, user_ids).values(
+            messages_count=count(Message.id, Message.user_id == users.c.id),
+            followers_count=count(
+                Follows.user_following_id,
+                Follows.user_being_followed_id == users.c.id),
+            following_count=count(
+                Follows.user_being_followed_id,
+                Follows.user_following_id == users.c.id),
+            likes_count=count(Likes.id, Likes.user_id == users.c.id),
+        ))
+
+    if message_ids is None or message_ids:
+        db.session.execute(only(messages, message_ids).values(
+            likes_count=count(Likes.id, Likes.message_id == messages.c.id),
+        ))
+
+
+@click.command('reconcile-counters')
+@with_appcontext
+def reconcile_command():
+    """Recompute all denormalized counters."""
+
+    reconcile()
+    db.session.commit()
+    click.echo("Counters reconciled.")
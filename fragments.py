@@ -0,0 +1,114 @@
+"""Rendered-fragment cache for Warbler.
+
+Message cards (messages/_card.html) and user cards (users/_card.html)
+appear on most pages, many times over. Templates render them with the
+`message_card()` and `user_card()` globals, which keep the rendered markup
+in an LRU cache (cache.LRUCache, or any backend with the same methods via
+`init_fragment_cache(app, backend)`), so a page full of cards is mostly
+lookups and string joins.
+
+Entries are keyed by (kind, id) and hold the version of the row they were
+rendered from along with one rendering per combination of viewer flags
+(e.g. whether the viewer liked the message). A card whose row has changed
+since is rendered afresh; the write routes also drop the cards of rows
+they change or delete with `invalidate_user()` / `invalidate_message()`.
+
+Card templates are rendered without the request context, so they may only
+use what they are passed.
+"""
+
+from flask import Markup, current_app
+from sqlalchemy import event
+
+from models import db
+from cache import LRUCache
+
+FRAGMENT_CACHE_SIZE = 10000
+
+
+def init_fragment_cache(app, backend=None):
+    """Install the fragment cache on `app` (in-process LRU by default)."""
+
+    if backend is None:
+        backend = LRUCache(maxsize=FRAGMENT_CACHE_SIZE)
+
+    app.extensions['fragment_cache'] = backend
+
+    app.add_template_global(message_card)
+    app.add_template_global(user_card)
+
+    return backend
+
+
+def fragment_cache():
+    return current_app.extensions['fragment_cache']
+
+
+@event.listens_for(db.metadata, 'after_create')
+def clear_fragment_cache(*args, **kwargs):
+    """Cards cached from a schema that has just been (re)created are gone."""
+
+    db.get_app().extensions['fragment_cache'].clear()
+
+
+def cached_fragment(template, kind, id, version, flags, **context):
+    """Markup of `template` rendered with `context`, cached under `kind`/`id`.
+
+    `version` identifies the row data the fragment shows and `flags` the
+    per-viewer variations; both must be hashable.
+    """
+
+    key = (kind, id)
+    version = (current_app.extensions.get('template_version'), version)
+
+    entry = fragment_cache().get(key)
+    if entry is not None and entry[0] == version:
+        variants = entry[1]
+        html = variants.get(flags)
+        if html is not None:
+            return Markup(html)
+    else:
+        variants = {}
+
+    html = current_app.jinja_env.get_template(template).render(**context)
+
+    # Stored as a new dict, so concurrent readers never see one changing.
+    fragment_cache().set(key, (version, {**variants, flags: html}))
+
+    return Markup(html)
+
+
+def message_card(msg, liked=None):
+    """A message's list item; `liked` None leaves out the like button."""
+
+    author = msg.user
+    return cached_fragment(
+        'messages/_card.html', 'message', msg.id,
+        (msg.text, msg.timestamp, author.id, author.username,
+         author.image_url),
+        liked,
+        msg=msg, author=author, liked=liked)
+
+
+def user_card(user, following=None):
+    """A user's card; `following` None leaves out the follow button."""
+
+    return cached_fragment(
+        'users/_card.html', 'user', user.id,
+        (user.username, user.image_url, user.header_image_url, user.bio),
+        following,
+        user=user, following=following)
+
+
+def invalidate_user(*user_ids):
+    """Drop the cards of `user_ids`."""
+
+    for user_id in user_ids:
+        fragment_cache().delete(('user', user_id))
+
+
+def invalidate_message(*message_ids):
+    """Drop the cards of `message_ids`."""
+
+    for message_id in message_ids:
+        fragment_cache().delete(('message', message_id))
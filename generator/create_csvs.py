@@ -2,15 +2,32 @@
 
 Students won't need to run this for the exercise; they will just use the CSV
 files that this generates. You should only need to run this if you wanted to
-tweak the CSV formats or generate fewer/more rows.
+tweak the CSV formats or generate fewer/more rows. Run it from the
+repository root:
+
+    python -m generator.create_csvs
+    python -m generator.create_csvs --users 1000000 --messages 10000000 \\
+        --follows 100000000 --seed-db
+
+Everything is generated offline and streamed, so memory use doesn't grow
+with the number of rows. With --seed-db the rows go straight into the
+database through the seeder (see seed.py) instead of into CSV files.
+
+The follow graph is celebrity-skewed: each user follows a random number
+of accounts, picked with Zipf weights so a few accounts gather most of
+the followers, as on real social networks. Prolific users post more, and
+timestamps get denser toward the present.
 """
 
+import argparse
 import csv
-from random import choice, randint, sample
-from itertools import permutations
-import requests
+import random
+from bisect import bisect_right
+from itertools import accumulate
+
 from faker import Faker
-from helpers import get_random_datetime
+
+from generator.helpers import get_random_datetimes
 
 MAX_WARBLER_LENGTH = 140
 
@@ -22,9 +39,18 @@ NUM_USERS = 300
 NUM_MESSAGES = 1000
 NUM_FOLLWERS = 5000
 
-fake = Faker()
+# Exponent of the Zipf weights for who gets followed and who posts.
+ZIPF_EXPONENT = 1.0
 
-# Generate random profile image URLs to use for users
+# Faker is slow, so text is assembled from a pool of pre-generated pieces.
+POOL_SIZE = 2000
+
+BATCH_SIZE = 10000
+
+# Hashed version of "password"
+PASSWORD_HASH = '$2b$12$Q1PUFjhN/AWRQ21LbGYvjeLpZZB6lfZ1BPwifHALGO6oIbyC3CmJe'
+
+# Random profile image URLs to use for users
 
 image_urls = [
     f"https://randomuser.me/api/portraits/{kind}/{i}.jpg"
@@ -32,46 +58,140 @@ image_urls = [
     for i in range(count)
 ]
 
-# Generate random header image URLs to use for users
+# Header images that ship with the app, so generation needs no network
 
 header_image_urls = [
-    requests.get(f"http://www.splashbase.co/api/v1/images/{i}").json()['url']
-    for i in range(1, 46)
+    "/static/images/warbler-hero.jpg",
+    "/static/images/signed-out-home.jpg",
 ]
 
-with open('generator/users.csv', 'w') as users_csv:
-    users_writer = csv.DictWriter(users_csv, fieldnames=USERS_CSV_HEADERS)
-    users_writer.writeheader()
-
-    for i in range(NUM_USERS):
-        users_writer.writerow(dict(
-            email=fake.email(),
-            username=fake.user_name(),
-            image_url=choice(image_urls),
-            password='$2b$12$Q1PUFjhN/AWRQ21LbGYvjeLpZZB6lfZ1BPwifHALGO6oIbyC3CmJe',
-            bio=fake.sentence(),
-            header_image_url=choice(header_image_urls),
-            location=fake.city()
-        ))
-
-with open('generator/messages.csv', 'w') as messages_csv:
-    messages_writer = csv.DictWriter(messages_csv, fieldnames=MESSAGES_CSV_HEADERS)
-    messages_writer.writeheader()
-
-    for i in range(NUM_MESSAGES):
-        messages_writer.writerow(dict(
-            text=fake.paragraph()[:MAX_WARBLER_LENGTH],
-            timestamp=get_random_datetime(),
-            user_id=randint(1, NUM_USERS)
-        ))
-
-# Generate follows.csv from random pairings of users
-
-with open('generator/follows.csv', 'w') as follows_csv:
-    all_pairs = list(permutations(range(1, NUM_USERS + 1), 2))
-
-    users_writer = csv.DictWriter(follows_csv, fieldnames=FOLLOWS_CSV_HEADERS)
-    users_writer.writeheader()
-
-    for followed_user, follower in sample(all_pairs, NUM_FOLLWERS):
-        users_writer.writerow(dict(user_being_followed_id=followed_user, user_following_id=follower))
+
+class Pools:
+    """Pre-generated fake values to draw from."""
+
+    def __init__(self, rng, size=POOL_SIZE):
+        fake = Faker()
+        fake.seed_instance(rng.random())
+
+        self.user_names = [fake.user_name() for _ in range(size)]
+        self.domains = [fake.free_email_domain() for _ in range(size // 10 or 1)]
+        self.sentences = [fake.sentence() for _ in range(size)]
+        self.cities = [fake.city() for _ in range(size)]
+
+
+def zipf_cum_weights(n, exponent=ZIPF_EXPONENT):
+    """Cumulative Zipf weights for ranks 1..n."""
+
+    return list(accumulate(1 / rank ** exponent for rank in range(1, n + 1)))
+
+
+def generate_users(num_users, pools, rng):
+    """Yield `num_users` user rows with ids 1..num_users."""
+
+    for user_id in range(1, num_users + 1):
+        username = f"{rng.choice(pools.user_names)}_{user_id}"
+        yield dict(
+            id=user_id,
+            email=f"{username}@{rng.choice(pools.domains)}",
+            username=username,
+            image_url=rng.choice(image_urls),
+            password=PASSWORD_HASH,
+            bio=rng.choice(pools.sentences),
+            header_image_url=rng.choice(header_image_urls),
+            location=rng.choice(pools.cities),
+        )
+
+
+def generate_messages(num_messages, num_users, pools, rng):
+    """Yield `num_messages` message rows; prolific users post more."""
+
+    cum_weights = zipf_cum_weights(num_users)
+    # Shuffle which users are prolific so it's unrelated to who is followed.
+    authors = list(range(1, num_users + 1))
+    rng.shuffle(authors)
+
+    remaining = num_messages
+    while remaining:
+        batch = min(remaining, BATCH_SIZE)
+        timestamps = get_random_datetimes(batch, rng=rng)
+        posters = rng.choices(authors, cum_weights=cum_weights, k=batch)
+
+        for timestamp, user_id in zip(timestamps, posters):
+            text = ' '.join(rng.choices(pools.sentences, k=rng.randint(1, 3)))
+            yield dict(
+                text=text[:MAX_WARBLER_LENGTH],
+                timestamp=timestamp,
+                user_id=user_id,
+            )
+
+        remaining -= batch
+
+
+def generate_follows(num_follows, num_users, rng):
+    """Yield about `num_follows` distinct follow rows.
+
+    Each user follows a geometrically-distributed number of accounts
+    (averaging num_follows / num_users), chosen with Zipf weights by
+    rejection sampling. Only one user's picks are held at a time.
+    """
+
+    if num_users < 2:
+        return
+
+    cum_weights = zipf_cum_weights(num_users)
+    total = cum_weights[-1]
+    mean = num_follows / num_users
+    max_following = num_users // 2
+
+    for follower in range(1, num_users + 1):
+        count = min(max_following, round(rng.expovariate(1 / mean))) if mean else 0
+
+        followed = set()
+        while len(followed) < count:
+            user_id = bisect_right(cum_weights, rng.random() * total) + 1
+            if user_id != follower:
+                followed.add(user_id)
+
+        for user_id in followed:
+            yield dict(user_being_followed_id=user_id, user_following_id=follower)
+
+
+def write_csv(path, headers, rows):
+    with open(path, 'w') as f:
+        writer = csv.DictWriter(f, fieldnames=headers, extrasaction='ignore')
+        writer.writeheader()
+        writer.writerows(rows)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate random Warbler data.")
+    parser.add_argument('--users', type=int, default=NUM_USERS)
+    parser.add_argument('--messages', type=int, default=NUM_MESSAGES)
+    parser.add_argument('--follows', type=int, default=NUM_FOLLWERS)
+    parser.add_argument('--random-seed', type=int)
+    parser.add_argument('--seed-db', action='store_true',
+                        help="load straight into the database instead of CSVs")
+    args = parser.parse_args()
+
+    rng = random.Random(args.random_seed)
+    pools = Pools(rng)
+
+    users = generate_users(args.users, pools, rng)
+    messages = generate_messages(args.messages, args.users, pools, rng)
+    follows = generate_follows(args.follows, args.users, rng)
+
+    if args.seed_db:
+        from app import app
+        import seed
+
+        with app.app_context():
+            seed.seed(users, messages, follows)
+        return
+
+    write_csv('generator/users.csv', USERS_CSV_HEADERS, users)
+    write_csv('generator/messages.csv', MESSAGES_CSV_HEADERS, messages)
+    write_csv('generator/follows.csv', FOLLOWS_CSV_HEADERS, follows)
+
+
+if __name__ == '__main__':
+    main()
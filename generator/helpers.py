@@ -1,7 +1,7 @@
 """Support functions for CSV generation."""
 
 from datetime import datetime
-from random import uniform
+from random import uniform, triangular
 
 
 def get_random_datetime(year_gap=2):
@@ -12,3 +12,20 @@ def get_random_datetime(year_gap=2):
     random_timestamp = uniform(then.timestamp(), now.timestamp())
 
     return datetime.fromtimestamp(random_timestamp)
+
+
+def get_random_datetimes(count, year_gap=2, rng=None):
+    """Get `count` random datetimes within the last few years.
+
+    Activity grows over time (a triangular distribution peaking at now), so
+    recent months hold more messages than older ones, as on a real site.
+    """
+
+    draw = rng.triangular if rng else triangular
+
+    now = datetime.now()
+    then = now.replace(year=now.year - year_gap)
+    start, end = then.timestamp(), now.timestamp()
+
+    return [datetime.fromtimestamp(draw(start, end, end))
+            for _ in range(count)]
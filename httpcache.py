@@ -0,0 +1,177 @@
+"""HTTP caching policy for Warbler.
+
+Every response gets a Cache-Control header from `apply_policy()`:
+
+- Static files linked through `static_url()` carry a fingerprint of their
+  contents in the query string (`?v=...`), so the URL changes whenever
+  the file does and browsers may keep them for a year without asking.
+  Static files requested without a current fingerprint (e.g. the default
+  avatar URLs stored on users) must be revalidated, which Flask answers
+  from the file's ETag/Last-Modified.
+- Pages whose view called `not_modified()` get a weak ETag and must be
+  revalidated on every use. They are private: the tag covers what the
+  logged-in viewer sees.
+- Everything else is never stored.
+
+A view calls `not_modified(*parts)` with the row versions its page is
+built from, once they are loaded but before rendering; if the client's
+If-None-Match already has that tag, the view returns the 304 it gets
+back and skips the template entirely. The tag also covers the templates
+themselves, so a deploy with changed markup invalidates it.
+"""
+
+import hashlib
+import os
+
+from flask import current_app, g, request, session, url_for
+from werkzeug.wrappers import Response
+
+from models import User
+import cache
+
+STATIC_MAX_AGE = 365 * 24 * 60 * 60
+
+_fingerprints = {}
+
+
+def _digest(*parts):
+    return hashlib.sha1(repr(parts).encode()).hexdigest()[:16]
+
+
+def _file_digest(path):
+    digest = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(65536), b''):
+            digest.update(chunk)
+    return digest.hexdigest()[:12]
+
+
+##############################################################################
+# Static files
+
+
+def fingerprint(filename):
+    """Short hash of the contents of static file `filename`.
+
+    Remembered until the file's size or modification time changes.
+    """
+
+    path = os.path.join(current_app.static_folder, filename)
+    stat = os.stat(path)
+    key = (path, stat.st_mtime_ns, stat.st_size)
+
+    try:
+        return _fingerprints[key]
+    except KeyError:
+        value = _fingerprints[key] = _file_digest(path)
+        return value
+
+
+def static_url(filename):
+    """URL for static file `filename` that changes when its contents do."""
+
+    return url_for('static', filename=filename, v=fingerprint(filename))
+
+
+def is_fingerprinted():
+    """Is this a static request for the current version of the file?"""
+
+    filename = (request.view_args or {}).get('filename')
+    version = request.args.get('v')
+
+    if not filename or not version:
+        return False
+
+    try:
+        return version == fingerprint(filename)
+    except OSError:
+        return False
+
+
+##############################################################################
+# Conditional GETs
+
+
+def row_version(obj):
+    """The column values of a row that a page might show."""
+
+    if isinstance(obj, User):
+        values = cache.snapshot(obj)
+    else:
+        values = {column.key: getattr(obj, column.key)
+                  for column in obj.__table__.columns}
+
+    return tuple(sorted(values.items()))
+
+
+def viewer_version():
+    """What pages show of the logged-in user (the nav bar), if any."""
+
+    return row_version(g.user) if g.user else None
+
+
+def not_modified(*parts):
+    """Tag this response with a weak ETag made from `parts`.
+
+    Returns a 304 response if the client's copy has that tag, else None.
+    Nothing is tagged while flashed messages are waiting to be shown,
+    since they are rendered into the page once.
+    """
+
+    if '_flashes' in session:
+        return None
+
+    etag = _digest(current_app.extensions['template_version'],
+                   request.endpoint, viewer_version(), *parts)
+    g.etag = etag
+
+    if request.if_none_match.contains_weak(etag):
+        return Response(status=304)
+
+    return None
+
+
+##############################################################################
+# Policy
+
+
+def apply_policy(response):
+    """Set the caching headers for `response`."""
+
+    if request.endpoint == 'static':
+        if response.status_code == 200 and is_fingerprinted():
+            response.headers['Cache-Control'] = (
+                f'public, max-age={STATIC_MAX_AGE}, immutable')
+        else:
+            response.headers['Cache-Control'] = 'public, no-cache'
+
+    elif 'etag' in g and response.status_code in (200, 304):
+        response.set_etag(g.etag, weak=True)
+        response.headers['Cache-Control'] = 'private, no-cache'
+
+    else:
+        response.headers['Cache-Control'] = 'no-store'
+
+    return response
+
+
+def template_version(app):
+    """Hash of every template's source, so ETags change with the markup."""
+
+    digest = hashlib.sha1()
+    folder = os.path.join(app.root_path, app.template_folder)
+
+    for root, dirs, files in sorted(os.walk(folder)):
+        for name in sorted(files):
+            digest.update(name.encode())
+            digest.update(_file_digest(os.path.join(root, name)).encode())
+
+    return digest.hexdigest()[:12]
+
+
+def init_app(app):
+    """Install the caching policy and the `static_url` template global."""
+
+    app.extensions['template_version'] = template_version(app)
+    app.add_template_global(static_url)
+    app.after_request(apply_policy)
@@ -0,0 +1,240 @@
+"""Per-request SQL instrumentation for Warbler.
+
+Every statement run while a request is being handled is counted against
+that request: number of queries, time spent in the database, and rows
+(as the driver reports them: psycopg2 gives the size of a SELECT's
+result, sqlite3 only counts rows written). When the request is done:
+
+- in debug mode, or with the PERF_HEADERS config value set, the counts
+  are sent back as X-DB-Queries, X-DB-Time and X-DB-Rows headers (for a
+  streamed page, only the work done before the body started);
+- otherwise, one JSON line per request goes to the "warbler.perf" logger.
+
+Statements slower than SLOW_QUERY_MS are logged to "warbler.perf" as a
+warning, normalized (literals and placeholders become "?", and lists of
+them, as in IN or VALUES, collapse to one) so that repeats group
+together, along with the view that was running and the chain of Warbler
+functions that issued the query.
+
+With the PERF_ENDPOINT config value set, `/__perf` reports request count,
+p50/p95 latency and mean queries per route over the last ROUTE_SAMPLES
+requests of each, for this process, along with the number of password
+hashing jobs waiting or running (see passwords.py).
+"""
+
+import json
+import logging
+import os
+import re
+import threading
+import time
+import traceback
+from collections import defaultdict, deque
+
+from flask import current_app, g, has_app_context, jsonify, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+import passwords
+
+logger = logging.getLogger('warbler.perf')
+
+SLOW_QUERY_MS = 100
+ROUTE_SAMPLES = 1000
+
+_PLACEHOLDERS = re.compile(r"%\(\w+\)s|%s")
+_LITERALS = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+_LISTS = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+
+
+class RequestStats:
+    """Database work done on behalf of one request."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.db_time = 0.0
+        self.rows = 0
+        self.status = None
+
+    def elapsed_ms(self):
+        return (time.perf_counter() - self.started) * 1000
+
+
+def _percentile(ordered, pct):
+    rank = max(0, min(len(ordered) - 1, round(pct / 100 * len(ordered)) - 1))
+    return ordered[rank]
+
+
+class RouteStats:
+    """Recent request timings and query counts, by route."""
+
+    def __init__(self, maxlen=ROUTE_SAMPLES):
+        self._samples = defaultdict(lambda: deque(maxlen=maxlen))
+        self._lock = threading.Lock()
+
+    def record(self, route, elapsed_ms, queries):
+        with self._lock:
+            self._samples[route].append((elapsed_ms, queries))
+
+    def summary(self):
+        """{route: {requests, p50_ms, p95_ms, mean_queries}}"""
+
+        with self._lock:
+            samples = {route: list(values)
+                       for route, values in self._samples.items()}
+
+        summary = {}
+        for route, values in sorted(samples.items()):
+            times = sorted(elapsed for elapsed, queries in values)
+            summary[route] = {
+                'requests': len(values),
+                'p50_ms': round(_percentile(times, 50), 2),
+                'p95_ms': round(_percentile(times, 95), 2),
+                'mean_queries': round(
+                    sum(queries for elapsed, queries in values) / len(values),
+                    2),
+            }
+
+        return summary
+
+    def clear(self):
+        with self._lock:
+            self._samples.clear()
+
+
+def normalize(statement):
+    """`statement` with its literal values and parameters replaced by "?"."""
+
+    statement = " ".join(statement.split())
+    statement = _LITERALS.sub('?', statement)
+    statement = _PLACEHOLDERS.sub('?', statement)
+    return _LISTS.sub('(?)', statement)
+
+
+def call_site():
+    """The Warbler functions on the stack, outermost first."""
+
+    root = current_app.root_path
+    frames = []
+
+    for frame in traceback.extract_stack():
+        filename = os.path.abspath(frame.filename)
+        if (filename.startswith(root) and 'site-packages' not in filename
+                and filename != os.path.abspath(__file__)):
+            frames.append(f"{os.path.relpath(filename, root)}:{frame.lineno} "
+                          f"{frame.name}")
+
+    return " > ".join(frames)
+
+
+def current_stats():
+    """The RequestStats of the request being handled, if any."""
+
+    if not has_app_context():
+        return None
+
+    return g.get('perf')
+
+
+##############################################################################
+# Hooks
+
+
+def before_cursor_execute(conn, cursor, statement, parameters, context,
+                          executemany):
+    context._perf_started = time.perf_counter()
+
+
+def after_cursor_execute(conn, cursor, statement, parameters, context,
+                         executemany):
+    elapsed = time.perf_counter() - context._perf_started
+
+    stats = current_stats()
+    if stats is None:
+        return
+
+    stats.queries += 1
+    stats.db_time += elapsed
+    if cursor.rowcount > 0:
+        stats.rows += cursor.rowcount
+
+    threshold = current_app.config.get('SLOW_QUERY_MS', SLOW_QUERY_MS)
+    if elapsed * 1000 >= threshold:
+        logger.warning(json.dumps({
+            'event': 'slow_query',
+            'ms': round(elapsed * 1000, 2),
+            'statement': normalize(statement),
+            'view': request.endpoint,
+            'call_site': call_site(),
+        }))
+
+
+def start_request():
+    g.perf = RequestStats()
+
+
+def add_headers(response):
+    stats = current_stats()
+    if stats is None:
+        return response
+
+    stats.status = response.status_code
+
+    if current_app.debug or current_app.config.get('PERF_HEADERS'):
+        response.headers['X-DB-Queries'] = str(stats.queries)
+        response.headers['X-DB-Time'] = f"{stats.db_time * 1000:.2f}ms"
+        response.headers['X-DB-Rows'] = str(stats.rows)
+
+    return response
+
+
+def finish_request(exc):
+    stats = current_stats()
+    if stats is None:
+        return
+
+    elapsed = stats.elapsed_ms()
+    rule = request.url_rule.rule if request.url_rule else '<unmatched>'
+    route = f"{request.method} {rule}"
+
+    current_app.extensions['route_stats'].record(route, elapsed, stats.queries)
+
+    if not current_app.debug:
+        logger.info(json.dumps({
+            'event': 'request',
+            'route': route,
+            'path': request.path,
+            'status': stats.status if exc is None else 500,
+            'ms': round(elapsed, 2),
+            'queries': stats.queries,
+            'db_ms': round(stats.db_time * 1000, 2),
+            'rows': stats.rows,
+        }))
+
+
+def perf_summary():
+    """Latency and query counts by route, and the password hashing queue."""
+
+    return jsonify(routes=current_app.extensions['route_stats'].summary(),
+                   password_queue_depth=passwords.queue_depth())
+
+
+def init_instrumentation(app):
+    """Count each request's database work on `app` (see module docstring)."""
+
+    # Engines are created lazily, so listen on all of them.
+    if not event.contains(Engine, 'after_cursor_execute', after_cursor_execute):
+        event.listen(Engine, 'before_cursor_execute', before_cursor_execute)
+        event.listen(Engine, 'after_cursor_execute', after_cursor_execute)
+
+    app.extensions['route_stats'] = RouteStats()
+
+    app.before_request(start_request)
+    app.after_request(add_headers)
+    app.teardown_request(finish_request)
+
+    if app.config.get('PERF_ENDPOINT'):
+        app.add_url_rule('/__perf', 'perf', perf_summary)
+
+    return app.extensions['route_stats']
@@ -0,0 +1,244 @@
+"""Background jobs for Warbler.
+
+The write routes record slow side effects -- fanning a message out to
+followers' timelines, backfilling or pruning a timeline after a follow
+change, recounting the counters a deleted user was counted in -- as rows
+in the `jobs` table, in the same transaction as the write itself, and
+return. Workers run them:
+
+    flask jobs work          # run jobs as they come due, until stopped
+    flask jobs work --once   # run the jobs that are due, then exit
+    flask jobs status        # count jobs by state
+    flask jobs purge         # delete done jobs older than a week
+
+A worker takes a due job with SELECT ... FOR UPDATE SKIP LOCKED (a plain
+SELECT on SQLite, which has one writer anyway), so several workers never
+take the same job, and leases it by pushing its `run_at` back by the
+retry delay before running it. The job is marked done in the same
+transaction as its task's changes. A task that raises, or a worker that
+dies, leaves the job to be retried once the lease runs out; the delay is
+JOB_RETRY_DELAY seconds, doubling with each attempt, and a job is marked
+failed after JOB_MAX_ATTEMPTS. Tasks may therefore run more than once and
+must be idempotent.
+
+A job enqueued with an idempotency key is only recorded once, however
+many times it is enqueued (e.g. by a retried request).
+
+With JOBS_INLINE set, `enqueue()` runs the task straight away instead,
+which is handy in tests and single-process setups.
+
+Tasks are functions registered with `@jobs.task(name)`, taking JSON-able
+keyword arguments.
+
+Some side effects deliberately stay in the request. Single-row counter
+updates are as cheap as recording a job, and the next page shows them
+(see counters.py). The user and fragment caches live in each web
+process, out of a worker's reach. Search indexes are kept up to date by
+the database itself (see search.py).
+"""
+
+import json
+import logging
+import time
+import traceback
+from datetime import datetime, timedelta
+
+import click
+from flask.cli import AppGroup
+
+from models import db, insert_ignoring_conflicts, Job
+
+PENDING = 'pending'
+DONE = 'done'
+FAILED = 'failed'
+
+# Defaults; override with the config values of the same names.
+JOB_MAX_ATTEMPTS = 5
+JOB_RETRY_DELAY = 10
+JOB_POLL_INTERVAL = 1
+
+log = logging.getLogger('warbler.jobs')
+
+TASKS = {}
+
+
+def task(name):
+    """Register the decorated function as the task `name`."""
+
+    def register(fn):
+        TASKS[name] = fn
+        return fn
+
+    return register
+
+
+def setting(name, default):
+    return db.get_app().config.get(name, default)
+
+
+def retry_delay(attempts):
+    """How long a job waits after its `attempts`th attempt starts."""
+
+    return timedelta(
+        seconds=setting('JOB_RETRY_DELAY', JOB_RETRY_DELAY) * 2 ** (attempts - 1))
+
+
+##############################################################################
+# Enqueueing
+
+
+def enqueue(name, key=None, **args):
+    """Record that task `name` should run with keyword arguments `args`.
+
+    The job is part of the current transaction, so it only exists if that
+    commits. Returns the job's id, or None if a job with idempotency `key`
+    already exists.
+    """
+
+    if name not in TASKS:
+        raise ValueError(f"Unknown job {name!r}")
+
+    inline = setting('JOBS_INLINE', False)
+    now = datetime.utcnow()
+
+    result = db.session.execute(insert_ignoring_conflicts(Job.__table__).values(
+        name=name,
+        args=json.dumps(args),
+        idempotency_key=key,
+        state=DONE if inline else PENDING,
+        attempts=1 if inline else 0,
+        run_at=now,
+        created_at=now,
+    ))
+
+    if not result.rowcount:
+        return None
+
+    if inline:
+        TASKS[name](**args)
+
+    return result.inserted_primary_key[0]
+
+
+##############################################################################
+# Running jobs
+
+
+def claim():
+    """Take and lease the next due job, committing the lease.
+
+    Returns the Job, or None if no job is due.
+    """
+
+    now = datetime.utcnow()
+
+    job = (Job.query
+           .filter(Job.state == PENDING, Job.run_at <= now)
+           .order_by(Job.run_at, Job.id)
+           .with_for_update(skip_locked=True)
+           .first())
+
+    if job is None:
+        db.session.rollback()
+        return None
+
+    job.attempts += 1
+    job.run_at = now + retry_delay(job.attempts)
+    db.session.commit()
+
+    return job
+
+
+def run(job):
+    """Run a claimed job. Returns True if it succeeded."""
+
+    try:
+        TASKS[job.name](**json.loads(job.args))
+        job.state = DONE
+        job.last_error = None
+        db.session.commit()
+        return True
+
+    except Exception:
+        db.session.rollback()
+
+        job.last_error = traceback.format_exc()
+        if job.attempts >= setting('JOB_MAX_ATTEMPTS', JOB_MAX_ATTEMPTS):
+            job.state = FAILED
+        db.session.commit()
+
+        log.exception("Job %s (%s) failed on attempt %d%s", job.id, job.name,
+                      job.attempts, "; giving up" if job.state == FAILED else "")
+        return False
+
+
+def work(once=False, sleep=time.sleep):
+    """Run jobs as they come due; with `once`, stop when none are due.
+
+    Returns the number of jobs run.
+    """
+
+    count = 0
+
+    while True:
+        job = claim()
+
+        if job is not None:
+            run(job)
+            count += 1
+        elif once:
+            return count
+        else:
+            sleep(setting('JOB_POLL_INTERVAL', JOB_POLL_INTERVAL))
+
+
+def counts():
+    """The number of jobs in each state."""
+
+    return dict(db.session.query(Job.state, db.func.count(Job.id))
+                .group_by(Job.state))
+
+
+def purge(before):
+    """Delete done jobs enqueued before `before`; returns how many."""
+
+    deleted = (Job.query
+               .filter(Job.state == DONE, Job.created_at < before)
+               .delete(synchronize_session=False))
+    db.session.commit()
+    return deleted
+
+
+##############################################################################
+# CLI
+
+
+jobs_cli = AppGroup('jobs', help="Run and inspect background jobs.")
+
+
+@jobs_cli.command('work')
+@click.option('--once', is_flag=True, help="Exit when no jobs are due.")
+def work_command(once):
+    """Run background jobs."""
+
+    count = work(once=once)
+    click.echo(f"Ran {count} jobs.")
+
+
+@jobs_cli.command('status')
+def status_command():
+    """Count jobs by state."""
+
+    by_state = counts()
+    for state in [PENDING, DONE, FAILED]:
+        click.echo(f"{state:8s} {by_state.get(state, 0)}")
+
+
+@jobs_cli.command('purge')
+@click.option('--days', default=7, show_default=True,
+              help="Keep done jobs this many days.")
+def purge_command(days):
+    """Delete old done jobs."""
+
+    deleted = purge(datetime.utcnow() - timedelta(days=days))
+    click.echo(f"Deleted {deleted} jobs.")
@@ -0,0 +1,212 @@
+"""Versioned schema migrations for Warbler.
+
+Each migration has a version number and brings a database from the
+previous version up to it. Applied versions are recorded in the
+`schema_migrations` table, so upgrading only runs what is missing:
+
+    flask db upgrade       # apply pending migrations
+    flask db status        # show applied and pending migrations
+
+A database without the Warbler tables is created straight from the models
+at the latest version. A database that predates this module (it has the
+tables but no `schema_migrations` rows) starts at version 0, the original
+schema. Every migration checks what already exists before changing it, so
+running one against a partly-migrated database is safe.
+"""
+
+from collections import namedtuple
+from datetime import datetime
+
+import click
+from flask.cli import AppGroup
+from sqlalchemy import inspect
+
+from models import db, User, Message, Likes, TimelineEntry, Job
+import counters
+import search
+import timeline
+
+schema_migrations = db.Table(
+    'schema_migrations',
+    db.metadata,
+    db.Column('version', db.Integer, primary_key=True, autoincrement=False),
+    db.Column('description', db.Text, nullable=False),
+    db.Column('applied_at', db.DateTime, nullable=False,
+              default=datetime.utcnow),
+)
+
+Migration = namedtuple('Migration', ['version', 'description', 'upgrade'])
+
+MIGRATIONS = []
+
+
+def migration(version, description):
+    """Register the decorated function as the upgrade to `version`."""
+
+    def register(upgrade):
+        MIGRATIONS.append(Migration(version, description, upgrade))
+        return upgrade
+
+    return register
+
+
+##############################################################################
+# Migrations
+
+
+@migration(1, "Denormalized counter columns")
+def add_counters(connection):
+    columns = {
+        User.__table__: ['messages_count', 'followers_count',
+                         'following_count', 'likes_count'],
+        Message.__table__: ['likes_count'],
+    }
+
+    inspector = inspect(connection)
+
+    for table, names in columns.items():
+        existing = {column['name'] for column in inspector.get_columns(table.name)}
+        for name in names:
+            if name not in existing:
+                connection.execute(
+                    f"ALTER TABLE {table.name} "
+                    f"ADD COLUMN {name} INTEGER NOT NULL DEFAULT 0")
+
+    counters.reconcile()
+
+
+@migration(2, "Materialized home timelines")
+def add_timelines(connection):
+    TimelineEntry.__table__.create(connection, checkfirst=True)
+    timeline.rebuild()
+
+
+@migration(3, "Username and full-text message search indexes")
+def add_search_indexes(connection):
+    search.create_search_indexes(connection)
+
+
+# Secondary indexes on the hot read paths: a user's messages newest first,
+# like lookups in both directions, follows from the follower's side, and
+# removing a message from timelines.
+HOT_PATH_INDEXES = [
+    'ix_messages_user_timestamp',
+    'uq_likes_user_message',
+    'ix_likes_message_id',
+    'ix_follows_following_followed',
+    'ix_timeline_entries_message_id',
+]
+
+
+@migration(4, "Indexes for hot query paths; likes are unique")
+def add_hot_path_indexes(connection):
+    # The unique index can't be built while duplicate likes exist.
+    first_likes = (db.select([db.func.min(Likes.id)])
+                   .group_by(Likes.user_id, Likes.message_id))
+    connection.execute(Likes.__table__.delete().where(
+        Likes.id.notin_(first_likes)))
+    counters.reconcile()
+
+    indexes = {index.name: index
+               for table in db.metadata.sorted_tables
+               for index in table.indexes}
+
+    inspector = inspect(connection)
+
+    for name in HOT_PATH_INDEXES:
+        index = indexes[name]
+        existing = {i['name'] for i in inspector.get_indexes(index.table.name)}
+        if name not in existing:
+            index.create(connection)
+
+
+@migration(5, "Background jobs")
+def add_jobs(connection):
+    Job.__table__.create(connection, checkfirst=True)
+
+
+##############################################################################
+# Running migrations
+
+
+def head():
+    """The latest migration version."""
+
+    return max(m.version for m in MIGRATIONS)
+
+
+def applied_versions(connection):
+    return {version for (version,) in connection.execute(
+        db.select([schema_migrations.c.version]))}
+
+
+def stamp(connection, migrations):
+    """Record `migrations` as applied."""
+
+    for m in migrations:
+        connection.execute(schema_migrations.insert().values(
+            version=m.version, description=m.description))
+
+
+def pending(connection):
+    """Migrations not yet applied, in version order."""
+
+    applied = applied_versions(connection)
+    return [m for m in sorted(MIGRATIONS) if m.version not in applied]
+
+
+def upgrade(log=lambda message: None):
+    """Bring the database up to the latest version.
+
+    Each migration runs and is recorded in its own transaction. Returns
+    the migrations that were applied.
+    """
+
+    connection = db.session.connection()
+    schema_migrations.create(connection, checkfirst=True)
+
+    if not connection.dialect.has_table(connection, User.__tablename__):
+        # A new database: create everything at the latest version.
+        db.metadata.create_all(connection)
+        stamp(connection, MIGRATIONS)
+        db.session.commit()
+        log(f"Created schema at version {head()}")
+        return []
+
+    applied = []
+
+    for m in pending(connection):
+        log(f"Applying {m.version}: {m.description}")
+        m.upgrade(db.session.connection())
+        stamp(db.session.connection(), [m])
+        db.session.commit()
+        applied.append(m)
+
+    return applied
+
+
+db_cli = AppGroup('db', help="Manage the database schema.")
+
+
+@db_cli.command('upgrade')
+def upgrade_command():
+    """Apply pending migrations."""
+
+    applied = upgrade(log=click.echo)
+    click.echo(f"Database is at version {head()} "
+               f"({len(applied)} migrations applied).")
+
+
+@db_cli.command('status')
+def status_command():
+    """Show which migrations have been applied."""
+
+    connection = db.session.connection()
+    if not connection.dialect.has_table(connection, schema_migrations.name):
+        applied = set()
+    else:
+        applied = applied_versions(connection)
+
+    for m in sorted(MIGRATIONS):
+        state = "applied" if m.version in applied else "pending"
+        click.echo(f"{m.version:4d}  {state:8s} {m.description}")
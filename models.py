@@ -2,11 +2,53 @@
 
 from datetime import datetime
 
-from flask_bcrypt import Bcrypt
-from flask_sqlalchemy import SQLAlchemy
+from flask_sqlalchemy import SQLAlchemy, SignallingSession
+from sqlalchemy import orm
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.sql.dml import UpdateBase
 
-bcrypt = Bcrypt()
-db = SQLAlchemy()
+import passwords
+import replicas
+
+
+class RoutingSession(SignallingSession):
+    """Sends read-only views' reads to the replica (see replicas.py)."""
+
+    def get_bind(self, mapper=None, clause=None):
+        if (not self._flushing
+                and not isinstance(clause, UpdateBase)
+                and replicas.use_replica()):
+            return db.get_engine(self.app, bind=replicas.BIND_KEY)
+
+        return super().get_bind(mapper, clause)
+
+
+class WarblerSQLAlchemy(SQLAlchemy):
+    """Adds the DATABASE_POOL_OPTIONS config to create_engine()'s arguments,
+    and routes reads to a replica when there is one."""
+
+    def apply_driver_hacks(self, app, sa_url, options):
+        rv = super().apply_driver_hacks(app, sa_url, options)
+
+        if not sa_url.drivername.startswith('sqlite'):
+            options.update(app.config.get('DATABASE_POOL_OPTIONS', {}))
+
+        return rv
+
+    def create_session(self, options):
+        return orm.sessionmaker(class_=RoutingSession, db=self, **options)
+
+
+db = WarblerSQLAlchemy()
+
+
+def insert_ignoring_conflicts(table):
+    """An INSERT into `table` that silently skips duplicate rows."""
+
+    if db.engine.dialect.name == 'postgresql':
+        return postgresql.insert(table).on_conflict_do_nothing()
+
+    return table.insert().prefix_with('OR IGNORE')
 
 
 class Follows(db.Model):
@@ -26,6 +68,13 @@ class Follows(db.Model):
         primary_key=True,
     )
 
+    # The primary key leads with the followed user; this index serves
+    # lookups from the follower's side.
+    __table_args__ = (
+        db.Index('ix_follows_following_followed',
+                 'user_following_id', 'user_being_followed_id'),
+    )
+
 
 class Likes(db.Model):
     """Mapping user likes to warbles."""
@@ -45,7 +94,12 @@ class Likes(db.Model):
     message_id = db.Column(
         db.Integer,
         db.ForeignKey('messages.id', ondelete='cascade')
-        # unique=True
+    )
+
+    __table_args__ = (
+        db.Index('uq_likes_user_message', 'user_id', 'message_id',
+                 unique=True),
+        db.Index('ix_likes_message_id', 'message_id'),
     )
 
 
@@ -94,7 +148,39 @@ class User(db.Model):
         nullable=False,
     )
 
-    messages = db.relationship('Message')
+    # Denormalized counts, kept in step by the write routes (see
+    # counters.py) so profile stats never have to count collections.
+
+    messages_count = db.Column(
+        db.Integer,
+        nullable=False,
+        default=0,
+        server_default='0',
+    )
+
+    followers_count = db.Column(
+        db.Integer,
+        nullable=False,
+        default=0,
+        server_default='0',
+    )
+
+    following_count = db.Column(
+        db.Integer,
+        nullable=False,
+        default=0,
+        server_default='0',
+    )
+
+    likes_count = db.Column(
+        db.Integer,
+        nullable=False,
+        default=0,
+        server_default='0',
+    )
+
+    # The database deletes a user's messages with them (ON DELETE CASCADE).
+    messages = db.relationship('Message', passive_deletes=True)
 
     followers = db.relationship(
         "User",
@@ -121,16 +207,15 @@ class User(db.Model):
     def is_followed_by(self, other_user):
         """Is this user followed by `other_user`?"""
 
-        found_user_list = [
-            user for user in self.followers if user == other_user]
-        return len(found_user_list) == 1
+        return other_user.is_following(self)
 
     def is_following(self, other_user):
         """Is this user following `other_user`?"""
 
-        found_user_list = [
-            user for user in self.following if user == other_user]
-        return len(found_user_list) == 1
+        return db.session.query(db.exists().where(db.and_(
+            Follows.user_following_id == self.id,
+            Follows.user_being_followed_id == other_user.id,
+        ))).scalar()
 
     @classmethod
     def signup(cls, username, email, password, image_url):
@@ -139,7 +224,7 @@ class User(db.Model):
         Hashes password and adds user to system.
         """
 
-        hashed_pwd = bcrypt.generate_password_hash(password).decode('UTF-8')
+        hashed_pwd = password_hasher().hash(password)
 
         user = User(
             username=username,
@@ -164,13 +249,28 @@ class User(db.Model):
 
         user = cls.query.filter_by(username=username).first()
 
-        if user:
-            is_auth = bcrypt.check_password_hash(user.password, password)
-            if is_auth:
-                return user
+        if user and user.check_password(password):
+            return user
 
         return False
 
+    def check_password(self, password):
+        """Does `password` match this user's?
+
+        A hash made at an outdated cost is replaced with one at the
+        configured cost; the caller commits it.
+        """
+
+        hasher = password_hasher()
+
+        if not hasher.check(self.password, password):
+            return False
+
+        if hasher.needs_rehash(self.password):
+            self.password = hasher.hash(password)
+
+        return True
+
 
 class Message(db.Model):
     """An individual message ("warble")."""
@@ -190,7 +290,7 @@ class Message(db.Model):
     timestamp = db.Column(
         db.DateTime,
         nullable=False,
-        default=datetime.utcnow(),
+        default=datetime.utcnow,
     )
 
     user_id = db.Column(
@@ -199,14 +299,129 @@ class Message(db.Model):
         nullable=False,
     )
 
+    likes_count = db.Column(
+        db.Integer,
+        nullable=False,
+        default=0,
+        server_default='0',
+    )
+
     user = db.relationship('User')
 
 
+db.Index('ix_messages_user_timestamp',
+         Message.user_id, Message.timestamp.desc(), Message.id.desc())
+
+
+class TimelineEntry(db.Model):
+    """A message delivered to a user's home timeline.
+
+    Rows are written when a message is posted (one per follower, plus the
+    author) so the home page can read a user's feed with a single range
+    scan instead of rebuilding it from follows on every request.
+    """
+
+    __tablename__ = 'timeline_entries'
+
+    user_id = db.Column(
+        db.Integer,
+        db.ForeignKey('users.id', ondelete='cascade'),
+        primary_key=True,
+    )
+
+    message_id = db.Column(
+        db.Integer,
+        db.ForeignKey('messages.id', ondelete='cascade'),
+        primary_key=True,
+    )
+
+    timestamp = db.Column(
+        db.DateTime,
+        nullable=False,
+    )
+
+    message = db.relationship('Message')
+
+    __table_args__ = (
+        db.Index('ix_timeline_entries_user_timestamp',
+                 'user_id', 'timestamp', 'message_id'),
+        db.Index('ix_timeline_entries_message_id', 'message_id'),
+    )
+
+
+class Job(db.Model):
+    """A side effect of a write, to be run in the background (see jobs.py)."""
+
+    __tablename__ = 'jobs'
+
+    id = db.Column(
+        db.Integer,
+        primary_key=True,
+    )
+
+    # A registered task name and its keyword arguments as JSON.
+    name = db.Column(
+        db.Text,
+        nullable=False,
+    )
+
+    args = db.Column(
+        db.Text,
+        nullable=False,
+    )
+
+    # Enqueueing a job with the key of an existing one does nothing.
+    idempotency_key = db.Column(
+        db.Text,
+        unique=True,
+    )
+
+    # 'pending', 'done' or 'failed'.
+    state = db.Column(
+        db.Text,
+        nullable=False,
+        default='pending',
+    )
+
+    attempts = db.Column(
+        db.Integer,
+        nullable=False,
+        default=0,
+    )
+
+    # When the job is next due: set on enqueue, then pushed back by the
+    # retry delay each time a worker takes it.
+    run_at = db.Column(
+        db.DateTime,
+        nullable=False,
+        default=datetime.utcnow,
+    )
+
+    created_at = db.Column(
+        db.DateTime,
+        nullable=False,
+        default=datetime.utcnow,
+    )
+
+    last_error = db.Column(
+        db.Text,
+    )
+
+    __table_args__ = (
+        db.Index('ix_jobs_state_run_at', 'state', 'run_at'),
+    )
+
+
 def connect_db(app):
     """Connect this database to provided Flask app.
 
     You should call this in your Flask app.
     """
 
-    db.app = app
     db.init_app(app)
+
+
+def password_hasher():
+    """The password hasher of the app in use (see passwords.py)."""
+
+    return passwords.get_hasher(db.get_app())
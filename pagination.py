@@ -0,0 +1,255 @@
+"""Keyset (cursor) pagination for Warbler.
+
+Pages are selected by comparing the ordering key against a cursor taken
+from the edge of the previous page, so every page is a bounded index seek
+no matter how deep into a listing the client has gone:
+
+- messages are ordered newest-first by (timestamp, id); `?before=` moves
+  to older messages and `?after=` back to newer ones.
+- users are ordered by id; `?after=` moves forward and `?before=` back.
+
+`paginate(..., stream=True)` returns a StreamedPage instead, which reads
+its rows from a server-side cursor as a streamed template iterates it.
+`merge_pages()` combines pages of one listing read from several sources.
+"""
+
+import heapq
+from datetime import datetime
+from itertools import islice
+
+from flask import request, url_for, abort
+
+from models import db
+
+MESSAGES_PER_PAGE = 100
+USERS_PER_PAGE = 50
+
+# Rows fetched from the database at a time by a StreamedPage.
+STREAM_BATCH_SIZE = 25
+
+
+class Page:
+    """One page of results plus the query args for its neighbours.
+
+    `next` and `prev` are dicts of query-string args (e.g.
+    {'before': '...'}) or None when there is nothing in that direction.
+    """
+
+    def __init__(self, items, next=None, prev=None):
+        self.items = items
+        self.next = next
+        self.prev = prev
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def __len__(self):
+        return len(self.items)
+
+    def on_batch(self, hook):
+        """Call `hook` with the items, which a Page has all at once."""
+
+        hook(self.items)
+
+
+class StreamedPage:
+    """A Page whose items are fetched in batches while it is iterated.
+
+    `next` and `prev` are only known once iteration has finished, so
+    templates must render the pager after the items. Functions added with
+    `on_batch()` are called with each batch before any of its items are
+    yielded, e.g. to look up which messages the viewer has liked.
+    """
+
+    def __init__(self, query, key, per_page, forward, backward,
+                 first_page, batch_size=None):
+        self.query = query
+        self.key = key
+        self.per_page = per_page
+        self.forward = forward
+        self.backward = backward
+        self.first_page = first_page
+        self.batch_size = batch_size or STREAM_BATCH_SIZE
+        self.next = None
+        self.prev = None
+        self._batch_hooks = []
+
+    def on_batch(self, hook):
+        self._batch_hooks.append(hook)
+
+    def __iter__(self):
+        # `query` is limited to one row more than a page, to tell whether
+        # there is a next page.
+        rows = iter(self.query.yield_per(self.batch_size))
+        remaining = self.per_page
+        last = None
+
+        while remaining:
+            batch = list(islice(rows, min(self.batch_size, remaining)))
+            if not batch:
+                break
+
+            if last is None and not self.first_page:
+                self.prev = {self.backward: self.key(batch[0])}
+
+            for hook in self._batch_hooks:
+                hook(batch)
+
+            yield from batch
+
+            remaining -= len(batch)
+            last = batch[-1]
+
+        if not remaining and next(rows, None) is not None:
+            self.next = {self.forward: self.key(last)}
+
+
+def message_cursor(msg):
+    """Encode the (timestamp, id) key of a message as a cursor."""
+
+    return f"{msg.timestamp.isoformat()}_{msg.id}"
+
+
+def parse_message_cursor(cursor):
+    """Decode a message cursor; raises ValueError if it is malformed."""
+
+    timestamp, id = cursor.rsplit('_', 1)
+    return datetime.fromisoformat(timestamp), int(id)
+
+
+def user_cursor(user):
+    """Encode the id key of a user as a cursor."""
+
+    return str(user.id)
+
+
+def parse_user_cursor(cursor):
+    """Decode a user cursor; raises ValueError if it is malformed."""
+
+    return (int(cursor),)
+
+
+def cursor_args(parse):
+    """Read `before`/`after` from the query string, aborting 400 if bad."""
+
+    before = request.args.get('before')
+    after = request.args.get('after')
+
+    try:
+        return (parse(before) if before else None,
+                parse(after) if after else None)
+    except ValueError:
+        abort(400)
+
+
+def paginate(query, columns, key, before=None, after=None,
+             per_page=MESSAGES_PER_PAGE, descending=True, stream=False):
+    """Return a Page of `query` using keyset pagination.
+
+    `columns` are the ordering columns (the last must be unique), `key`
+    turns a result into a cursor string, and `before`/`after` are decoded
+    cursor tuples. With `descending`, "next" is `before` (older); otherwise
+    "next" is `after` (larger ids).
+
+    With `stream`, returns a StreamedPage, except when walking back
+    toward the start: those rows arrive in reverse and are read whole.
+    """
+
+    forward, backward = ('before', 'after') if descending else ('after', 'before')
+    cursor = {'before': before, 'after': after}
+
+    row = db.tuple_(*columns)
+
+    def beyond(values):
+        """Rows that sort after `values` in page order."""
+        return row < db.tuple_(*values) if descending else row > db.tuple_(*values)
+
+    def behind(values):
+        """Rows that sort before `values` in page order."""
+        return row > db.tuple_(*values) if descending else row < db.tuple_(*values)
+
+    if cursor[backward] is not None:
+        # Walking back toward the start: read in reverse order and flip.
+        order = [c.asc() if descending else c.desc() for c in columns]
+        rows = (query
+                .filter(behind(cursor[backward]))
+                .order_by(*order)
+                .limit(per_page + 1)
+                .all())
+        more = len(rows) > per_page
+        items = list(reversed(rows[:per_page]))
+        return Page(
+            items,
+            next={forward: key(items[-1])} if items else None,
+            prev={backward: key(items[0])} if items and more else None,
+        )
+
+    order = [c.desc() if descending else c.asc() for c in columns]
+    if cursor[forward] is not None:
+        query = query.filter(beyond(cursor[forward]))
+
+    query = query.order_by(*order).limit(per_page + 1)
+
+    if stream:
+        return StreamedPage(query, key, per_page, forward, backward,
+                            first_page=cursor[forward] is None)
+
+    rows = query.all()
+    items = rows[:per_page]
+    more = len(rows) > per_page
+
+    return Page(
+        items,
+        next={forward: key(items[-1])} if more else None,
+        prev=({backward: key(items[0])}
+              if items and cursor[forward] is not None else None),
+    )
+
+
+def merge_pages(pages, sort_key, key, before=None, after=None,
+                per_page=MESSAGES_PER_PAGE):
+    """Merge newest-first Pages of one listing from several sources.
+
+    Each of `pages` must come from `paginate()` with the same cursors and
+    `per_page`; together they hold every candidate for the merged page,
+    which is taken from a k-way merge on `sort_key`. `key` turns an item
+    into a cursor string. Items found in more than one source (with the
+    same `sort_key`) are kept once.
+    """
+
+    merged = []
+    for item in heapq.merge(*pages, key=sort_key, reverse=True):
+        if not merged or sort_key(merged[-1]) != sort_key(item):
+            merged.append(item)
+
+    if after is not None:
+        # Walking back toward the start: the page is the oldest items.
+        items = merged[-per_page:]
+        more = (len(merged) > per_page
+                or any(page.prev is not None for page in pages))
+        return Page(
+            items,
+            next={'before': key(items[-1])} if items else None,
+            prev={'after': key(items[0])} if items and more else None,
+        )
+
+    items = merged[:per_page]
+    more = (len(merged) > per_page
+            or any(page.next is not None for page in pages))
+
+    return Page(
+        items,
+        next={'before': key(items[-1])} if more else None,
+        prev=({'after': key(items[0])}
+              if items and before is not None else None),
+    )
+
+
+def page_url(args):
+    """URL for the current view with its cursor args replaced by `args`."""
+
+    params = {k: v for k, v in request.args.items()
+              if k not in ('before', 'after')}
+    params.update(request.view_args or {})
+    params.update(args)
+    return url_for(request.endpoint, **params)
@@ -0,0 +1,142 @@
+"""Password hashing for Warbler, off the request threads.
+
+bcrypt is slow on purpose (hundreds of milliseconds at the default cost),
+so hashing and checking run in a bounded pool of worker processes rather
+than on the thread serving the request. At most PASSWORD_MAX_PENDING jobs
+are queued or running at once; beyond that, callers wait for a slot, so a
+burst of logins queues up instead of starving every other request of CPU.
+`queue_depth()` reports how many jobs are waiting or running.
+
+Each app gets its own hasher from `init_app(app)`; `get_hasher()` returns
+it. The work factor comes from the BCRYPT_LOG_ROUNDS config value. Hashes
+made at a different cost are upgraded when their owner next logs in (see
+`needs_rehash()` and User.check_password).
+
+With PASSWORD_WORKERS = 0 the work is done inline, which is handy in
+tests and single-process scripts.
+"""
+
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+import bcrypt
+from flask import current_app
+
+DEFAULT_LOG_ROUNDS = 12
+DEFAULT_WORKERS = os.cpu_count() or 1
+DEFAULT_MAX_PENDING = 64
+
+
+def _hash(password, rounds):
+    """Hash `password` (bytes) at cost `rounds`; runs in a worker."""
+
+    return bcrypt.hashpw(password, bcrypt.gensalt(rounds)).decode('utf-8')
+
+
+def _check(pw_hash, password):
+    """Does `password` (bytes) match `pw_hash`? Runs in a worker."""
+
+    return bcrypt.checkpw(password, pw_hash.encode('utf-8'))
+
+
+class PasswordHasher:
+    """Runs bcrypt jobs in a bounded process pool."""
+
+    def __init__(self, rounds=DEFAULT_LOG_ROUNDS, workers=DEFAULT_WORKERS,
+                 max_pending=DEFAULT_MAX_PENDING):
+        self.rounds = rounds
+        self.workers = workers
+        self.max_pending = max_pending
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._pool = None
+        self._lock = threading.Lock()
+        self._depth = 0
+
+    def configure(self, rounds=None, workers=None, max_pending=None):
+        """Change settings; the pool is restarted on next use if needed."""
+
+        if rounds is not None:
+            self.rounds = rounds
+        if max_pending is not None and max_pending != self.max_pending:
+            self.max_pending = max_pending
+            self._slots = threading.BoundedSemaphore(max_pending)
+        if workers is not None and workers != self.workers:
+            self.workers = workers
+            self.shutdown()
+
+    def shutdown(self):
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown()
+
+    def queue_depth(self):
+        """Jobs waiting for a slot or running."""
+
+        return self._depth
+
+    def _run(self, fn, *args):
+        if not self.workers:
+            return fn(*args)
+
+        with self._lock:
+            self._depth += 1
+
+        slots = self._slots
+        slots.acquire()
+        try:
+            with self._lock:
+                if self._pool is None:
+                    self._pool = ProcessPoolExecutor(self.workers)
+                pool = self._pool
+
+            return pool.submit(fn, *args).result()
+        finally:
+            slots.release()
+            with self._lock:
+                self._depth -= 1
+
+    def hash(self, password):
+        """Return a bcrypt hash of `password` at the configured cost."""
+
+        if not password:
+            raise ValueError('Password must be non-empty.')
+
+        return self._run(_hash, password.encode('utf-8'), self.rounds)
+
+    def check(self, pw_hash, password):
+        """Does `password` match `pw_hash`?"""
+
+        return self._run(_check, pw_hash, password.encode('utf-8'))
+
+    def needs_rehash(self, pw_hash):
+        """Was `pw_hash` made at a different cost than the configured one?"""
+
+        try:
+            rounds = int(pw_hash.split('$')[2])
+        except (IndexError, ValueError):
+            return True
+
+        return rounds != self.rounds
+
+
+def init_app(app):
+    """Install a hasher configured from `app.config` on `app`."""
+
+    app.extensions['password_hasher'] = PasswordHasher(
+        rounds=app.config.get('BCRYPT_LOG_ROUNDS', DEFAULT_LOG_ROUNDS),
+        workers=app.config.get('PASSWORD_WORKERS', DEFAULT_WORKERS),
+        max_pending=app.config.get('PASSWORD_MAX_PENDING', DEFAULT_MAX_PENDING),
+    )
+    return app.extensions['password_hasher']
+
+
+def get_hasher(app=None):
+    """The hasher of `app` (by default, the current app)."""
+
+    return (app or current_app).extensions['password_hasher']
+
+
+def queue_depth():
+    return get_hasher().queue_depth()
@@ -0,0 +1,100 @@
+"""Read queries shared by Warbler's views.
+
+Each function returns exactly what a page renders, loading related rows
+eagerly so templates never trigger lazy loads per item. Relationship
+counts come from the denormalized counter columns (see counters.py).
+"""
+
+from models import db, User, Message, Follows, Likes
+from pagination import (paginate, message_cursor, user_cursor,
+                        MESSAGES_PER_PAGE, USERS_PER_PAGE)
+
+
+def liked_ids(user_id, messages):
+    """Return the set of ids among `messages` that `user_id` has liked."""
+
+    ids = [msg.id for msg in messages]
+    if not ids:
+        return set()
+
+    rows = (db.session
+            .query(Likes.message_id)
+            .filter(Likes.user_id == user_id, Likes.message_id.in_(ids)))
+
+    return {message_id for (message_id,) in rows}
+
+
+def user_messages_page(user_id, before=None, after=None,
+                       per_page=MESSAGES_PER_PAGE, stream=False):
+    """Return a Page of a user's own messages, newest first."""
+
+    return paginate(Message.query.filter(Message.user_id == user_id),
+                    [Message.timestamp, Message.id],
+                    message_cursor,
+                    before=before, after=after, per_page=per_page,
+                    stream=stream)
+
+
+def users_page(before=None, after=None, per_page=USERS_PER_PAGE):
+    """Return a Page of all users in id order."""
+
+    return paginate(User.query, [User.id], user_cursor,
+                    before=before, after=after,
+                    per_page=per_page, descending=False)
+
+
+def users_by_id(ids):
+    """Return the users with `ids`, in the order given; unknown ids are skipped."""
+
+    found = {user.id: user for user in User.query.filter(User.id.in_(ids))}
+    return [found[id] for id in ids if id in found]
+
+
+def messages_by_id(ids):
+    """Return the messages with `ids` and their authors, in the order given."""
+
+    found = {msg.id: msg for msg in (Message
+                                     .query
+                                     .filter(Message.id.in_(ids))
+                                     .options(db.joinedload(Message.user)))}
+    return [found[id] for id in ids if id in found]
+
+
+def followers_page(user_id, before=None, after=None, per_page=USERS_PER_PAGE):
+    """Return a Page of the users following `user_id`, in id order."""
+
+    query = (User
+             .query
+             .join(Follows, Follows.user_following_id == User.id)
+             .filter(Follows.user_being_followed_id == user_id))
+
+    return paginate(query, [User.id], user_cursor,
+                    before=before, after=after,
+                    per_page=per_page, descending=False)
+
+
+def following_page(user_id, before=None, after=None, per_page=USERS_PER_PAGE):
+    """Return a Page of the users `user_id` follows, in id order."""
+
+    query = (User
+             .query
+             .join(Follows, Follows.user_being_followed_id == User.id)
+             .filter(Follows.user_following_id == user_id))
+
+    return paginate(query, [User.id], user_cursor,
+                    before=before, after=after,
+                    per_page=per_page, descending=False)
+
+
+def liked_messages_page(user_id, before=None, after=None,
+                        per_page=MESSAGES_PER_PAGE):
+    """Return a Page of the messages a user has liked, newest first."""
+
+    query = (Message
+             .query
+             .join(Likes, Likes.message_id == Message.id)
+             .filter(Likes.user_id == user_id)
+             .options(db.joinedload(Message.user)))
+
+    return paginate(query, [Message.timestamp, Message.id], message_cursor,
+                    before=before, after=after, per_page=per_page)
@@ -0,0 +1,115 @@
+"""Rate limiting for Warbler.
+
+Limits are token buckets: a bucket holds up to `capacity` tokens and
+refills at `capacity` tokens per `period` seconds; each attempt takes one
+token, and an attempt that finds the bucket empty is rejected along with
+how long until a token is available.
+
+`LocalBucketStore` keeps buckets in process memory (bounded, least
+recently used buckets are dropped first). Anything with the same
+`take(key, limit)` and `clear()` methods, e.g. a wrapper around a shared
+store so that every app process sees the same counts, can be plugged in
+via `init_rate_limits(app, backend)`.
+
+Login attempts are limited per client IP and per username. Both are
+checked before the user is looked up or any password is hashed, so a
+flood of guesses costs neither a query nor a bcrypt run. Behind a proxy,
+`request.remote_addr` must be the client's address (e.g. via werkzeug's
+ProxyFix), or every client shares one bucket.
+"""
+
+import threading
+import time
+from collections import OrderedDict, namedtuple
+
+from flask import current_app, request
+
+Limit = namedtuple('Limit', ['capacity', 'period'])
+
+# Defaults; override with the LOGIN_LIMIT_PER_IP / LOGIN_LIMIT_PER_USERNAME
+# config values.
+LOGIN_LIMIT_PER_IP = Limit(capacity=30, period=60)
+LOGIN_LIMIT_PER_USERNAME = Limit(capacity=10, period=300)
+
+MAX_BUCKETS = 100000
+
+
+class LocalBucketStore:
+    """Thread-safe in-process token buckets."""
+
+    def __init__(self, maxsize=MAX_BUCKETS, clock=time.monotonic):
+        self.maxsize = maxsize
+        self.clock = clock
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._buckets)
+
+    def take(self, key, limit):
+        """Take a token for `key`.
+
+        Returns 0 if one was available, otherwise the number of seconds
+        until one will be.
+        """
+
+        now = self.clock()
+        rate = limit.capacity / limit.period
+
+        with self._lock:
+            tokens, updated = self._buckets.get(key, (limit.capacity, now))
+            tokens = min(limit.capacity, tokens + (now - updated) * rate)
+
+            if tokens >= 1:
+                tokens -= 1
+                wait = 0
+            else:
+                wait = (1 - tokens) / rate
+
+            self._buckets[key] = (tokens, now)
+            self._buckets.move_to_end(key)
+            while len(self._buckets) > self.maxsize:
+                self._buckets.popitem(last=False)
+
+        return wait
+
+    def clear(self):
+        with self._lock:
+            self._buckets.clear()
+
+
+def init_rate_limits(app, backend=None):
+    """Install the rate limit store on `app` (in-process by default)."""
+
+    if backend is None:
+        backend = LocalBucketStore()
+
+    app.extensions['rate_limits'] = backend
+    return backend
+
+
+def rate_limits():
+    return current_app.extensions['rate_limits']
+
+
+def login_retry_after(username):
+    """Count a login attempt for `username` from the requesting client.
+
+    Returns 0 if the attempt may go ahead, otherwise the seconds the
+    client should wait. A client already over its IP limit doesn't use up
+    the username's tokens, so one noisy address can't lock others out.
+    """
+
+    config = current_app.config
+    if not config.get('RATELIMIT_ENABLED', True):
+        return 0
+
+    wait = rate_limits().take(
+        f"login:ip:{request.remote_addr}",
+        config.get('LOGIN_LIMIT_PER_IP', LOGIN_LIMIT_PER_IP))
+    if wait:
+        return wait
+
+    return rate_limits().take(
+        f"login:username:{username.strip().lower()}",
+        config.get('LOGIN_LIMIT_PER_USERNAME', LOGIN_LIMIT_PER_USERNAME))
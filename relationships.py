@@ -0,0 +1,141 @@
+"""Follows and likes for Warbler.
+
+Each change is one idempotent statement that never loads a collection: a
+DELETE, or an INSERT ... SELECT that skips rows which already exist
+(ON CONFLICT DO NOTHING on Postgres, OR IGNORE on SQLite). Counters are
+only adjusted, and timeline backfills and prunes only queued (see
+jobs.py), for what the statement actually changed (its rowcount), so
+retried or concurrent requests can't double-count. The unique indexes on
+follows and likes are what make this safe.
+
+`FollowGraph` answers "does the viewer follow this user?" for templates:
+the viewer's followed ids are read in one query per request, after which
+each check is a set lookup.
+"""
+
+from flask import g
+
+from models import (db, insert_ignoring_conflicts, User, Message, Follows,
+                    Likes)
+import counters
+import jobs
+import timeline  # registers the timeline.* jobs
+
+follows = Follows.__table__
+likes = Likes.__table__
+
+
+def follow(follower_id, followed_id):
+    """Have `follower_id` follow `followed_id`.
+
+    Returns True if a follow was added; False if it already existed or
+    `followed_id` is not another existing user.
+    """
+
+    followed = (db.select([User.id, db.literal(follower_id)])
+                .where(db.and_(User.id == followed_id,
+                               User.id != follower_id)))
+
+    added = db.session.execute(
+        insert_ignoring_conflicts(follows).from_select(
+            ['user_being_followed_id', 'user_following_id'], followed)
+    ).rowcount
+
+    if added:
+        counters.adjust(User, follower_id, following_count=1)
+        counters.adjust(User, followed_id, followers_count=1)
+        jobs.enqueue('timeline.backfill', follower_id=follower_id,
+                     followed_id=followed_id)
+
+    return bool(added)
+
+
+def unfollow(follower_id, followed_id):
+    """Have `follower_id` stop following `followed_id`.
+
+    Returns True if a follow was removed.
+    """
+
+    removed = db.session.execute(follows.delete().where(db.and_(
+        follows.c.user_following_id == follower_id,
+        follows.c.user_being_followed_id == followed_id,
+    ))).rowcount
+
+    if removed:
+        counters.adjust(User, follower_id, following_count=-1)
+        counters.adjust(User, followed_id, followers_count=-1)
+        jobs.enqueue('timeline.prune', follower_id=follower_id,
+                     followed_id=followed_id)
+
+    return bool(removed)
+
+
+def toggle_like(user_id, message_id):
+    """Like `message_id` for `user_id`, or unlike it if already liked.
+
+    Returns True if a like was added, False if one was removed, and None
+    if nothing changed: the message is missing or the user's own, or a
+    concurrent request liked it first.
+    """
+
+    removed = db.session.execute(likes.delete().where(db.and_(
+        likes.c.user_id == user_id,
+        likes.c.message_id == message_id,
+    ))).rowcount
+
+    if removed:
+        counters.adjust(User, user_id, likes_count=-1)
+        counters.adjust(Message, message_id, likes_count=-1)
+        return False
+
+    likable = (db.select([db.literal(user_id), Message.id])
+               .where(db.and_(Message.id == message_id,
+                              Message.user_id != user_id)))
+
+    added = db.session.execute(
+        insert_ignoring_conflicts(likes).from_select(
+            ['user_id', 'message_id'], likable)
+    ).rowcount
+
+    if added:
+        counters.adjust(User, user_id, likes_count=1)
+        counters.adjust(Message, message_id, likes_count=1)
+        return True
+
+    return None
+
+
+class FollowGraph:
+    """Who one user follows, loaded at most once."""
+
+    def __init__(self, user_id):
+        self.user_id = user_id
+        self._following_ids = None
+
+    @property
+    def following_ids(self):
+        """The set of ids of the users that `user_id` follows."""
+
+        if self._following_ids is None:
+            if self.user_id is None:
+                self._following_ids = set()
+            else:
+                rows = (db.session
+                        .query(Follows.user_being_followed_id)
+                        .filter(Follows.user_following_id == self.user_id))
+                self._following_ids = {id for (id,) in rows}
+
+        return self._following_ids
+
+    def is_following(self, user):
+        return user.id in self.following_ids
+
+
+def follow_graph():
+    """The FollowGraph of the logged-in user, shared for this request."""
+
+    if 'follow_graph' not in g:
+        user = g.get('user')
+        g.follow_graph = FollowGraph(user.id if user else None)
+
+    return g.follow_graph
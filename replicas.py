@@ -0,0 +1,53 @@
+"""Read replica routing for Warbler.
+
+With a 'replica' entry in SQLALCHEMY_BINDS (set from DATABASE_REPLICA_URL),
+queries made by views marked `@read_only` go to the replica, and
+everything else -- other views, writes, flushes, CLI commands -- goes to
+the primary (see models.RoutingSession).
+
+A replica lags the primary a little, so a user who has just posted,
+followed or liked would not see it on the next page. Views that write
+call `stick_to_primary()`, which keeps that user's read-only views on the
+primary for REPLICA_STICKY_SECONDS.
+"""
+
+import time
+from functools import wraps
+
+from flask import current_app, g, has_request_context, session
+
+BIND_KEY = 'replica'
+
+# Session key holding the time until which reads stay on the primary.
+STICKY_KEY = 'primary_until'
+
+
+def replica_configured(app):
+    return BIND_KEY in (app.config.get('SQLALCHEMY_BINDS') or {})
+
+
+def read_only(view):
+    """Send the queries `view` makes to the replica."""
+
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        g.read_only = True
+        return view(*args, **kwargs)
+
+    return wrapper
+
+
+def stick_to_primary():
+    """Keep the current user's reads on the primary for a while."""
+
+    session[STICKY_KEY] = (time.time()
+                           + current_app.config['REPLICA_STICKY_SECONDS'])
+
+
+def use_replica():
+    """Whether reads in the current request should go to the replica."""
+
+    return (has_request_context()
+            and g.get('read_only', False)
+            and replica_configured(current_app)
+            and session.get(STICKY_KEY, 0) <= time.time())
@@ -0,0 +1,257 @@
+"""User and message search for Warbler.
+
+Username searches are case-insensitive substring matches, ranked exact match
+first, then prefix matches, then other substring matches, and capped at
+SEARCH_LIMIT results. Each dialect gets indexes that serve them:
+
+- Postgres: a byte-ordered ("C" collation) index on lower(username)
+  answers prefix matches, and a pg_trgm GiST index answers substring
+  matches ordered by trigram distance.
+- SQLite: an index on lower(username) answers prefix matches, and an
+  FTS5 trigram table (kept in sync by triggers) answers substring matches.
+
+Terms shorter than a trigram can only be matched as prefixes.
+
+Message searches are full-text: a GIN index on to_tsvector(text) on
+Postgres, and an FTS5 table kept in sync by triggers on SQLite, so the
+index is updated in the same transaction as each insert or delete.
+Results are paged by relevance, then recency.
+
+All of the DDL is idempotent, so `create_search_indexes()` can also add it
+to an existing database (see migrations.py).
+"""
+
+from datetime import datetime
+
+from sqlalchemy import event, DDL
+
+from models import db, User, Message
+from pagination import Page, paginate, MESSAGES_PER_PAGE
+
+SEARCH_LIMIT = 50
+
+# Trigram indexes can't match anything shorter than this.
+MIN_SUBSTRING_LENGTH = 3
+
+users = User.__table__
+messages = Message.__table__
+
+USER_SEARCH_DDL = {}
+MESSAGE_SEARCH_DDL = {}
+
+USER_SEARCH_DDL['postgresql'] = [
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    "CREATE INDEX IF NOT EXISTS ix_users_username_trgm ON users "
+    "USING gist (lower(username) gist_trgm_ops)",
+    "CREATE INDEX IF NOT EXISTS ix_users_username_lower ON users "
+    "((lower(username) COLLATE \"C\"))",
+]
+
+USER_SEARCH_DDL['sqlite'] = [
+    "CREATE INDEX IF NOT EXISTS ix_users_username_lower "
+    "ON users (lower(username))",
+    "CREATE VIRTUAL TABLE IF NOT EXISTS users_fts USING fts5("
+    "username, content='users', content_rowid='id', tokenize='trigram')",
+    "CREATE TRIGGER IF NOT EXISTS users_fts_insert AFTER INSERT ON users BEGIN "
+    "INSERT INTO users_fts (rowid, username) VALUES (new.id, new.username); "
+    "END",
+    "CREATE TRIGGER IF NOT EXISTS users_fts_delete AFTER DELETE ON users BEGIN "
+    "INSERT INTO users_fts (users_fts, rowid, username) "
+    "VALUES ('delete', old.id, old.username); "
+    "END",
+    "CREATE TRIGGER IF NOT EXISTS users_fts_update "
+    "AFTER UPDATE OF username ON users BEGIN "
+    "INSERT INTO users_fts (users_fts, rowid, username) "
+    "VALUES ('delete', old.id, old.username); "
+    "INSERT INTO users_fts (rowid, username) VALUES (new.id, new.username); "
+    "END",
+]
+
+for dialect, statements in USER_SEARCH_DDL.items():
+    for ddl in statements:
+        event.listen(users, 'after_create',
+                     DDL(ddl).execute_if(dialect=dialect))
+
+event.listen(users, 'before_drop',
+             DDL("DROP TABLE IF EXISTS users_fts").execute_if(dialect='sqlite'))
+
+users_fts = db.table('users_fts', db.column('rowid'))
+
+
+def escape_like(term):
+    """Escape LIKE wildcards in `term` (using backslash as the escape)."""
+
+    return (term
+            .replace('\\', '\\\\')
+            .replace('%', '\\%')
+            .replace('_', '\\_'))
+
+
+def search_users(search, limit=SEARCH_LIMIT):
+    """Return up to `limit` users whose username contains `search`.
+
+    Prefix matches (exact match first) come from one index range scan;
+    if that doesn't fill the page, other substring matches are taken from
+    the trigram index. Both reads stop after `limit` rows, so the cost
+    doesn't grow with the size of the table.
+    """
+
+    term = search.strip().lower()
+    if not term:
+        return []
+
+    sqlite = db.engine.dialect.name == 'sqlite'
+
+    # Prefixes are a range scan over the byte-ordered lower(username)
+    # index, which also returns an exact match first.
+    username = db.func.lower(User.username)
+    if not sqlite:
+        username = username.op('COLLATE')(db.literal_column('"C"'))
+
+    found = (User
+             .query
+             .filter(username >= term,
+                     username < term[:-1] + chr(ord(term[-1]) + 1))
+             .order_by(username, User.id)
+             .limit(limit)
+             .all())
+
+    if len(found) == limit or len(term) < MIN_SUBSTRING_LENGTH:
+        return found
+
+    if sqlite:
+        phrase = '"' + term.replace('"', '""') + '"'
+        substring = (User
+                     .query
+                     .join(users_fts, users_fts.c.rowid == User.id)
+                     .filter(db.literal_column('users_fts').op('MATCH')(phrase))
+                     .order_by(users_fts.c.rowid))
+    else:
+        # Trigram distance is answered from the GiST index (KNN scan).
+        substring = (User
+                     .query
+                     .filter(db.func.lower(User.username).like(
+                         '%' + escape_like(term) + '%', escape='\\'))
+                     .order_by(db.func.lower(User.username).op('<->')(term)))
+
+    seen = {user.id for user in found}
+    for user in substring.limit(limit):
+        if user.id not in seen and len(found) < limit:
+            found.append(user)
+
+    return found
+
+
+##############################################################################
+# Messages
+
+TEXT_SEARCH_CONFIG = 'english'
+
+MESSAGE_SEARCH_DDL['postgresql'] = [
+    "CREATE INDEX IF NOT EXISTS ix_messages_text_search ON messages "
+    f"USING gin (to_tsvector('{TEXT_SEARCH_CONFIG}', text))",
+]
+
+MESSAGE_SEARCH_DDL['sqlite'] = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS messages_fts USING fts5("
+    "text, content='messages', content_rowid='id', "
+    "tokenize='porter unicode61')",
+    "CREATE TRIGGER IF NOT EXISTS messages_fts_insert "
+    "AFTER INSERT ON messages BEGIN "
+    "INSERT INTO messages_fts (rowid, text) VALUES (new.id, new.text); "
+    "END",
+    "CREATE TRIGGER IF NOT EXISTS messages_fts_delete "
+    "AFTER DELETE ON messages BEGIN "
+    "INSERT INTO messages_fts (messages_fts, rowid, text) "
+    "VALUES ('delete', old.id, old.text); "
+    "END",
+    "CREATE TRIGGER IF NOT EXISTS messages_fts_update "
+    "AFTER UPDATE OF text ON messages BEGIN "
+    "INSERT INTO messages_fts (messages_fts, rowid, text) "
+    "VALUES ('delete', old.id, old.text); "
+    "INSERT INTO messages_fts (rowid, text) VALUES (new.id, new.text); "
+    "END",
+]
+
+for dialect, statements in MESSAGE_SEARCH_DDL.items():
+    for ddl in statements:
+        event.listen(messages, 'after_create',
+                     DDL(ddl).execute_if(dialect=dialect))
+
+event.listen(messages, 'before_drop',
+             DDL("DROP TABLE IF EXISTS messages_fts").execute_if(dialect='sqlite'))
+
+messages_fts = db.table('messages_fts', db.column('rowid'))
+
+
+def create_search_indexes(connection):
+    """Add the search indexes to existing users and messages tables.
+
+    On SQLite the full-text tables are then rebuilt from their content
+    tables, since the sync triggers only see rows written from now on.
+    """
+
+    dialect = connection.dialect.name
+
+    for ddl in USER_SEARCH_DDL.get(dialect, []) + MESSAGE_SEARCH_DDL.get(dialect, []):
+        connection.execute(ddl)
+
+    if dialect == 'sqlite':
+        for name in ['users_fts', 'messages_fts']:
+            connection.execute(f"INSERT INTO {name} ({name}) VALUES ('rebuild')")
+
+
+def search_cursor(row):
+    """Encode the (relevance, timestamp, id) key of a search result."""
+
+    msg, relevance = row
+    return f"{relevance!r}_{msg.timestamp.isoformat()}_{msg.id}"
+
+
+def parse_search_cursor(cursor):
+    """Decode a search cursor; raises ValueError if it is malformed."""
+
+    relevance, timestamp, id = cursor.rsplit('_', 2)
+    return float(relevance), datetime.fromisoformat(timestamp), int(id)
+
+
+def search_messages(search, before=None, after=None,
+                    per_page=MESSAGES_PER_PAGE):
+    """Return a Page of messages matching every word of `search`.
+
+    Pages are keyed on (relevance, timestamp, id), most relevant first
+    and newest first among equally relevant messages.
+    """
+
+    words = search.split()
+    if not words:
+        return Page([])
+
+    if db.engine.dialect.name == 'sqlite':
+        phrase = ' '.join('"' + word.replace('"', '""') + '"' for word in words)
+        # bm25() is lower for better matches; negate it so larger is better.
+        relevance = -db.func.bm25(db.literal_column('messages_fts'))
+        query = (Message
+                 .query
+                 .join(messages_fts, messages_fts.c.rowid == Message.id)
+                 .filter(db.literal_column('messages_fts').op('MATCH')(phrase)))
+    else:
+        vector = db.func.to_tsvector(TEXT_SEARCH_CONFIG, Message.text)
+        tsquery = db.func.plainto_tsquery(TEXT_SEARCH_CONFIG, ' '.join(words))
+        # Normalization 16 divides by 1 + log(number of distinct words):
+        # like bm25() on SQLite, longer messages rank lower, but repeating
+        # a search word still counts for it.
+        relevance = db.func.ts_rank(vector, tsquery, 16)
+        query = Message.query.filter(vector.op('@@')(tsquery))
+
+    relevance = db.cast(relevance, db.Float)
+
+    page = paginate(query
+                    .add_columns(relevance)
+                    .options(db.joinedload(Message.user)),
+                    [relevance, Message.timestamp, Message.id],
+                    search_cursor,
+                    before=before, after=after, per_page=per_page)
+
+    page.items = [msg for msg, relevance in page.items]
+    return page
@@ -1,20 +1,270 @@
-"""Seed database with sample data from CSV Files."""
+"""Seed database with sample data from CSV Files.
 
-from csv import DictReader
-from app import db
-from models import User, Message, Follows
+    python seed.py                    # load the generator/*.csv files as-is
+    python seed.py --scale 1000       # load 1000 disjoint copies of them
 
+Rows are streamed in chunks rather than built up in memory. On Postgres
+each chunk is sent with COPY FROM STDIN; elsewhere it is an executemany
+batch. Secondary indexes (and, on SQLite, full-text sync triggers) are
+dropped for the load and rebuilt afterwards, then the derived data
+(counters and timelines) is recomputed in bulk. Timelines get the most
+recent TIMELINE_BACKFILL messages of each followed author, as a follow
+would, with their indexes likewise dropped until the rebuild is done.
+"""
 
-db.drop_all()
-db.create_all()
+import argparse
+import csv
+import io
+import time
+from contextlib import closing
+from itertools import islice
 
-with open('generator/users.csv') as users:
-    db.session.bulk_insert_mappings(User, DictReader(users))
+from app import app, db
+from models import User, Message, Follows, TimelineEntry
+import counters
+import migrations
+import timeline
 
-with open('generator/messages.csv') as messages:
-    db.session.bulk_insert_mappings(Message, DictReader(messages))
+USERS_CSV = 'generator/users.csv'
+MESSAGES_CSV = 'generator/messages.csv'
+FOLLOWS_CSV = 'generator/follows.csv'
 
-with open('generator/follows.csv') as follows:
-    db.session.bulk_insert_mappings(Follows, DictReader(follows))
+CHUNK_SIZE = 10000
 
-db.session.commit()
+USER_COLUMNS = ['id', 'email', 'username', 'image_url', 'password', 'bio',
+                'header_image_url', 'location']
+MESSAGE_COLUMNS = ['text', 'timestamp', 'user_id']
+FOLLOW_COLUMNS = ['user_being_followed_id', 'user_following_id']
+
+
+##############################################################################
+# Row sources
+
+
+def read_csv(path):
+    """Stream the rows of a CSV file as dicts."""
+
+    with open(path) as f:
+        yield from csv.DictReader(f)
+
+
+def count_rows(path):
+    with open(path) as f:
+        return sum(1 for _ in f) - 1
+
+
+def scaled_users(scale, path=USERS_CSV):
+    """Users from `path`, repeated `scale` times with unique names/emails.
+
+    Copy `r` of CSV row `i` gets id r * len(csv) + i + 1, so ids line up
+    with the user ids that messages and follows refer to.
+    """
+
+    num_users = count_rows(path)
+
+    for r in range(scale):
+        for i, row in enumerate(read_csv(path)):
+            if r:
+                local, domain = row['email'].split('@', 1)
+                row['email'] = f"{local}+{r}@{domain}"
+                row['username'] = f"{row['username']}_{r}"
+            row['id'] = r * num_users + i + 1
+            yield row
+
+
+def scaled_messages(scale, path=MESSAGES_CSV, num_users=None):
+    """Messages from `path`, repeated for each copy of the users."""
+
+    num_users = num_users or count_rows(USERS_CSV)
+
+    for r in range(scale):
+        for row in read_csv(path):
+            row['user_id'] = int(row['user_id']) + r * num_users
+            yield row
+
+
+def scaled_follows(scale, path=FOLLOWS_CSV, num_users=None):
+    """Follows from `path`, repeated within each copy of the users."""
+
+    num_users = num_users or count_rows(USERS_CSV)
+
+    for r in range(scale):
+        for row in read_csv(path):
+            offset = r * num_users
+            yield dict(
+                user_being_followed_id=int(row['user_being_followed_id']) + offset,
+                user_following_id=int(row['user_following_id']) + offset,
+            )
+
+
+##############################################################################
+# Loading
+
+
+def chunks(rows, size):
+    rows = iter(rows)
+    while True:
+        chunk = list(islice(rows, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def copy_chunk(connection, table, columns, chunk):
+    """Send one chunk of rows to Postgres with COPY FROM STDIN."""
+
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for row in chunk:
+        writer.writerow(['' if row.get(c) is None else row[c] for c in columns])
+    buffer.seek(0)
+
+    with connection.connection.cursor() as cursor:
+        cursor.copy_expert(
+            f"COPY {table.name} ({', '.join(columns)}) "
+            "FROM STDIN WITH (FORMAT csv)",
+            buffer)
+
+
+def insert_chunk(connection, table, columns, chunk):
+    """Send one chunk of rows as a single DB-API executemany batch."""
+
+    marker = '?' if connection.dialect.paramstyle == 'qmark' else '%s'
+
+    with closing(connection.connection.cursor()) as cursor:
+        cursor.executemany(
+            f"INSERT INTO {table.name} ({', '.join(columns)}) "
+            f"VALUES ({', '.join(marker for c in columns)})",
+            [tuple(row.get(c) for c in columns) for row in chunk])
+
+
+def load_table(connection, table, columns, rows, chunk_size=CHUNK_SIZE):
+    """Stream `rows` into `table`; returns the number of rows loaded."""
+
+    if connection.dialect.name == 'postgresql':
+        load_chunk = copy_chunk
+    else:
+        load_chunk = insert_chunk
+
+    loaded = 0
+    for chunk in chunks(rows, chunk_size):
+        load_chunk(connection, table, columns, chunk)
+        loaded += len(chunk)
+
+    return loaded
+
+
+def drop_secondary_indexes(connection, tables):
+    """Drop indexes (and SQLite triggers) that slow bulk loads down.
+
+    Returns the DDL needed to put them back. Indexes that back a primary
+    key or unique constraint are left alone.
+    """
+
+    names = [table.name for table in tables]
+
+    if connection.dialect.name == 'postgresql':
+        rows = connection.execute(db.text(
+            "SELECT 'index', i.relname, pg_get_indexdef(i.oid) "
+            "FROM pg_index x "
+            "JOIN pg_class i ON i.oid = x.indexrelid "
+            "JOIN pg_class t ON t.oid = x.indrelid "
+            "WHERE t.relname = ANY(:tables) "
+            "AND NOT EXISTS "
+            "(SELECT 1 FROM pg_constraint c WHERE c.conindid = x.indexrelid)"
+        ), tables=names).fetchall()
+    else:
+        rows = connection.execute(db.text(
+            "SELECT type, name, sql FROM sqlite_master "
+            "WHERE type IN ('index', 'trigger') AND sql IS NOT NULL "
+            f"AND tbl_name IN ({', '.join(repr(n) for n in names)})"
+        )).fetchall()
+
+    for kind, name, sql in rows:
+        connection.execute(f"DROP {kind.upper()} {name}")
+
+    return [sql for kind, name, sql in rows]
+
+
+def restore_secondary_indexes(connection, ddl):
+    """Recreate what drop_secondary_indexes() dropped."""
+
+    for sql in ddl:
+        connection.execute(sql)
+
+    triggers = any(sql.upper().startswith('CREATE TRIGGER') for sql in ddl)
+
+    if connection.dialect.name == 'sqlite' and triggers:
+        # Full-text tables missed the rows loaded while triggers were off.
+        fts_tables = connection.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'table' "
+            "AND sql LIKE 'CREATE VIRTUAL TABLE%USING fts5%'").fetchall()
+        for (name,) in fts_tables:
+            connection.execute(f"INSERT INTO {name} ({name}) VALUES ('rebuild')")
+
+
+def seed(users, messages, follows, chunk_size=CHUNK_SIZE, log=print):
+    """Recreate the schema and load the given row iterables into it."""
+
+    db.drop_all()
+    migrations.upgrade()
+
+    tables = [User.__table__, Message.__table__, Follows.__table__]
+
+    with db.engine.begin() as connection:
+        started = time.perf_counter()
+
+        def step(message):
+            log(f"[{time.perf_counter() - started:8.1f}s] {message}")
+
+        ddl = drop_secondary_indexes(connection, tables)
+        step(f"Dropped {len(ddl)} indexes/triggers")
+
+        for table, columns, rows in [
+            (User.__table__, USER_COLUMNS, users),
+            (Message.__table__, MESSAGE_COLUMNS, messages),
+            (Follows.__table__, FOLLOW_COLUMNS, follows),
+        ]:
+            loaded = load_table(connection, table, columns, rows, chunk_size)
+            step(f"Loaded {loaded} rows into {table.name}")
+
+        if connection.dialect.name == 'postgresql':
+            connection.execute(
+                "SELECT setval(pg_get_serial_sequence('users', 'id'), "
+                "(SELECT coalesce(max(id), 1) FROM users))")
+
+        restore_secondary_indexes(connection, ddl)
+        step("Rebuilt indexes")
+
+    counters.reconcile()
+    db.session.commit()
+    log("Reconciled counters")
+
+    # Building the indexes once afterwards beats updating them per row.
+    connection = db.session.connection()
+    ddl = drop_secondary_indexes(connection, [TimelineEntry.__table__])
+    timeline.rebuild()
+    restore_secondary_indexes(connection, ddl)
+    db.session.commit()
+    log("Rebuilt timelines")
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Seed the database with the generator CSVs.")
+    parser.add_argument('--scale', type=int, default=1,
+                        help="number of disjoint copies of the CSV data to load")
+    parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE)
+    args = parser.parse_args()
+
+    num_users = count_rows(USERS_CSV)
+
+    with app.app_context():
+        seed(scaled_users(args.scale),
+             scaled_messages(args.scale, num_users=num_users),
+             scaled_follows(args.scale, num_users=num_users),
+             chunk_size=args.chunk_size)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,33 @@
+"""Streamed template rendering for Warbler.
+
+`stream_template()` is `render_template()` for long pages: the response
+body is generated as the client reads it, so the page head goes out
+before the page's rows are even queried, and rows fetched in batches (see
+pagination.StreamedPage) never have to be in memory all at once.
+
+Views stream when the STREAM_TEMPLATES config value is set. A streamed
+response is committed to its status and headers before the template
+runs, so it can carry no ETag (see httpcache.py) and an error half way
+through cuts the page short instead of showing an error page.
+"""
+
+from flask import Response, current_app, stream_with_context
+
+# Template output events sent to the client per chunk.
+STREAM_BUFFER_SIZE = 8
+
+
+def streaming_enabled():
+    return current_app.config.get('STREAM_TEMPLATES', False)
+
+
+def stream_template(template_name, **context):
+    """Return a Response that renders `template_name` as it is sent."""
+
+    app = current_app._get_current_object()
+    app.update_template_context(context)
+
+    stream = app.jinja_env.get_template(template_name).stream(context)
+    stream.enable_buffering(STREAM_BUFFER_SIZE)
+
+    return Response(stream_with_context(stream), mimetype='text/html')
@@ -0,0 +1,173 @@
+"""JSON API tests."""
+
+from datetime import datetime, timedelta
+from unittest import TestCase
+
+from app import app, CURR_USER_KEY
+from models import db, User, Message, Follows, Likes
+import api
+import counters
+from pagination import message_cursor
+import timeline
+from test_query_counts import count_queries
+
+app.config['SQLALCHEMY_DATABASE_URI'] = 'postgresql:///warbler-test'
+app.config['SQLALCHEMY_ECHO'] = False
+app.config['TESTING'] = True
+
+
+class APITestCase(TestCase):
+    """Tests for the /api/v1 endpoints."""
+
+    def setUp(self):
+        """Create a viewer following two authors, with a liked message."""
+
+        db.drop_all()
+        db.create_all()
+
+        self.client = app.test_client()
+
+        for user_id, username in [(1, "viewer"), (2, "alice"), (3, "bob")]:
+            db.session.add(User(id=user_id, username=username,
+                                email=f"{username}@test.com",
+                                password="HASHED_PASSWORD"))
+        db.session.flush()
+        db.session.add_all([
+            Follows(user_being_followed_id=2, user_following_id=1),
+            Follows(user_being_followed_id=3, user_following_id=1),
+        ])
+
+        start = datetime(2020, 1, 1)
+        for i in range(5):
+            db.session.add(Message(id=10 + i, text=f"warble {i}",
+                                   timestamp=start + timedelta(minutes=i),
+                                   user_id=2 + i % 2))
+        db.session.flush()
+        db.session.add(Likes(user_id=1, message_id=14))
+        db.session.commit()
+
+        counters.reconcile()
+        timeline.rebuild()
+        db.session.commit()
+
+    def tearDown(self):
+        """Clean up fouled transactions."""
+
+        res = super().tearDown()
+        db.session.rollback()
+        return res
+
+    def login(self, client, user_id=1):
+        with client.session_transaction() as sess:
+            sess[CURR_USER_KEY] = user_id
+
+    def test_timeline_requires_login(self):
+        res = self.client.get("/api/v1/timeline")
+
+        self.assertEqual(res.status_code, 401)
+        self.assertEqual(res.get_json(), {'error': "Login required."})
+
+    def test_timeline_pages(self):
+        with self.client as client:
+            self.login(client)
+
+            res = client.get("/api/v1/timeline")
+            data = res.get_json()
+
+            self.assertEqual(res.status_code, 200)
+            self.assertEqual([m['id'] for m in data['items']],
+                             [14, 13, 12, 11, 10])
+            self.assertEqual(data['items'][0]['user']['username'], "alice")
+            self.assertTrue(data['items'][0]['liked'])
+            self.assertFalse(data['items'][1]['liked'])
+            self.assertIsNone(data['next'])
+
+    def test_timeline_cursor(self):
+        cursor = message_cursor(Message.query.get(13))
+
+        with self.client as client:
+            self.login(client)
+            res = client.get("/api/v1/timeline", query_string={'before': cursor})
+
+        data = res.get_json()
+        self.assertEqual([m['id'] for m in data['items']], [12, 11, 10])
+        self.assertEqual(data['prev'], {'after': message_cursor(
+            Message.query.get(12))})
+
+    def test_bad_cursor(self):
+        with self.client as client:
+            self.login(client)
+            res = client.get("/api/v1/timeline?before=nonsense")
+
+        self.assertEqual(res.status_code, 400)
+        self.assertIn('error', res.get_json())
+
+    def test_users_batch(self):
+        """Users come back in the order asked for; unknown ids are skipped."""
+
+        with count_queries() as statements:
+            res = self.client.get("/api/v1/users?ids=3,99,1")
+
+        data = res.get_json()
+        self.assertEqual([u['id'] for u in data['items']], [3, 1])
+        self.assertEqual(data['items'][1]['following_count'], 2)
+        self.assertEqual(len(statements), 1)
+
+    def test_users_batch_limits(self):
+        res = self.client.get("/api/v1/users?ids=1,x")
+        self.assertEqual(res.status_code, 400)
+
+        ids = ','.join(str(i) for i in range(api.MAX_BATCH_SIZE + 1))
+        res = self.client.get(f"/api/v1/users?ids={ids}")
+        self.assertEqual(res.status_code, 400)
+
+    def test_users_search(self):
+        res = self.client.get("/api/v1/users?q=ali")
+        self.assertEqual([u['username'] for u in res.get_json()['items']],
+                         ["alice"])
+
+    def test_user_profile(self):
+        res = self.client.get("/api/v1/users/2")
+        data = res.get_json()
+
+        self.assertEqual(data['username'], "alice")
+        self.assertEqual(data['messages_count'], 3)
+        self.assertNotIn('password', data)
+        self.assertNotIn('email', data)
+
+        res = self.client.get("/api/v1/users/99")
+        self.assertEqual(res.status_code, 404)
+        self.assertIn('error', res.get_json())
+
+    def test_user_messages(self):
+        res = self.client.get("/api/v1/users/3/messages")
+        self.assertEqual([m['id'] for m in res.get_json()['items']], [13, 11])
+
+    def test_following_and_followers(self):
+        with self.client as client:
+            self.login(client)
+
+            res = client.get("/api/v1/users/1/following")
+            self.assertEqual([u['id'] for u in res.get_json()['items']], [2, 3])
+
+            res = client.get("/api/v1/users/2/followers")
+            self.assertEqual([u['id'] for u in res.get_json()['items']], [1])
+
+    def test_likes(self):
+        with self.client as client:
+            self.login(client)
+            res = client.get("/api/v1/users/1/likes")
+
+        self.assertEqual([m['id'] for m in res.get_json()['items']], [14])
+
+    def test_messages_batch(self):
+        with self.client as client:
+            self.login(client)
+            res = client.get("/api/v1/messages?ids=14,10")
+
+        items = res.get_json()['items']
+        self.assertEqual([m['id'] for m in items], [14, 10])
+        self.assertEqual([m['liked'] for m in items], [True, False])
+
+        res = self.client.get("/api/v1/messages")
+        self.assertEqual(res.status_code, 400)
@@ -0,0 +1,178 @@
+"""ASGI entry point tests."""
+
+import asyncio
+import threading
+from unittest import TestCase
+
+from app import app, CURR_USER_KEY
+from models import db, User, Message
+import asgi
+import timeline
+
+app.config['SQLALCHEMY_DATABASE_URI'] = 'postgresql:///warbler-test'
+app.config['SQLALCHEMY_ECHO'] = False
+app.config['TESTING'] = True
+app.config['WTF_CSRF_ENABLED'] = False
+
+
+def call(application, method, path, body=b'', headers=(), chunks=1,
+         disconnect=False):
+    """Make one request; returns (status, headers dict, body chunks).
+
+    With `disconnect`, the client goes away instead of sending the last
+    chunk; returns None if no response was sent.
+    """
+
+    size = max(1, -(-len(body) // chunks))
+    parts = [body[i:i + size] for i in range(0, len(body), size)] or [b'']
+    incoming = [{'type': 'http.request', 'body': part,
+                 'more_body': i < len(parts) - 1}
+                for i, part in enumerate(parts)]
+    if disconnect:
+        incoming[-1] = {'type': 'http.disconnect'}
+    sent = []
+
+    async def receive():
+        return incoming.pop(0)
+
+    async def send(message):
+        sent.append(message)
+
+    path, _, query = path.partition('?')
+    scope = {
+        'type': 'http', 'http_version': '1.1', 'method': method,
+        'scheme': 'http', 'path': path, 'root_path': '',
+        'query_string': query.encode(), 'server': ('testserver', 80),
+        'client': ('127.0.0.1', 5000),
+        'headers': [(name.lower().encode(), value.encode())
+                    for name, value in headers],
+    }
+    asyncio.run(application(scope, receive, send))
+
+    if not sent:
+        return None
+
+    start = sent[0]
+    return (start['status'],
+            {name.decode(): value.decode() for name, value in start['headers']},
+            [message['body'] for message in sent[1:]])
+
+
+class ASGITestCase(TestCase):
+    """Requests served through asgi.ASGIApp."""
+
+    def setUp(self):
+        db.drop_all()
+        db.create_all()
+
+        db.session.add(User(id=1, username="viewer", email="viewer@test.com",
+                            password="HASHED_PASSWORD"))
+        db.session.flush()
+        db.session.add(Message(id=10, text="hello from asgi", user_id=1))
+        db.session.flush()
+        timeline.rebuild()
+        db.session.commit()
+
+        self.application = asgi.ASGIApp(app, read_threads=2, threads=2)
+
+        # A session cookie for user 1.
+        serializer = app.session_interface.get_signing_serializer(app)
+        self.cookie = ("Cookie",
+                       f"session={serializer.dumps({CURR_USER_KEY: 1})}")
+
+    def tearDown(self):
+        app.config['STREAM_TEMPLATES'] = False
+        db.session.rollback()
+
+    def test_get(self):
+        status, headers, body = call(self.application, 'GET', "/messages/10")
+
+        self.assertEqual(status, 200)
+        self.assertTrue(headers['content-type'].startswith("text/html"))
+        self.assertIn(b"hello from asgi", b"".join(body))
+        self.assertEqual(body[-1], b"")
+
+    def test_same_as_wsgi(self):
+        expected = app.test_client().get("/users/1?x=1").get_data()
+        status, headers, body = call(self.application, 'GET', "/users/1?x=1")
+        self.assertEqual(b"".join(body), expected)
+
+    def test_post(self):
+        status, headers, body = call(
+            self.application, 'POST', "/messages/new",
+            body=b"text=posted+over+asgi", chunks=3,
+            headers=[("Content-Type", "application/x-www-form-urlencoded"),
+                     self.cookie])
+
+        self.assertEqual(status, 302)
+        self.assertEqual(headers['location'], "http://testserver/users/1")
+        self.assertEqual(Message.query.filter_by(text="posted over asgi")
+                         .count(), 1)
+
+    def test_streamed(self):
+        app.config['STREAM_TEMPLATES'] = True
+        status, headers, body = call(self.application, 'GET', "/", headers=[
+            self.cookie])
+
+        self.assertEqual(status, 200)
+        self.assertGreater(len(body), 2)
+        self.assertIn(b"hello from asgi", b"".join(body))
+
+    def test_split_cookie_header(self):
+        environ = asgi.build_environ({
+            'method': 'GET', 'path': "/", 'query_string': b'',
+            'http_version': '2',
+            'headers': [(b'cookie', b'a=1'), (b'cookie', b'b=2'),
+                        (b'accept', b'text/html'), (b'accept', b'*/*')],
+        }, b'')
+
+        self.assertEqual(environ['HTTP_COOKIE'], "a=1; b=2")
+        self.assertEqual(environ['HTTP_ACCEPT'], "text/html,*/*")
+
+    def test_disconnect(self):
+        result = call(self.application, 'POST', "/messages/new",
+                      body=b"text=posted+over+asgi", chunks=3, disconnect=True,
+                      headers=[("Content-Type",
+                                "application/x-www-form-urlencoded"),
+                               self.cookie])
+
+        self.assertIsNone(result)
+        self.assertEqual(Message.query.count(), 1)
+
+    def test_body_too_large(self):
+        status, headers, body = call(self.application, 'POST', "/login",
+                                     body=b"x" * (asgi.MAX_BODY_SIZE + 1),
+                                     chunks=4)
+        self.assertEqual(status, 413)
+
+    def test_read_pool(self):
+        read = self.application.read_pool
+        other = self.application.pool
+
+        for method, path, pool in [('GET', "/", read),
+                                   ('GET', "/users/1", read),
+                                   ('GET', "/messages/10", read),
+                                   ('GET', "/users", read),
+                                   ('GET', "/users/1/likes", other),
+                                   ('POST', "/login", other),
+                                   ('GET', "/nowhere", other)]:
+            self.assertIs(
+                self.application.executor_for({'path': path,
+                                               'method': method}),
+                pool, path)
+
+    def test_runs_on_pool_threads(self):
+        names = []
+
+        @app.before_request
+        def record_thread():
+            names.append(threading.current_thread().name)
+
+        try:
+            call(self.application, 'GET', "/users/1")
+            call(self.application, 'GET', "/login")
+        finally:
+            app.before_request_funcs[None].remove(record_thread)
+
+        self.assertTrue(names[0].startswith("warbler-read"))
+        self.assertFalse(names[1].startswith("warbler-read"))
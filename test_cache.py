@@ -0,0 +1,117 @@
+"""Cache tests."""
+
+from unittest import TestCase
+
+from app import app, CURR_USER_KEY
+from cache import LRUCache
+from models import db, User
+from test_query_counts import count_queries
+
+app.config['SQLALCHEMY_DATABASE_URI'] = 'postgresql:///warbler-test'
+app.config['SQLALCHEMY_ECHO'] = False
+app.config['TESTING'] = True
+app.config['WTF_CSRF_ENABLED'] = False
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0
+
+    def __call__(self):
+        return self.now
+
+
+class LRUCacheTestCase(TestCase):
+    """Tests for the in-process LRU backend."""
+
+    def test_evicts_least_recently_used(self):
+        lru = LRUCache(maxsize=2)
+        lru.set('a', 1)
+        lru.set('b', 2)
+        lru.get('a')
+        lru.set('c', 3)
+
+        self.assertEqual(lru.get('a'), 1)
+        self.assertIsNone(lru.get('b'))
+        self.assertEqual(lru.get('c'), 3)
+
+    def test_expires_after_ttl(self):
+        clock = FakeClock()
+        lru = LRUCache(ttl=10, clock=clock)
+        lru.set('a', 1)
+
+        clock.now = 9
+        self.assertEqual(lru.get('a'), 1)
+        clock.now = 10
+        self.assertIsNone(lru.get('a'))
+        self.assertEqual(len(lru), 0)
+
+
+class UserCacheTestCase(TestCase):
+    """Tests for caching the logged-in user between requests."""
+
+    def setUp(self):
+        db.drop_all()
+        db.create_all()
+
+        self.client = app.test_client()
+
+        self.user = User.signup("cached", "cached@test.com", "password", None)
+        self.user.id = 4242
+        db.session.commit()
+
+    def tearDown(self):
+        """Clean up fouled transactions."""
+
+        res = super().tearDown()
+        db.session.rollback()
+        return res
+
+    def test_warm_cache_skips_user_query(self):
+        with self.client as client:
+            with client.session_transaction() as sess:
+                sess[CURR_USER_KEY] = 4242
+
+            client.get("/messages/new")
+
+            with count_queries() as statements:
+                res = client.get("/messages/new")
+
+            self.assertEqual(res.status_code, 200)
+            self.assertIn('alt="cached"', str(res.data))
+            self.assertEqual(statements, [])
+
+    def test_profile_update_invalidates(self):
+        with self.client as client:
+            with client.session_transaction() as sess:
+                sess[CURR_USER_KEY] = 4242
+
+            client.get("/messages/new")
+            client.post("/users/profile", data={
+                "username": "renamed",
+                "email": "cached@test.com",
+                "image_url": "",
+                "header_image_url": "",
+                "bio": "",
+                "password": "password",
+            })
+
+            res = client.get("/messages/new")
+            self.assertIn('alt="renamed"', str(res.data))
+            self.assertNotIn('alt="cached"', str(res.data))
+
+    def test_follow_invalidates_counters(self):
+        other = User(id=4343, username="other", email="other@test.com",
+                     password="HASHED_PASSWORD")
+        db.session.add(other)
+        db.session.commit()
+
+        with self.client as client:
+            with client.session_transaction() as sess:
+                sess[CURR_USER_KEY] = 4242
+
+            client.get("/")
+            client.post("/users/follow/4343")
+
+            res = client.get("/")
+            self.assertIn('/following"\n                >1<', res.data.decode())
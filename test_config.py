@@ -0,0 +1,49 @@
+"""Config profile tests."""
+
+from unittest import TestCase
+
+from sqlalchemy.engine.url import make_url
+
+from app import app, create_app
+from models import db
+import config
+import passwords
+
+
+class ConfigTestCase(TestCase):
+    """Tests for the config profiles and app factory."""
+
+    def test_profiles(self):
+        self.assertTrue(create_app('dev').config['SQLALCHEMY_ECHO'])
+        self.assertTrue(create_app('test').config['TESTING'])
+
+        prod = create_app('prod')
+        self.assertFalse(prod.config['SQLALCHEMY_ECHO'])
+        self.assertFalse(prod.config['DEBUG_TOOLBAR'])
+
+        with self.assertRaises(ValueError):
+            create_app('staging')
+
+    def test_apps_independent(self):
+        hasher = passwords.get_hasher(app)
+        cache = app.extensions['user_cache']
+
+        prod = create_app('prod')
+
+        self.assertIs(db.get_app(), app)
+        self.assertIs(passwords.get_hasher(app), hasher)
+        self.assertIsNot(passwords.get_hasher(prod), hasher)
+        self.assertIsNot(prod.extensions['user_cache'], cache)
+
+    def test_pool_options(self):
+        prod = create_app('prod')
+
+        options = {}
+        db.apply_driver_hacks(prod, make_url('postgresql:///warbler'), options)
+        self.assertTrue(options['pool_pre_ping'])
+        self.assertEqual(options['pool_size'],
+                         config.ProductionConfig.DATABASE_POOL_OPTIONS['pool_size'])
+
+        options = {}
+        db.apply_driver_hacks(prod, make_url('sqlite:////tmp/warbler.db'), options)
+        self.assertNotIn('pool_size', options)
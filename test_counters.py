@@ -0,0 +1,135 @@
+"""Denormalized counter tests."""
+
+from unittest import TestCase
+
+from app import app, CURR_USER_KEY
+from models import db, User, Message, Follows, Likes
+import counters
+
+app.config['SQLALCHEMY_DATABASE_URI'] = 'postgresql:///warbler-test'
+app.config['SQLALCHEMY_ECHO'] = False
+app.config['TESTING'] = True
+app.config['WTF_CSRF_ENABLED'] = False
+
+
+class CountersTestCase(TestCase):
+    """Write routes keep the counter columns in step."""
+
+    def setUp(self):
+        """Create two users."""
+
+        db.drop_all()
+        db.create_all()
+
+        self.client = app.test_client()
+
+        db.session.add_all([
+            User(id=1, username="alice", email="alice@test.com",
+                 password="HASHED_PASSWORD"),
+            User(id=2, username="bob", email="bob@test.com",
+                 password="HASHED_PASSWORD"),
+        ])
+        db.session.commit()
+
+    def tearDown(self):
+        """Clean up fouled transactions."""
+
+        res = super().tearDown()
+        db.session.rollback()
+        return res
+
+    def login(self, client, user_id):
+        with client.session_transaction() as sess:
+            sess[CURR_USER_KEY] = user_id
+
+    def counts(self, user_id):
+        u = User.query.get(user_id)
+        return (u.messages_count, u.following_count,
+                u.followers_count, u.likes_count)
+
+    def test_message_and_like_counters(self):
+        with self.client as client:
+            self.login(client, 1)
+            client.post("/messages/new", data={"text": "Count me"})
+            msg = Message.query.one()
+            self.assertEqual(self.counts(1), (1, 0, 0, 0))
+
+            self.login(client, 2)
+            client.post(f"/users/add_like/{msg.id}")
+            self.assertEqual(self.counts(2), (0, 0, 0, 1))
+            self.assertEqual(Message.query.get(msg.id).likes_count, 1)
+
+            client.post(f"/users/add_like/{msg.id}")
+            self.assertEqual(self.counts(2), (0, 0, 0, 0))
+            self.assertEqual(Message.query.get(msg.id).likes_count, 0)
+
+            client.post(f"/users/add_like/{msg.id}")
+            self.login(client, 1)
+            client.post(f"/messages/{msg.id}/delete")
+            self.assertEqual(self.counts(1), (0, 0, 0, 0))
+            self.assertEqual(self.counts(2), (0, 0, 0, 0))
+
+    def test_follow_counters(self):
+        with self.client as client:
+            self.login(client, 1)
+            client.post("/users/follow/2")
+            self.assertEqual(self.counts(1), (0, 1, 0, 0))
+            self.assertEqual(self.counts(2), (0, 0, 1, 0))
+
+            client.post("/users/stop-following/2")
+            self.assertEqual(self.counts(1), (0, 0, 0, 0))
+            self.assertEqual(self.counts(2), (0, 0, 0, 0))
+
+    def test_delete_user_counters(self):
+        db.session.add(User(id=3, username="carol", email="carol@test.com",
+                            password="HASHED_PASSWORD"))
+        db.session.commit()
+
+        with self.client as client:
+            self.login(client, 1)
+            client.post("/messages/new", data={"text": "By alice"})
+            client.post("/users/follow/2")
+
+            self.login(client, 2)
+            client.post("/messages/new", data={"text": "By bob, 1"})
+            client.post("/messages/new", data={"text": "By bob, 2"})
+            client.post("/users/follow/3")
+            mine, *bobs = [m.id for m in Message.query.order_by(Message.id)]
+            client.post(f"/users/add_like/{mine}")
+
+            self.login(client, 1)
+            for msg_id in bobs:
+                client.post(f"/users/add_like/{msg_id}")
+            self.login(client, 3)
+            client.post(f"/users/add_like/{bobs[0]}")
+
+            self.assertEqual(self.counts(1), (1, 1, 0, 2))
+            self.assertEqual(self.counts(3), (0, 0, 1, 1))
+            self.assertEqual(Message.query.get(mine).likes_count, 1)
+
+            self.login(client, 2)
+            client.post("/users/delete")
+
+        self.assertIsNone(User.query.get(2))
+        self.assertEqual(self.counts(1), (1, 0, 0, 0))
+        self.assertEqual(self.counts(3), (0, 0, 0, 0))
+        self.assertEqual(Message.query.get(mine).likes_count, 0)
+
+    def test_reconcile(self):
+        db.session.add_all([
+            Message(id=10, text="one", user_id=1),
+            Message(id=11, text="two", user_id=1),
+            Follows(user_being_followed_id=1, user_following_id=2),
+        ])
+        db.session.flush()
+        db.session.add(Likes(user_id=2, message_id=10))
+        db.session.commit()
+        self.assertEqual(self.counts(1), (0, 0, 0, 0))
+
+        counters.reconcile()
+        db.session.commit()
+
+        self.assertEqual(self.counts(1), (2, 0, 1, 0))
+        self.assertEqual(self.counts(2), (0, 1, 0, 1))
+        self.assertEqual(Message.query.get(10).likes_count, 1)
+        self.assertEqual(Message.query.get(11).likes_count, 0)
@@ -0,0 +1,177 @@
+"""EXPLAIN tests: hot-path queries are answered from indexes.
+
+Each test runs a hot path, captures the SQL it issues and asks the
+database for the plan of every statement. A full table scan in any of
+them fails the test. On Postgres sequential scans are switched off for
+the EXPLAIN, so a plan only contains one if no index could serve it.
+"""
+
+import re
+from contextlib import closing, contextmanager
+from unittest import TestCase
+
+from sqlalchemy import event
+
+from app import app
+from models import db, User, Message, Follows, Likes
+from pagination import parse_message_cursor
+import counters
+import queries
+import search
+import timeline
+
+app.config['SQLALCHEMY_DATABASE_URI'] = 'postgresql:///warbler-test'
+app.config['SQLALCHEMY_ECHO'] = False
+app.config['TESTING'] = True
+
+# SQLite reports full scans as "SCAN <table>"; constant rows and FTS
+# virtual tables are not table scans.
+SQLITE_SCAN = re.compile(r'^SCAN (?!CONSTANT ROW)(\w+)(?!.*VIRTUAL TABLE)')
+
+
+@contextmanager
+def capture_statements():
+    """Collect (statement, parameters) for each SQL statement in the block."""
+
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters,
+                              context, executemany):
+        if not executemany:
+            statements.append((statement, parameters))
+
+    event.listen(db.engine, 'before_cursor_execute', before_cursor_execute)
+    try:
+        yield statements
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', before_cursor_execute)
+
+
+def explain(statement, parameters):
+    """Return the lines of the query plan for `statement`."""
+
+    connection = db.session.connection()
+
+    with closing(connection.connection.cursor()) as cursor:
+        if connection.dialect.name == 'sqlite':
+            cursor.execute("EXPLAIN QUERY PLAN " + statement, parameters)
+        else:
+            cursor.execute("SET LOCAL enable_seqscan = off")
+            cursor.execute("EXPLAIN " + statement, parameters)
+
+        return [row[-1] for row in cursor.fetchall()]
+
+
+def full_scans(plan):
+    """Return the lines of `plan` that read a whole table."""
+
+    if db.engine.dialect.name == 'sqlite':
+        return [line for line in plan if SQLITE_SCAN.match(line)]
+
+    return [line for line in plan if 'Seq Scan on' in line]
+
+
+class ExplainTestCase(TestCase):
+    """Hot-path queries must not regress to sequential scans."""
+
+    def setUp(self):
+        db.drop_all()
+        db.create_all()
+
+        for user_id in [1, 2, 3]:
+            db.session.add(User(id=user_id, username=f"user{user_id}",
+                                email=f"user{user_id}@test.com",
+                                password="HASHED_PASSWORD"))
+        db.session.flush()
+
+        db.session.add(Follows(user_being_followed_id=2, user_following_id=1))
+        db.session.add(Follows(user_being_followed_id=1, user_following_id=3))
+
+        for message_id in range(1, 7):
+            db.session.add(Message(id=message_id, text=f"warble {message_id}",
+                                   user_id=2 if message_id % 2 else 3))
+        db.session.flush()
+
+        db.session.add(Likes(user_id=1, message_id=1))
+        db.session.add(Likes(user_id=3, message_id=1))
+
+        db.session.commit()
+        timeline.rebuild()
+        db.session.commit()
+
+    def tearDown(self):
+        """Clean up fouled transactions."""
+
+        res = super().tearDown()
+        db.session.rollback()
+        return res
+
+    @contextmanager
+    def assert_indexed(self):
+        """Fail if any statement run in the block scans a table."""
+
+        with capture_statements() as statements:
+            yield
+
+        self.assertTrue(statements)
+
+        for statement, parameters in statements:
+            self.assertEqual(full_scans(explain(statement, parameters)), [],
+                             statement)
+
+    def test_user_messages_page(self):
+        with self.assert_indexed():
+            page = queries.user_messages_page(2, per_page=2)
+            before = parse_message_cursor(page.next['before'])
+            queries.user_messages_page(2, before=before, per_page=2)
+
+    def test_timeline_page(self):
+        with self.assert_indexed():
+            page = timeline.timeline_page(1, per_page=2)
+            before = parse_message_cursor(page.next['before'])
+            timeline.timeline_page(1, before=before, per_page=2)
+
+    def test_liked_ids(self):
+        messages = Message.query.all()
+
+        with self.assert_indexed():
+            queries.liked_ids(1, messages)
+
+    def test_relationship_pages(self):
+        with self.assert_indexed():
+            queries.followers_page(1)
+            queries.following_page(1)
+            queries.liked_messages_page(1)
+
+    def test_like_probe(self):
+        with self.assert_indexed():
+            Likes.query.filter_by(message_id=1, user_id=1).first()
+
+    def test_follow_lookups(self):
+        user = User.query.get(1)
+
+        with self.assert_indexed():
+            user.following
+            user.followers
+
+    def test_timeline_fan_out(self):
+        msg = Message(id=7, text="warble 7", user_id=2)
+        db.session.add(msg)
+        db.session.flush()
+
+        with self.assert_indexed():
+            timeline.push_message(msg)
+            timeline.backfill(3, 2)
+            timeline.prune(3, 2)
+
+    def test_message_delete(self):
+        msg = Message.query.get(1)
+
+        with self.assert_indexed():
+            counters.message_deleted(msg)
+            timeline.remove_message(msg.id)
+
+    def test_search_users(self):
+        with self.assert_indexed():
+            search.search_users("user")
+            search.search_users("ser2")
@@ -0,0 +1,92 @@
+"""Fragment cache tests."""
+
+from unittest import TestCase
+
+from app import app, CURR_USER_KEY
+from models import db, User, Message, Likes
+import fragments
+
+app.config['SQLALCHEMY_DATABASE_URI'] = 'postgresql:///warbler-test'
+app.config['SQLALCHEMY_ECHO'] = False
+app.config['TESTING'] = True
+app.config['WTF_CSRF_ENABLED'] = False
+
+
+class FragmentCacheTestCase(TestCase):
+    """Cards are rendered once and reused until their rows change."""
+
+    def setUp(self):
+        db.drop_all()
+        db.create_all()
+
+        db.session.add_all([
+            User(id=1, username="viewer", email="viewer@test.com",
+                 password="HASHED_PASSWORD"),
+            User(id=2, username="author", email="author@test.com",
+                 password="HASHED_PASSWORD"),
+        ])
+        db.session.flush()
+        db.session.add_all([
+            Message(id=10, text="liked warble", user_id=2),
+            Message(id=11, text="other warble", user_id=2),
+        ])
+        db.session.flush()
+        db.session.add(Likes(user_id=1, message_id=10))
+        db.session.commit()
+
+        self.client = app.test_client()
+        with self.client.session_transaction() as sess:
+            sess[CURR_USER_KEY] = 1
+
+        self.cache = app.extensions['fragment_cache']
+
+    def tearDown(self):
+        db.session.rollback()
+
+    def test_cards_are_reused(self):
+        self.client.get("/users/2")
+        self.assertIsNotNone(self.cache.get(('message', 10)))
+
+        # Tamper with the cached markup to show that it is what is served.
+        version, variants = self.cache.get(('message', 10))
+        self.cache.set(('message', 10), (version, {
+            flag: html.replace("liked warble", "from the cache")
+            for flag, html in variants.items()}))
+
+        html = self.client.get("/users/2").get_data(as_text=True)
+        self.assertIn("from the cache", html)
+
+    def test_viewer_flags(self):
+        html = self.client.get("/users/1/likes").get_data(as_text=True)
+        self.assertIn("btn-primary", html)
+
+        self.client.get("/messages/search?q=warble")
+
+        self.assertEqual(set(self.cache.get(('message', 10))[1]), {True})
+        self.assertEqual(set(self.cache.get(('message', 11))[1]), {False})
+
+    def test_changed_author(self):
+        self.client.get("/users/2")
+
+        user = User.query.get(2)
+        user.username = "renamed"
+        db.session.commit()
+
+        html = self.client.get("/users/2").get_data(as_text=True)
+        self.assertIn("@renamed", html)
+        self.assertNotIn("@author", html)
+
+    def test_invalidation(self):
+        self.client.get("/users")
+        self.assertIsNotNone(self.cache.get(('user', 2)))
+
+        with app.app_context():
+            fragments.invalidate_user(2)
+        self.assertIsNone(self.cache.get(('user', 2)))
+
+        self.client.get("/users/2")
+        with self.client.session_transaction() as sess:
+            sess[CURR_USER_KEY] = 2
+        self.client.post("/messages/11/delete")
+        self.assertIsNone(self.cache.get(('message', 11)))
+        self.assertIsNotNone(self.cache.get(('message', 10)))
@@ -0,0 +1,120 @@
+"""HTTP caching tests."""
+
+from unittest import TestCase
+
+from app import app, CURR_USER_KEY
+from models import db, User, Message
+import httpcache
+from test_query_counts import count_queries
+
+app.config['SQLALCHEMY_DATABASE_URI'] = 'postgresql:///warbler-test'
+app.config['SQLALCHEMY_ECHO'] = False
+app.config['TESTING'] = True
+app.config['WTF_CSRF_ENABLED'] = False
+
+
+class HTTPCacheTestCase(TestCase):
+    """Caching headers and conditional GETs."""
+
+    def setUp(self):
+        db.drop_all()
+        db.create_all()
+
+        db.session.add_all([
+            User(id=1, username="viewer", email="viewer@test.com",
+                 password="HASHED_PASSWORD"),
+            User(id=2, username="author", email="author@test.com",
+                 password="HASHED_PASSWORD"),
+        ])
+        db.session.flush()
+        db.session.add(Message(id=10, text="first warble", user_id=2))
+        db.session.commit()
+
+        self.client = app.test_client()
+
+    def tearDown(self):
+        db.session.rollback()
+
+    def log_in(self, user_id=1):
+        with self.client.session_transaction() as sess:
+            sess[CURR_USER_KEY] = user_id
+
+    def revalidate(self, url, res):
+        etag, weak = res.get_etag()
+        self.assertTrue(weak)
+        return self.client.get(url, headers={'If-None-Match': f'W/"{etag}"'})
+
+    def test_fingerprinted_static(self):
+        res = self.client.get("/login")
+        self.assertEqual(res.headers['Cache-Control'], 'no-store')
+
+        with app.test_request_context():
+            url = httpcache.static_url('stylesheets/style.css')
+        self.assertIn(url, res.get_data(as_text=True))
+
+        res = self.client.get(url)
+        self.assertEqual(res.status_code, 200)
+        self.assertIn('immutable', res.headers['Cache-Control'])
+        self.assertIn('max-age=31536000', res.headers['Cache-Control'])
+
+        # Outdated or missing fingerprints must be revalidated.
+        for url in ["/static/stylesheets/style.css?v=outdated",
+                    "/static/stylesheets/style.css"]:
+            res = self.client.get(url)
+            self.assertEqual(res.headers['Cache-Control'], 'public, no-cache')
+
+    def test_user_page_not_modified(self):
+        self.log_in()
+        res = self.client.get("/users/2")
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(res.headers['Cache-Control'], 'private, no-cache')
+
+        with count_queries() as statements:
+            again = self.revalidate("/users/2", res)
+
+        self.assertEqual(again.status_code, 304)
+        self.assertEqual(again.get_data(), b"")
+        self.assertEqual(again.get_etag(), res.get_etag())
+        self.assertLessEqual(len(statements), 3)
+
+    def test_user_page_changes(self):
+        self.log_in()
+        res = self.client.get("/users/2")
+
+        db.session.add(Message(id=11, text="second warble", user_id=2))
+        db.session.commit()
+        res = self.revalidate("/users/2", res)
+        self.assertEqual(res.status_code, 200)
+        self.assertIn("second warble", res.get_data(as_text=True))
+
+        self.client.post("/users/follow/2")
+        res = self.revalidate("/users/2", res)
+        self.assertEqual(res.status_code, 200)
+        self.assertIn("Unfollow", res.get_data(as_text=True))
+
+        self.assertEqual(self.revalidate("/users/2", res).status_code, 304)
+
+    def test_tag_varies_by_viewer(self):
+        anon = self.client.get("/users/2")
+
+        self.log_in()
+        self.assertEqual(self.revalidate("/users/2", anon).status_code, 200)
+
+    def test_message_page_not_modified(self):
+        self.log_in()
+        res = self.client.get("/messages/10")
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(self.revalidate("/messages/10", res).status_code, 304)
+
+        self.client.post("/users/follow/2")
+        self.assertEqual(self.revalidate("/messages/10", res).status_code, 200)
+
+    def test_no_tag_with_flashes(self):
+        self.log_in()
+        with self.client.session_transaction() as sess:
+            sess['_flashes'] = [('success', "Hello!")]
+
+        res = self.client.get("/users/2")
+        self.assertIn("Hello!", res.get_data(as_text=True))
+        self.assertIsNone(res.headers.get('ETag'))
+        self.assertEqual(res.headers['Cache-Control'], 'no-store')
@@ -0,0 +1,109 @@
+"""Request instrumentation tests."""
+
+import json
+from unittest import TestCase, skipUnless
+
+from app import app, CURR_USER_KEY
+from models import db, User, Message
+import instrumentation
+
+app.config['SQLALCHEMY_DATABASE_URI'] = 'postgresql:///warbler-test'
+app.config['SQLALCHEMY_ECHO'] = False
+app.config['TESTING'] = True
+
+
+class InstrumentationTestCase(TestCase):
+    """Per-request query counts, slow-query log and /__perf."""
+
+    def setUp(self):
+        db.drop_all()
+        db.create_all()
+
+        db.session.add(User(id=1, username="viewer", email="viewer@test.com",
+                            password="HASHED_PASSWORD"))
+        db.session.flush()
+        db.session.add_all([Message(text=f"warble {i}", user_id=1)
+                            for i in range(3)])
+        db.session.commit()
+
+        self.client = app.test_client()
+        with self.client.session_transaction() as sess:
+            sess[CURR_USER_KEY] = 1
+
+        app.extensions['route_stats'].clear()
+
+    def tearDown(self):
+        app.config['DEBUG'] = False
+        app.config['SLOW_QUERY_MS'] = instrumentation.SLOW_QUERY_MS
+        db.session.rollback()
+
+    def logged(self, records, event):
+        return [json.loads(record.getMessage()) for record in records
+                if json.loads(record.getMessage())['event'] == event]
+
+    def test_normalize(self):
+        self.assertEqual(
+            instrumentation.normalize(
+                "SELECT users.id  FROM users\n"
+                "WHERE users.id IN (?, ?, ?) AND users.username = 'bob'\n"
+                "LIMIT 101"),
+            "SELECT users.id FROM users WHERE users.id IN (?) "
+            "AND users.username = ? LIMIT ?")
+        self.assertEqual(
+            instrumentation.normalize(
+                "SELECT anon_1.id FROM messages AS anon_1 "
+                "WHERE anon_1.id = %(id_1)s"),
+            "SELECT anon_1.id FROM messages AS anon_1 WHERE anon_1.id = ?")
+
+    def test_debug_headers(self):
+        app.config['DEBUG'] = True
+        res = self.client.get("/users/1")
+
+        self.assertGreater(int(res.headers['X-DB-Queries']), 0)
+        self.assertTrue(res.headers['X-DB-Time'].endswith("ms"))
+        self.assertIn('X-DB-Rows', res.headers)
+
+    def test_request_log(self):
+        with self.assertLogs('warbler.perf', 'INFO') as logs:
+            res = self.client.get("/users/1")
+
+        self.assertNotIn('X-DB-Queries', res.headers)
+
+        [line] = self.logged(logs.records, 'request')
+        self.assertEqual(line['route'], "GET /users/<int:user_id>")
+        self.assertEqual(line['status'], 200)
+        self.assertGreater(line['queries'], 0)
+
+    def test_slow_query_log(self):
+        app.config['SLOW_QUERY_MS'] = 0
+
+        with self.assertLogs('warbler.perf', 'WARNING') as logs:
+            self.client.get("/users/1")
+
+        slow = self.logged(logs.records, 'slow_query')
+        self.assertTrue(slow)
+
+        messages = [line for line in slow
+                    if line['statement'].startswith("SELECT messages.")]
+        self.assertEqual(messages[0]['view'], 'views.users_show')
+        self.assertIn("app.py", messages[0]['call_site'])
+        self.assertIn("users_show > queries.py", messages[0]['call_site'])
+
+    def test_route_stats(self):
+        stats = instrumentation.RouteStats(maxlen=3)
+        for elapsed in [10, 20, 30, 40]:
+            stats.record("GET /", elapsed, 2)
+
+        self.assertEqual(stats.summary(), {"GET /": {
+            'requests': 3, 'p50_ms': 30, 'p95_ms': 40, 'mean_queries': 2}})
+
+    @skipUnless('perf' in app.view_functions, "PERF_ENDPOINT is off")
+    def test_perf_endpoint(self):
+        for _ in range(3):
+            self.client.get("/users/1")
+
+        perf = self.client.get("/__perf").get_json()
+        show = perf['routes']["GET /users/<int:user_id>"]
+        self.assertEqual(show['requests'], 3)
+        self.assertLessEqual(show['p50_ms'], show['p95_ms'])
+        self.assertEqual(perf['password_queue_depth'], 0)
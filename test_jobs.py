@@ -0,0 +1,183 @@
+"""Background job tests."""
+
+from datetime import datetime, timedelta
+from unittest import TestCase
+
+from app import app, CURR_USER_KEY
+from models import db, User, Message, Follows, Job
+import config
+import counters
+import jobs
+import relationships
+import timeline
+
+app.config['SQLALCHEMY_DATABASE_URI'] = 'postgresql:///warbler-test'
+app.config['SQLALCHEMY_ECHO'] = False
+app.config['TESTING'] = True
+app.config['WTF_CSRF_ENABLED'] = False
+
+calls = []
+
+
+@jobs.task('test.record')
+def record(value, failures=0):
+    """Fails the first `failures` times it is called with `value`."""
+
+    calls.append(value)
+    if calls.count(value) <= failures:
+        raise RuntimeError(f"failure {calls.count(value)}")
+
+
+class JobsTestCase(TestCase):
+    """Jobs recorded by writes and run by a worker."""
+
+    def setUp(self):
+        app.config['JOBS_INLINE'] = False
+        calls.clear()
+
+        db.drop_all()
+        db.create_all()
+
+        db.session.add_all([
+            User(id=1, username="author", email="author@test.com",
+                 password="HASHED_PASSWORD"),
+            User(id=2, username="follower", email="follower@test.com",
+                 password="HASHED_PASSWORD"),
+        ])
+        db.session.flush()
+        db.session.add(Follows(user_being_followed_id=1, user_following_id=2))
+        db.session.commit()
+
+        self.client = app.test_client()
+
+    def tearDown(self):
+        app.config['JOBS_INLINE'] = config.DevelopmentConfig.JOBS_INLINE
+        app.config['JOB_MAX_ATTEMPTS'] = config.Config.JOB_MAX_ATTEMPTS
+        db.session.rollback()
+
+    def timeline_ids(self, user_id):
+        return [m.id for m in timeline.timeline_page(user_id)]
+
+    def make_due(self):
+        Job.query.update({Job.run_at: datetime.utcnow() - timedelta(seconds=1)})
+        db.session.commit()
+
+    def test_post_queues_fan_out(self):
+        with self.client as client:
+            with client.session_transaction() as sess:
+                sess[CURR_USER_KEY] = 1
+
+            client.post("/messages/new", data={"text": "Eventually everywhere"})
+
+        msg = Message.query.one()
+        job = Job.query.one()
+        self.assertEqual(job.name, 'timeline.fan_out')
+        self.assertEqual(job.state, jobs.PENDING)
+        self.assertEqual(self.timeline_ids(1), [msg.id])
+        self.assertEqual(self.timeline_ids(2), [])
+
+        self.assertEqual(jobs.work(once=True), 1)
+
+        self.assertEqual(Job.query.one().state, jobs.DONE)
+        self.assertEqual(self.timeline_ids(2), [msg.id])
+
+    def test_delete_user_queues_recount(self):
+        counters.reconcile()
+        db.session.commit()
+
+        with self.client as client:
+            with client.session_transaction() as sess:
+                sess[CURR_USER_KEY] = 2
+
+            client.post("/users/delete")
+
+        job = Job.query.one()
+        self.assertEqual(job.name, 'counters.recount')
+        self.assertEqual(User.query.get(1).followers_count, 1)
+
+        jobs.work(once=True)
+
+        self.assertEqual(User.query.get(1).followers_count, 0)
+
+    def test_idempotency_key(self):
+        first = jobs.enqueue('test.record', key="once", value="a")
+        self.assertIsNotNone(first)
+        self.assertIsNone(jobs.enqueue('test.record', key="once", value="a"))
+        db.session.commit()
+
+        jobs.work(once=True)
+        self.assertEqual(calls, ["a"])
+        self.assertEqual(Job.query.count(), 1)
+
+    def test_unknown_task(self):
+        with self.assertRaises(ValueError):
+            jobs.enqueue('no.such.task')
+
+    def test_retry_with_backoff(self):
+        jobs.enqueue('test.record', value="b", failures=1)
+        db.session.commit()
+
+        with self.assertLogs('warbler.jobs', 'ERROR'):
+            self.assertEqual(jobs.work(once=True), 1)
+
+        job = Job.query.one()
+        self.assertEqual(job.state, jobs.PENDING)
+        self.assertEqual(job.attempts, 1)
+        self.assertIn("failure 1", job.last_error)
+        self.assertGreater(job.run_at, datetime.utcnow())
+
+        # Not due again until the retry delay has passed.
+        self.assertEqual(jobs.work(once=True), 0)
+
+        self.make_due()
+        jobs.work(once=True)
+
+        job = Job.query.one()
+        self.assertEqual(job.state, jobs.DONE)
+        self.assertEqual(job.attempts, 2)
+        self.assertEqual(calls, ["b", "b"])
+
+    def test_backoff_doubles(self):
+        self.assertEqual(jobs.retry_delay(1) * 4, jobs.retry_delay(3))
+
+    def test_gives_up(self):
+        app.config['JOB_MAX_ATTEMPTS'] = 2
+        jobs.enqueue('test.record', value="c", failures=5)
+        db.session.commit()
+
+        with self.assertLogs('warbler.jobs', 'ERROR'):
+            for _ in range(3):
+                self.make_due()
+                jobs.work(once=True)
+
+        job = Job.query.one()
+        self.assertEqual(job.state, jobs.FAILED)
+        self.assertEqual(calls, ["c", "c"])
+
+    def test_follow_jobs_in_any_order(self):
+        """A backfill run after the unfollow that follows it does nothing."""
+
+        db.session.add(Message(id=10, text="old news", user_id=1))
+        db.session.add(User(id=3, username="fickle", email="fickle@test.com",
+                            password="HASHED_PASSWORD"))
+        db.session.commit()
+
+        relationships.follow(3, 1)
+        relationships.unfollow(3, 1)
+        db.session.commit()
+
+        prune, backfill = Job.query.order_by(Job.id.desc()).all()
+        prune.run_at = backfill.run_at - timedelta(seconds=1)
+        db.session.commit()
+
+        self.assertEqual(jobs.work(once=True), 2)
+        self.assertEqual(self.timeline_ids(3), [])
+
+    def test_inline(self):
+        app.config['JOBS_INLINE'] = True
+
+        jobs.enqueue('test.record', value="d")
+
+        self.assertEqual(calls, ["d"])
+        self.assertEqual(Job.query.one().state, jobs.DONE)
+        self.assertEqual(jobs.work(once=True), 0)
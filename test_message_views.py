@@ -5,6 +5,7 @@ import os
 from unittest import TestCase
 
 from models import db, connect_db, Message, User
+import search
 
 os.environ['DATABASE_URL'] = "postgresql:///warbler-test"
 
@@ -124,3 +125,43 @@ class MessageViewTestCase(TestCase):
 
             m = Message.query.get(9998)
             self.assertIsNotNone(m)
+
+    def test_search_messages(self):
+        """Message search finds matching warbles and drops deleted ones."""
+
+        with self.client as client:
+            with client.session_transaction() as sess:
+                sess[CURR_USER_KEY] = self.testuser.id
+
+            client.post("/messages/new", data={"text": "Pumpkins are scary"})
+            client.post("/messages/new", data={"text": "Lunch was fine"})
+
+            res = client.get("/messages/search?q=pumpkin")
+            self.assertIn("Pumpkins are scary", str(res.data))
+            self.assertNotIn("Lunch was fine", str(res.data))
+
+            msg = Message.query.filter_by(text="Pumpkins are scary").one()
+            client.post(f"/messages/{msg.id}/delete")
+
+            res = client.get("/messages/search?q=pumpkin")
+            self.assertIn("Sorry, no warbles found", str(res.data))
+
+    def test_search_messages_pagination(self):
+        """Message search pages by relevance, then recency."""
+
+        db.session.add_all([
+            Message(id=1, text="owl", user_id=self.testuser_id),
+            Message(id=2, text="owl owl owl", user_id=self.testuser_id),
+            Message(id=3, text="an owl and a hawk and a crow", user_id=self.testuser_id),
+            Message(id=4, text="hawk", user_id=self.testuser_id),
+        ])
+        db.session.commit()
+
+        first = search.search_messages("owl", per_page=2)
+        self.assertEqual([m.id for m in first], [2, 1])
+        self.assertIsNone(first.prev)
+
+        cursor = search.parse_search_cursor(first.next['before'])
+        second = search.search_messages("owl", before=cursor, per_page=2)
+        self.assertEqual([m.id for m in second], [3])
+        self.assertIsNone(second.next)
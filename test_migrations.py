@@ -0,0 +1,79 @@
+"""Schema migration tests."""
+
+from unittest import TestCase
+
+from sqlalchemy import inspect
+
+from app import app
+from models import db, User, Message, Likes
+import migrations
+
+app.config['SQLALCHEMY_DATABASE_URI'] = 'postgresql:///warbler-test'
+app.config['SQLALCHEMY_ECHO'] = False
+app.config['TESTING'] = True
+
+
+def index_names(table):
+    return {index['name'] for index in inspect(db.engine).get_indexes(table)}
+
+
+class MigrationsTestCase(TestCase):
+    """Tests for versioned migrations."""
+
+    def setUp(self):
+        db.drop_all()
+
+    def tearDown(self):
+        """Clean up fouled transactions."""
+
+        res = super().tearDown()
+        db.session.rollback()
+        return res
+
+    def test_new_database_is_created_at_head(self):
+        self.assertEqual(migrations.upgrade(), [])
+
+        with db.engine.connect() as connection:
+            self.assertEqual(migrations.applied_versions(connection),
+                             {m.version for m in migrations.MIGRATIONS})
+            self.assertEqual(migrations.pending(connection), [])
+
+        self.assertIn('uq_likes_user_message', index_names('likes'))
+
+    def test_upgrade_adds_hot_path_indexes(self):
+        """An older database is deduplicated and indexed; reruns are no-ops."""
+
+        db.create_all()
+        for name in migrations.HOT_PATH_INDEXES:
+            db.session.execute(f"DROP INDEX {name}")
+
+        db.session.add(User(id=1, username="liker", email="liker@test.com",
+                            password="HASHED_PASSWORD"))
+        db.session.add(Message(id=1, text="liked twice", user_id=1))
+        db.session.flush()
+        db.session.add_all([Likes(user_id=1, message_id=1),
+                            Likes(user_id=1, message_id=1)])
+        migrations.stamp(db.session.connection(), migrations.MIGRATIONS[:3])
+        db.session.commit()
+
+        applied = migrations.upgrade()
+
+        self.assertEqual([m.version for m in applied], [4, 5])
+        self.assertEqual(Likes.query.count(), 1)
+        self.assertEqual(User.query.get(1).likes_count, 1)
+        self.assertEqual(Message.query.get(1).likes_count, 1)
+        self.assertIn('uq_likes_user_message', index_names('likes'))
+        self.assertIn('ix_messages_user_timestamp', index_names('messages'))
+
+        self.assertEqual(migrations.upgrade(), [])
+
+    def test_upgrade_adds_jobs_table(self):
+        db.create_all()
+        db.session.execute("DROP TABLE jobs")
+        migrations.stamp(db.session.connection(), migrations.MIGRATIONS[:4])
+        db.session.commit()
+
+        applied = migrations.upgrade()
+
+        self.assertEqual([m.version for m in applied], [5])
+        self.assertIn('ix_jobs_state_run_at', index_names('jobs'))
@@ -0,0 +1,87 @@
+"""Password hashing tests."""
+
+from concurrent.futures import ThreadPoolExecutor
+from unittest import TestCase
+
+from app import app
+from models import db, User
+import passwords
+
+app.config['SQLALCHEMY_DATABASE_URI'] = 'postgresql:///warbler-test'
+app.config['SQLALCHEMY_ECHO'] = False
+app.config['TESTING'] = True
+
+# The lowest cost bcrypt accepts, to keep the tests fast.
+FAST_ROUNDS = 4
+
+
+class PasswordHasherTestCase(TestCase):
+    """Tests for the bcrypt process pool."""
+
+    def setUp(self):
+        self.hasher = passwords.PasswordHasher(rounds=FAST_ROUNDS, workers=2,
+                                               max_pending=2)
+
+    def tearDown(self):
+        self.hasher.shutdown()
+
+    def test_hash_and_check(self):
+        pw_hash = self.hasher.hash("secret")
+
+        self.assertTrue(pw_hash.startswith("$2b$04$"))
+        self.assertTrue(self.hasher.check(pw_hash, "secret"))
+        self.assertFalse(self.hasher.check(pw_hash, "wrong"))
+        self.assertEqual(self.hasher.queue_depth(), 0)
+
+    def test_empty_password(self):
+        with self.assertRaises(ValueError):
+            self.hasher.hash("")
+
+    def test_inline(self):
+        self.hasher.configure(workers=0)
+        self.assertTrue(self.hasher.check(self.hasher.hash("secret"), "secret"))
+
+    def test_concurrent_checks(self):
+        """More callers than slots all get an answer."""
+
+        pw_hash = self.hasher.hash("secret")
+        guesses = ["secret", "wrong"] * 4
+
+        with ThreadPoolExecutor(len(guesses)) as pool:
+            results = list(pool.map(
+                lambda guess: self.hasher.check(pw_hash, guess), guesses))
+
+        self.assertEqual(results, [True, False] * 4)
+        self.assertEqual(self.hasher.queue_depth(), 0)
+
+    def test_needs_rehash(self):
+        self.assertFalse(self.hasher.needs_rehash("$2b$04$" + "x" * 53))
+        self.assertTrue(self.hasher.needs_rehash("$2b$12$" + "x" * 53))
+        self.assertTrue(self.hasher.needs_rehash("not a hash"))
+
+
+class RehashTestCase(TestCase):
+    """Outdated hashes are upgraded on login."""
+
+    def setUp(self):
+        db.drop_all()
+        db.create_all()
+        self.rounds = passwords.get_hasher(app).rounds
+
+    def tearDown(self):
+        passwords.get_hasher(app).configure(rounds=self.rounds)
+        db.session.rollback()
+
+    def test_rehash_on_login(self):
+        passwords.get_hasher(app).configure(rounds=FAST_ROUNDS)
+        User.signup("rehash", "rehash@test.com", "password", None)
+        db.session.commit()
+
+        passwords.get_hasher(app).configure(rounds=FAST_ROUNDS + 1)
+        self.assertTrue(User.authenticate("rehash", "password"))
+        db.session.commit()
+
+        user = User.query.filter_by(username="rehash").one()
+        self.assertTrue(user.password.startswith("$2b$05$"))
+        self.assertTrue(User.authenticate("rehash", "password"))
+        self.assertFalse(User.authenticate("rehash", "wrong"))
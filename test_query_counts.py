@@ -0,0 +1,114 @@
+"""Query-count tests: pages issue a fixed number of SQL statements."""
+
+from contextlib import contextmanager
+from unittest import TestCase
+
+from sqlalchemy import event
+
+from app import app, CURR_USER_KEY
+from models import db, User, Message, Follows, Likes
+import timeline
+
+app.config['SQLALCHEMY_DATABASE_URI'] = 'postgresql:///warbler-test'
+app.config['SQLALCHEMY_ECHO'] = False
+app.config['TESTING'] = True
+
+NUM_AUTHORS = 10
+MESSAGES_PER_AUTHOR = 3
+
+
+@contextmanager
+def count_queries():
+    """Collect every SQL statement executed inside the block."""
+
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, *args):
+        statements.append(statement)
+
+    event.listen(db.engine, 'before_cursor_execute', before_cursor_execute)
+    try:
+        yield statements
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', before_cursor_execute)
+
+
+class QueryCountTestCase(TestCase):
+    """Rendering a page must not issue one query per item."""
+
+    def setUp(self):
+        """Create a viewer following several authors with liked messages."""
+
+        db.drop_all()
+        db.create_all()
+
+        self.client = app.test_client()
+
+        self.viewer_id = 1
+        db.session.add(User(id=self.viewer_id, username="viewer",
+                            email="viewer@test.com", password="HASHED_PASSWORD"))
+
+        author_ids = [100 + i for i in range(NUM_AUTHORS)]
+
+        for i, author_id in enumerate(author_ids):
+            db.session.add(User(id=author_id, username=f"author{i}",
+                                email=f"author{i}@test.com",
+                                password="HASHED_PASSWORD"))
+        db.session.flush()
+
+        message_ids = []
+        for i, author_id in enumerate(author_ids):
+            db.session.add(Follows(user_being_followed_id=author_id,
+                                   user_following_id=self.viewer_id))
+            db.session.add(Follows(user_being_followed_id=self.viewer_id,
+                                   user_following_id=author_id))
+            for j in range(MESSAGES_PER_AUTHOR):
+                message_id = 1000 + i * MESSAGES_PER_AUTHOR + j
+                db.session.add(Message(id=message_id, text=f"warble {message_id}",
+                                       user_id=author_id))
+                message_ids.append(message_id)
+        db.session.flush()
+
+        for message_id in message_ids:
+            db.session.add(Likes(user_id=self.viewer_id, message_id=message_id))
+
+        db.session.commit()
+        timeline.rebuild()
+        db.session.commit()
+
+    def tearDown(self):
+        """Clean up fouled transactions."""
+
+        res = super().tearDown()
+        db.session.rollback()
+        return res
+
+    def assert_max_queries(self, url, limit):
+        with self.client as client:
+            with client.session_transaction() as sess:
+                sess[CURR_USER_KEY] = self.viewer_id
+
+            with count_queries() as statements:
+                res = client.get(url)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertLessEqual(len(statements), limit, "\n".join(statements))
+
+    def test_homepage(self):
+        self.assert_max_queries("/", 4)
+
+    def test_user_show(self):
+        self.assert_max_queries(f"/users/{self.viewer_id}", 3)
+        self.assert_max_queries("/users/100", 4)
+
+    def test_user_likes(self):
+        self.assert_max_queries(f"/users/{self.viewer_id}/likes", 3)
+
+    def test_user_following(self):
+        self.assert_max_queries(f"/users/{self.viewer_id}/following", 4)
+
+    def test_user_followers(self):
+        self.assert_max_queries(f"/users/{self.viewer_id}/followers", 4)
+
+    def test_user_list(self):
+        self.assert_max_queries("/users", 3)
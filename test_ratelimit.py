@@ -0,0 +1,97 @@
+"""Rate limiting tests."""
+
+from unittest import TestCase
+
+from app import app
+from models import db, User
+from ratelimit import LocalBucketStore, Limit
+from test_cache import FakeClock
+from test_query_counts import count_queries
+
+app.config['SQLALCHEMY_DATABASE_URI'] = 'postgresql:///warbler-test'
+app.config['SQLALCHEMY_ECHO'] = False
+app.config['TESTING'] = True
+app.config['WTF_CSRF_ENABLED'] = False
+
+
+class LocalBucketStoreTestCase(TestCase):
+    """Tests for the in-process token buckets."""
+
+    def test_bucket_empties_and_refills(self):
+        clock = FakeClock()
+        store = LocalBucketStore(clock=clock)
+        limit = Limit(capacity=2, period=10)
+
+        self.assertEqual(store.take('a', limit), 0)
+        self.assertEqual(store.take('a', limit), 0)
+        self.assertEqual(store.take('a', limit), 5)
+        self.assertEqual(store.take('b', limit), 0)
+
+        clock.now = 5
+        self.assertEqual(store.take('a', limit), 0)
+        self.assertGreater(store.take('a', limit), 0)
+
+    def test_store_is_bounded(self):
+        store = LocalBucketStore(maxsize=2)
+        limit = Limit(capacity=1, period=60)
+
+        for key in 'abc':
+            store.take(key, limit)
+
+        self.assertEqual(len(store), 2)
+        self.assertEqual(store.take('a', limit), 0)
+
+
+class LoginThrottleTestCase(TestCase):
+    """Login attempts are limited per username and per IP."""
+
+    def setUp(self):
+        db.drop_all()
+        db.create_all()
+
+        self.client = app.test_client()
+        app.extensions['rate_limits'].clear()
+
+        app.config['LOGIN_LIMIT_PER_USERNAME'] = Limit(capacity=3, period=60)
+        app.config['LOGIN_LIMIT_PER_IP'] = Limit(capacity=5, period=60)
+
+        User.signup("victim", "victim@test.com", "password", None)
+        db.session.commit()
+
+    def tearDown(self):
+        """Clean up fouled transactions."""
+
+        del app.config['LOGIN_LIMIT_PER_USERNAME']
+        del app.config['LOGIN_LIMIT_PER_IP']
+        app.extensions['rate_limits'].clear()
+
+        res = super().tearDown()
+        db.session.rollback()
+        return res
+
+    def attempt(self, username, password="not-the-password", ip='10.0.0.1'):
+        return self.client.post("/login", data={
+            "username": username, "password": password,
+        }, environ_base={'REMOTE_ADDR': ip})
+
+    def test_username_limit(self):
+        for _ in range(3):
+            self.assertEqual(self.attempt("victim").status_code, 200)
+
+        with count_queries() as statements:
+            res = self.attempt("VICTIM", "password", ip='10.0.0.2')
+
+        self.assertEqual(res.status_code, 429)
+        self.assertIn(int(res.headers['Retry-After']), range(1, 21))
+        self.assertIn("Too many login attempts", str(res.data))
+        self.assertEqual(statements, [])
+
+        self.assertEqual(self.attempt("someone").status_code, 200)
+
+    def test_ip_limit(self):
+        for i in range(5):
+            self.assertEqual(self.attempt(f"guess{i}").status_code, 200)
+
+        self.assertEqual(self.attempt("victim", "password").status_code, 429)
+        self.assertEqual(
+            self.attempt("victim", "password", ip='10.0.0.2').status_code, 302)
@@ -0,0 +1,132 @@
+"""Follow and like tests."""
+
+from concurrent.futures import ThreadPoolExecutor
+from unittest import TestCase
+
+from app import app, CURR_USER_KEY
+from models import db, User, Message, Follows, Likes
+import relationships
+from test_query_counts import count_queries
+
+app.config['SQLALCHEMY_DATABASE_URI'] = 'postgresql:///warbler-test'
+app.config['SQLALCHEMY_ECHO'] = False
+app.config['TESTING'] = True
+
+NUM_THREADS = 8
+TOGGLES_PER_THREAD = 10
+
+
+class RelationshipsTestCase(TestCase):
+    """Follows and likes are idempotent single-statement changes."""
+
+    def setUp(self):
+        """Create two users and a message by the second."""
+
+        db.drop_all()
+        db.create_all()
+
+        db.session.add_all([
+            User(id=1, username="alice", email="alice@test.com",
+                 password="HASHED_PASSWORD"),
+            User(id=2, username="bob", email="bob@test.com",
+                 password="HASHED_PASSWORD"),
+        ])
+        db.session.flush()
+        db.session.add(Message(id=10, text="like me", user_id=2))
+        db.session.commit()
+
+    def tearDown(self):
+        """Clean up fouled transactions."""
+
+        res = super().tearDown()
+        db.session.rollback()
+        return res
+
+    def assert_counters_match(self):
+        """Every counter agrees with the rows it counts."""
+
+        db.session.expire_all()
+        alice, bob = User.query.get(1), User.query.get(2)
+
+        likes = Likes.query.filter_by(user_id=1, message_id=10).count()
+        follows = Follows.query.filter_by(user_following_id=1,
+                                          user_being_followed_id=2).count()
+
+        self.assertLessEqual(likes, 1)
+        self.assertLessEqual(follows, 1)
+        self.assertEqual(alice.likes_count, likes)
+        self.assertEqual(Message.query.get(10).likes_count, likes)
+        self.assertEqual(alice.following_count, follows)
+        self.assertEqual(bob.followers_count, follows)
+
+    def test_toggle_like(self):
+        self.assertIs(relationships.toggle_like(1, 10), True)
+        self.assertIs(relationships.toggle_like(1, 10), False)
+        self.assertIs(relationships.toggle_like(1, 10), True)
+        db.session.commit()
+
+        self.assert_counters_match()
+        self.assertEqual(Likes.query.count(), 1)
+
+    def test_cannot_like_own_or_missing_message(self):
+        self.assertIsNone(relationships.toggle_like(2, 10))
+        self.assertIsNone(relationships.toggle_like(1, 99))
+        self.assertEqual(Likes.query.count(), 0)
+
+    def test_follow_is_idempotent(self):
+        self.assertTrue(relationships.follow(1, 2))
+        self.assertFalse(relationships.follow(1, 2))
+        db.session.commit()
+        self.assert_counters_match()
+
+        self.assertTrue(relationships.unfollow(1, 2))
+        self.assertFalse(relationships.unfollow(1, 2))
+        db.session.commit()
+        self.assert_counters_match()
+
+    def test_cannot_follow_self_or_missing_user(self):
+        self.assertFalse(relationships.follow(1, 1))
+        self.assertFalse(relationships.follow(1, 99))
+        self.assertEqual(Follows.query.count(), 0)
+
+    def test_follow_graph_loads_once(self):
+        relationships.follow(1, 2)
+        db.session.commit()
+        alice, bob = User.query.get(1), User.query.get(2)
+
+        graph = relationships.FollowGraph(1)
+        with count_queries() as statements:
+            self.assertTrue(graph.is_following(bob))
+            self.assertFalse(graph.is_following(alice))
+            self.assertTrue(graph.is_following(bob))
+
+        self.assertEqual(len(statements), 1)
+        self.assertFalse(relationships.FollowGraph(None).is_following(bob))
+
+    def test_concurrent_toggles(self):
+        """Many threads toggling at once never duplicate rows or drift counters."""
+
+        db.session.remove()
+
+        def hammer(thread):
+            client = app.test_client()
+            with client.session_transaction() as sess:
+                sess[CURR_USER_KEY] = 1
+
+            statuses = []
+            for i in range(TOGGLES_PER_THREAD):
+                statuses.append(client.post("/users/add_like/10").status_code)
+                if (thread + i) % 2:
+                    url = "/users/follow/2"
+                else:
+                    url = "/users/stop-following/2"
+                statuses.append(client.post(url).status_code)
+            return statuses
+
+        with ThreadPoolExecutor(NUM_THREADS) as pool:
+            statuses = [status
+                        for result in pool.map(hammer, range(NUM_THREADS))
+                        for status in result]
+
+        self.assertEqual(set(statuses), {302})
+        self.assert_counters_match()
@@ -0,0 +1,121 @@
+"""Read replica routing tests."""
+
+import os
+import tempfile
+from unittest import TestCase
+
+from app import app, CURR_USER_KEY
+from models import db, User, Message, Follows
+import replicas
+import timeline
+
+app.config['SQLALCHEMY_DATABASE_URI'] = 'postgresql:///warbler-test'
+app.config['SQLALCHEMY_ECHO'] = False
+app.config['TESTING'] = True
+app.config['WTF_CSRF_ENABLED'] = False
+
+REPLICA_URL = ("sqlite:///"
+               + os.path.join(tempfile.gettempdir(), "warbler-replica-test.db"))
+
+
+def replica_engine():
+    return db.get_engine(app, bind=replicas.BIND_KEY)
+
+
+def replicate():
+    """Make the replica a copy of the primary as it stands."""
+
+    replica = replica_engine()
+    db.metadata.drop_all(replica)
+    db.metadata.create_all(replica)
+
+    with replica.begin() as conn:
+        for table in db.metadata.sorted_tables:
+            rows = [dict(row) for row in db.session.execute(table.select())]
+            if rows:
+                conn.execute(table.insert(), rows)
+
+
+class ReplicaTestCase(TestCase):
+    """Read-only views read from the replica, except just after a write."""
+
+    def setUp(self):
+        app.config['SQLALCHEMY_BINDS'] = {replicas.BIND_KEY: REPLICA_URL}
+
+        db.drop_all()
+        db.create_all()
+
+        db.session.add_all([
+            User(id=1, username="viewer", email="viewer@test.com",
+                 password="HASHED_PASSWORD"),
+            User(id=2, username="author", email="author@test.com",
+                 password="HASHED_PASSWORD"),
+            User(id=3, username="newcomer", email="newcomer@test.com",
+                 password="HASHED_PASSWORD"),
+        ])
+        db.session.flush()
+        db.session.add(Message(id=10, text="replicated warble", user_id=2))
+        db.session.add(Follows(user_following_id=1, user_being_followed_id=2))
+        db.session.flush()
+        timeline.rebuild()
+        db.session.commit()
+
+        replicate()
+
+        # Changes the replica hasn't caught up with yet.
+        User.query.get(2).username = "renamed"
+        db.session.commit()
+
+        self.client = app.test_client()
+        with self.client.session_transaction() as sess:
+            sess[CURR_USER_KEY] = 1
+
+    def tearDown(self):
+        app.config['SQLALCHEMY_BINDS'] = None
+        db.session.rollback()
+
+    def expire_stickiness(self):
+        with self.client.session_transaction() as sess:
+            sess[replicas.STICKY_KEY] = 0
+
+    def test_read_only_views(self):
+        for path in ["/users/2", "/messages/10", "/"]:
+            html = self.client.get(path).get_data(as_text=True)
+            self.assertIn("@author", html, path)
+            self.assertNotIn("renamed", html, path)
+
+    def test_other_views(self):
+        res = self.client.get("/api/v1/users/2")
+        self.assertEqual(res.get_json()['username'], "renamed")
+
+    def test_no_replica(self):
+        app.config['SQLALCHEMY_BINDS'] = None
+
+        html = self.client.get("/users/2").get_data(as_text=True)
+        self.assertIn("@renamed", html)
+
+    def test_reads_own_posts(self):
+        res = self.client.post("/messages/new", data={"text": "fresh warble"})
+        self.assertEqual(res.status_code, 302)
+
+        with replica_engine().connect() as conn:
+            self.assertEqual(conn.execute(
+                "SELECT count(*) FROM messages WHERE text = 'fresh warble'")
+                .scalar(), 0)
+
+        html = self.client.get("/users/1").get_data(as_text=True)
+        self.assertIn("fresh warble", html)
+
+        self.expire_stickiness()
+        html = self.client.get("/users/1").get_data(as_text=True)
+        self.assertNotIn("fresh warble", html)
+
+    def test_reads_own_follows(self):
+        self.client.post("/users/follow/3")
+
+        html = self.client.get("/users/1/following").get_data(as_text=True)
+        self.assertIn("@newcomer", html)
+
+        self.expire_stickiness()
+        html = self.client.get("/users/1/following").get_data(as_text=True)
+        self.assertNotIn("@newcomer", html)
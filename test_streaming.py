@@ -0,0 +1,99 @@
+"""Streamed rendering tests."""
+
+from datetime import datetime, timedelta
+from unittest import TestCase
+from unittest.mock import patch
+
+from app import app, CURR_USER_KEY
+from models import db, User, Message, Likes
+import pagination
+import timeline
+from test_query_counts import count_queries
+
+app.config['SQLALCHEMY_DATABASE_URI'] = 'postgresql:///warbler-test'
+app.config['SQLALCHEMY_ECHO'] = False
+app.config['TESTING'] = True
+
+NUM_MESSAGES = 7
+
+
+class StreamingTestCase(TestCase):
+    """Streamed pages match buffered ones."""
+
+    def setUp(self):
+        db.drop_all()
+        db.create_all()
+
+        db.session.add(User(id=1, username="viewer", email="viewer@test.com",
+                            password="HASHED_PASSWORD"))
+        db.session.flush()
+
+        start = datetime(2020, 1, 1)
+        db.session.add_all([Message(id=i, text=f"warble {i}", user_id=1,
+                                    timestamp=start + timedelta(minutes=i))
+                            for i in range(1, NUM_MESSAGES + 1)])
+        db.session.flush()
+        db.session.add_all([Likes(user_id=1, message_id=i) for i in (2, 5, 6)])
+        db.session.flush()
+        timeline.rebuild()
+        db.session.commit()
+
+        self.client = app.test_client()
+        with self.client.session_transaction() as sess:
+            sess[CURR_USER_KEY] = 1
+
+    def tearDown(self):
+        app.config['STREAM_TEMPLATES'] = False
+        db.session.rollback()
+
+    def test_streamed_page(self):
+        """Items and cursors match the buffered page, in both directions."""
+
+        with app.test_request_context(), \
+                patch.object(pagination, 'STREAM_BATCH_SIZE', 2):
+            for cursor in [{}, {'before': (datetime(2020, 1, 1, 0, 5), 5)}]:
+                buffered = timeline.timeline_page(1, per_page=3, **cursor)
+                streamed = timeline.timeline_page(1, per_page=3, stream=True,
+                                                  **cursor)
+
+                batches = []
+                streamed.on_batch(lambda batch: batches.append(len(batch)))
+
+                self.assertEqual([m.id for m in streamed],
+                                 [m.id for m in buffered])
+                self.assertEqual(batches, [2, 1])
+                self.assertEqual(streamed.next, buffered.next)
+                self.assertEqual(streamed.prev, buffered.prev)
+
+            last = timeline.timeline_page(1, per_page=NUM_MESSAGES, stream=True)
+            self.assertEqual(len(list(last)), NUM_MESSAGES)
+            self.assertIsNone(last.next)
+
+    def test_same_html(self):
+        for url in ["/", "/users/1"]:
+            buffered = self.client.get(url).get_data(as_text=True)
+
+            app.config['STREAM_TEMPLATES'] = True
+            with patch.object(pagination, 'STREAM_BATCH_SIZE', 2):
+                res = self.client.get(url)
+            app.config['STREAM_TEMPLATES'] = False
+
+            self.assertTrue(res.is_streamed)
+            self.assertEqual(res.get_data(as_text=True), buffered)
+
+    def test_head_before_rows(self):
+        """The start of the page is sent before the timeline is queried."""
+
+        app.config['STREAM_TEMPLATES'] = True
+
+        with count_queries() as statements:
+            res = self.client.get("/", buffered=False)
+            chunks = iter(res.response)
+            head = next(chunks)
+            queried = list(statements)
+            rest = b"".join(chunks)
+            res.close()
+
+        self.assertIn(b"<!DOCTYPE html>", head)
+        self.assertFalse(any("timeline_entries" in s for s in queried))
+        self.assertIn(b"warble 1", rest)
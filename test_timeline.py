@@ -0,0 +1,240 @@
+"""Home timeline tests."""
+
+from datetime import datetime
+from unittest import TestCase
+
+from app import app, CURR_USER_KEY
+from models import db, User, Message, Follows, TimelineEntry
+import config
+import counters
+import timeline
+from pagination import parse_message_cursor
+from test_query_counts import count_queries
+
+app.config['SQLALCHEMY_DATABASE_URI'] = 'postgresql:///warbler-test'
+app.config['SQLALCHEMY_ECHO'] = False
+app.config['TESTING'] = True
+app.config['WTF_CSRF_ENABLED'] = False
+
+
+class TimelineTestCase(TestCase):
+    """Tests for materialized home timelines."""
+
+    def setUp(self):
+        """Create an author, a follower and a bystander."""
+
+        db.drop_all()
+        db.create_all()
+
+        self.client = app.test_client()
+
+        self.author = User.signup("author", "author@test.com", "password", None)
+        self.author.id = 101
+        self.follower = User.signup("follower", "follower@test.com", "password", None)
+        self.follower.id = 202
+        self.bystander = User.signup("bystander", "bystander@test.com", "password", None)
+        self.bystander.id = 303
+        db.session.commit()
+
+        db.session.add(Follows(user_being_followed_id=101, user_following_id=202))
+        db.session.commit()
+
+    def tearDown(self):
+        """Clean up fouled transactions."""
+
+        res = super().tearDown()
+        db.session.rollback()
+        return res
+
+    def timeline_ids(self, user_id):
+        return [m.id for m in timeline.timeline_page(user_id)]
+
+    def test_post_fans_out_to_followers(self):
+        """Posting pushes the message to the author and followers only."""
+
+        with self.client as client:
+            with client.session_transaction() as sess:
+                sess[CURR_USER_KEY] = 101
+
+            client.post("/messages/new", data={"text": "Fan me out"})
+
+        msg = Message.query.one()
+        self.assertEqual(self.timeline_ids(101), [msg.id])
+        self.assertEqual(self.timeline_ids(202), [msg.id])
+        self.assertEqual(self.timeline_ids(303), [])
+
+    def test_follow_backfills_and_unfollow_prunes(self):
+        """Following copies existing messages; unfollowing removes them."""
+
+        msg = Message(id=5001, text="Already here", user_id=101)
+        db.session.add(msg)
+        db.session.commit()
+
+        with self.client as client:
+            with client.session_transaction() as sess:
+                sess[CURR_USER_KEY] = 303
+
+            client.post("/users/follow/101")
+            self.assertEqual(self.timeline_ids(303), [5001])
+
+            client.post("/users/stop-following/101")
+            self.assertEqual(self.timeline_ids(303), [])
+
+    def test_delete_removes_entries(self):
+        """Deleting a message removes it from every timeline."""
+
+        with self.client as client:
+            with client.session_transaction() as sess:
+                sess[CURR_USER_KEY] = 101
+
+            client.post("/messages/new", data={"text": "Short-lived"})
+            msg = Message.query.one()
+            client.post(f"/messages/{msg.id}/delete")
+
+        self.assertEqual(TimelineEntry.query.count(), 0)
+
+    def test_rebuild(self):
+        """Rebuilding derives timelines from follows and messages."""
+
+        db.session.add_all([
+            Message(id=6001, text="By author", user_id=101),
+            Message(id=6002, text="By bystander", user_id=303),
+        ])
+        db.session.commit()
+
+        timeline.rebuild()
+        db.session.commit()
+
+        self.assertEqual(self.timeline_ids(202), [6001])
+        self.assertEqual(self.timeline_ids(303), [6002])
+
+    def test_rebuild_limit(self):
+        """Followers get the most recent messages of each author."""
+
+        db.session.add_all([
+            Message(id=6000 + i, text=f"warble {i}", user_id=101,
+                    timestamp=datetime(2020, 1, 1, 0, i))
+            for i in range(4)])
+        db.session.commit()
+
+        timeline.rebuild(limit=2)
+        db.session.commit()
+
+        self.assertEqual(self.timeline_ids(202), [6003, 6002])
+        self.assertEqual(self.timeline_ids(101), [6003, 6002, 6001, 6000])
+
+
+class HybridTimelineTestCase(TestCase):
+    """Tests for authors whose messages are pulled rather than pushed."""
+
+    def setUp(self):
+        """Create a popular author (2 followers) and a regular one."""
+
+        app.config['TIMELINE_PULL_THRESHOLD'] = 2
+
+        db.drop_all()
+        db.create_all()
+
+        self.client = app.test_client()
+
+        db.session.add_all([
+            User(id=id, username=name, email=f"{name}@test.com",
+                 password="HASHED_PASSWORD")
+            for id, name in [(1, "popular"), (2, "viewer"), (3, "fan"),
+                             (4, "regular"), (5, "newcomer")]])
+        db.session.flush()
+        db.session.add_all([
+            Follows(user_being_followed_id=1, user_following_id=2),
+            Follows(user_being_followed_id=1, user_following_id=3),
+            Follows(user_being_followed_id=4, user_following_id=2),
+        ])
+
+        # Alternating popular/regular messages, oldest first.
+        db.session.add_all([
+            Message(id=100 + i, text=f"warble {i}", user_id=(1, 4)[i % 2],
+                    timestamp=datetime(2020, 1, 1, 0, i))
+            for i in range(6)])
+        db.session.flush()
+        counters.reconcile()
+        timeline.rebuild()
+        db.session.commit()
+
+    def tearDown(self):
+        app.config['TIMELINE_PULL_THRESHOLD'] = (
+            config.Config.TIMELINE_PULL_THRESHOLD)
+        db.session.rollback()
+
+    def timeline_ids(self, user_id, **kwargs):
+        return [m.id for m in timeline.timeline_page(user_id, **kwargs)]
+
+    def entry_ids(self, user_id):
+        return {message_id for (message_id,) in db.session.query(
+            TimelineEntry.message_id).filter_by(user_id=user_id)}
+
+    def test_rebuild_skips_popular_authors(self):
+        self.assertEqual(self.entry_ids(2), {101, 103, 105})
+        self.assertEqual(self.entry_ids(1), {100, 102, 104})
+
+    def test_merged_timeline(self):
+        self.assertEqual(self.timeline_ids(2),
+                         [105, 104, 103, 102, 101, 100])
+        self.assertEqual(self.timeline_ids(3), [104, 102, 100])
+        self.assertEqual(self.timeline_ids(1), [104, 102, 100])
+
+    def test_pushed_only_in_one_query(self):
+        with count_queries() as statements:
+            self.assertEqual(self.timeline_ids(4), [105, 103, 101])
+        self.assertEqual(len(statements), 1)
+
+        # The pushed entries say there are pulled authors to merge.
+        with count_queries() as statements:
+            self.timeline_ids(2)
+        self.assertGreater(len(statements), 1)
+
+    def test_merged_pages(self):
+        first = timeline.timeline_page(2, per_page=4)
+        self.assertEqual([m.id for m in first], [105, 104, 103, 102])
+        self.assertIsNone(first.prev)
+
+        before = parse_message_cursor(first.next['before'])
+        second = timeline.timeline_page(2, before=before, per_page=4)
+        self.assertEqual([m.id for m in second], [101, 100])
+        self.assertIsNone(second.next)
+
+        after = parse_message_cursor(second.prev['after'])
+        back = timeline.timeline_page(2, after=after, per_page=4)
+        self.assertEqual([m.id for m in back], [105, 104, 103, 102])
+        self.assertIsNone(back.prev)
+
+    def test_post_by_popular_author(self):
+        with self.client as client:
+            with client.session_transaction() as sess:
+                sess[CURR_USER_KEY] = 1
+
+            client.post("/messages/new", data={"text": "To my many fans"})
+
+        msg = Message.query.filter_by(text="To my many fans").one()
+        self.assertEqual(TimelineEntry.query.filter_by(message_id=msg.id)
+                         .count(), 1)
+        self.assertEqual(self.timeline_ids(3)[0], msg.id)
+
+    def test_follow_popular_author(self):
+        with self.client as client:
+            with client.session_transaction() as sess:
+                sess[CURR_USER_KEY] = 5
+
+            client.post("/users/follow/1")
+
+        self.assertEqual(self.entry_ids(5), set())
+        self.assertEqual(self.timeline_ids(5), [104, 102, 100])
+
+    def test_pushed_before_becoming_popular(self):
+        """Messages both pushed and pulled are shown once."""
+
+        app.config['TIMELINE_PULL_THRESHOLD'] = 3
+        timeline.rebuild()
+        app.config['TIMELINE_PULL_THRESHOLD'] = 2
+
+        self.assertEqual(self.entry_ids(2), {100, 101, 102, 103, 104, 105})
+        self.assertEqual(self.timeline_ids(2),
+                         [105, 104, 103, 102, 101, 100])
@@ -1,5 +1,6 @@
 # User view tests
 
+from datetime import datetime, timedelta
 from unittest import TestCase
 from app import app, do_login, CURR_USER_KEY
 from models import db, connect_db, User, Message, Follows, Likes
@@ -90,6 +91,77 @@ class UserViewsTestCase(TestCase):
             self.assertNotIn("@hij", str(res.data))
             self.assertNotIn("@abc", str(res.data))
 
+    def test_user_list_pagination(self):
+        """Test the users view pages by id with a cursor."""
+
+        db.session.add_all([
+            User(id=10000 + i, username=f"paged{i}",
+                 email=f"paged{i}@test.com", password="HASHED_PASSWORD")
+            for i in range(60)
+        ])
+        db.session.commit()
+
+        with self.client as client:
+            res = client.get("/users")
+            self.assertIn("@testuser<", str(res.data))
+            self.assertIn("@paged44<", str(res.data))
+            self.assertNotIn("@paged45<", str(res.data))
+            self.assertIn("after=10044", str(res.data))
+
+            res = client.get("/users?after=10044")
+            self.assertNotIn("@paged44<", str(res.data))
+            self.assertIn("@paged45<", str(res.data))
+            self.assertIn("@paged59<", str(res.data))
+            self.assertIn("before=10045", str(res.data))
+
+            res = client.get("/users?after=nonsense")
+            self.assertEqual(res.status_code, 400)
+
+    def test_user_show_pagination(self):
+        """Test the user detail view pages through messages."""
+
+        start = datetime(2020, 1, 1)
+        db.session.add_all([
+            Message(id=20000 + i, text=f"warble {i}", user_id=self.testuser_id,
+                    timestamp=start + timedelta(minutes=i))
+            for i in range(105)
+        ])
+        db.session.commit()
+
+        with self.client as client:
+            res = client.get(f"/users/{self.testuser_id}")
+            self.assertIn("warble 104<", str(res.data))
+            self.assertIn("warble 5<", str(res.data))
+            self.assertNotIn("warble 4<", str(res.data))
+
+            cursor = f"{(start + timedelta(minutes=5)).isoformat()}_20005"
+            res = client.get(f"/users/{self.testuser_id}?before={cursor}")
+            self.assertIn("warble 4<", str(res.data))
+            self.assertIn("warble 0<", str(res.data))
+            self.assertNotIn("warble 5<", str(res.data))
+
+    def test_user_search_ranking(self):
+        """Test user search is case-insensitive and ranks closer matches first."""
+
+        db.session.add_all([
+            User(username="xTESTINGx", email="a@test.com", password="HASHED_PASSWORD"),
+            User(username="Test", email="b@test.com", password="HASHED_PASSWORD"),
+        ])
+        db.session.commit()
+
+        with self.client as client:
+            data = str(client.get("/users?q=TEST").data)
+
+            found = [name for name in ["@Test<", "@testing<", "@testuser<", "@xTESTINGx<"]
+                     if name in data]
+            self.assertEqual(len(found), 4)
+            self.assertLess(data.index("@Test<"), data.index("@testing<"))
+            self.assertLess(data.index("@testuser<"), data.index("@xTESTINGx<"))
+
+            data = str(client.get("/users?q=te").data)
+            self.assertIn("@testuser<", data)
+            self.assertNotIn("@xTESTINGx<", data)
+
     def test_user_show(self):
         """Test user detail view."""
 
@@ -150,6 +222,22 @@ class UserViewsTestCase(TestCase):
             self.assertNotIn("@hij", str(res.data))
             self.assertNotIn("@testing", str(res.data))
 
+    def test_show_following_pages(self):
+
+        self.setup_followers()
+        with self.client as client:
+            with client.session_transaction() as sess:
+                sess[CURR_USER_KEY] = self.testuser_id
+
+            res = client.get(
+                f"/users/{self.testuser_id}/following?after={self.u1_id}")
+            self.assertEqual(res.status_code, 200)
+            self.assertNotIn("@abc", str(res.data))
+            self.assertIn("@efg", str(res.data))
+
+            res = client.get(f"/users/{self.testuser_id}/following?after=x")
+            self.assertEqual(res.status_code, 400)
+
     def test_show_followers(self):
 
         self.setup_followers()
@@ -0,0 +1,250 @@
+"""Materialized home timelines for Warbler.
+
+Each user's home feed is stored as rows in `timeline_entries`. Posting a
+message pushes an entry to the author and to every follower; following or
+unfollowing someone backfills or prunes that author's messages. Reading a
+feed is then a single indexed range scan on (user_id, timestamp, message_id).
+
+Authors with TIMELINE_PULL_THRESHOLD or more followers are the exception:
+copying each of their messages to every follower would make posting cost
+as much as their audience is large. Their messages only go to their own
+timeline, and `timeline_page()` pulls them from `messages` for each
+follower, merging them with the pushed entries by timestamp. An author who
+drops back below the threshold has the messages posted meanwhile missing
+from followers' timelines until `rebuild()`.
+
+Only the author's own entry is written in the request. Fanning out to
+followers, backfilling and pruning are background jobs (see jobs.py), so
+they check the follows as they stand when they run and skip entries that
+already exist: running one twice, or after a later follow change, is
+harmless.
+"""
+
+from models import (db, insert_ignoring_conflicts, Follows, Message,
+                    TimelineEntry, User)
+from pagination import (Page, paginate, merge_pages, message_cursor,
+                        MESSAGES_PER_PAGE)
+import jobs
+
+# How many of a newly-followed user's messages get copied into the
+# follower's timeline.
+TIMELINE_BACKFILL = 100
+
+entries = TimelineEntry.__table__
+
+
+def pull_threshold():
+    return db.get_app().config['TIMELINE_PULL_THRESHOLD']
+
+
+def pushed(author_id):
+    """SQL condition: `author_id`'s messages are pushed to followers."""
+
+    return db.exists().where(db.and_(
+        User.id == author_id,
+        User.followers_count < pull_threshold(),
+    ))
+
+
+def following(follower_id, followed_id):
+    """SQL condition: `follower_id` follows `followed_id`."""
+
+    return db.exists().where(db.and_(
+        Follows.user_following_id == follower_id,
+        Follows.user_being_followed_id == followed_id,
+    ))
+
+
+def follows_pulled(user_id):
+    """SQL condition: `user_id` follows an author whose messages are pulled."""
+
+    return db.exists().where(db.and_(
+        Follows.user_following_id == user_id,
+        Follows.user_being_followed_id == User.id,
+        User.followers_count >= pull_threshold(),
+    ))
+
+
+def push_message(message):
+    """Add `message` to its author's timeline, and queue its fan-out."""
+
+    db.session.execute(entries.insert().values(
+        user_id=message.user_id,
+        message_id=message.id,
+        timestamp=message.timestamp,
+    ))
+
+    jobs.enqueue('timeline.fan_out', key=f"fan_out:{message.id}",
+                 message_id=message.id)
+
+
+@jobs.task('timeline.fan_out')
+def fan_out(message_id):
+    """Push a message to its author's followers' timelines."""
+
+    followers = (db.select([
+        Follows.user_following_id,
+        Message.id,
+        Message.timestamp,
+    ])
+        .select_from(Message.__table__.join(
+            Follows.__table__,
+            Follows.user_being_followed_id == Message.user_id))
+        .where(db.and_(Message.id == message_id, pushed(Message.user_id))))
+
+    db.session.execute(insert_ignoring_conflicts(entries).from_select(
+        ['user_id', 'message_id', 'timestamp'],
+        followers,
+    ))
+
+
+def remove_message(message_id):
+    """Remove a message from every timeline it was delivered to."""
+
+    db.session.execute(
+        entries.delete().where(entries.c.message_id == message_id))
+
+
+@jobs.task('timeline.backfill')
+def backfill(follower_id, followed_id, limit=TIMELINE_BACKFILL):
+    """Copy the most recent messages of `followed_id` into a timeline."""
+
+    recent = (db.select([
+        db.literal(follower_id),
+        Message.id,
+        Message.timestamp,
+    ])
+        .where(db.and_(Message.user_id == followed_id,
+                       pushed(followed_id),
+                       following(follower_id, followed_id)))
+        .order_by(Message.timestamp.desc())
+        .limit(limit))
+
+    db.session.execute(insert_ignoring_conflicts(entries).from_select(
+        ['user_id', 'message_id', 'timestamp'],
+        recent,
+    ))
+
+
+@jobs.task('timeline.prune')
+def prune(follower_id, followed_id):
+    """Drop messages by `followed_id` from a follower's timeline."""
+
+    authored = db.select([Message.id]).where(Message.user_id == followed_id)
+
+    db.session.execute(entries.delete().where(db.and_(
+        entries.c.user_id == follower_id,
+        entries.c.message_id.in_(authored),
+        ~following(follower_id, followed_id),
+    )))
+
+
+def rebuild(limit=TIMELINE_BACKFILL):
+    """Rebuild every timeline from the follows and messages tables.
+
+    Used after bulk loads (e.g. seeding), which bypass the write routes.
+    Like a backfill, each follower gets the `limit` most recent messages
+    of each author they follow; authors get all of their own.
+    """
+
+    db.session.execute(entries.delete())
+
+    own = db.select([Message.user_id, Message.id, Message.timestamp])
+
+    recent = (db.select([
+        Message.user_id,
+        Message.id,
+        Message.timestamp,
+        db.func.row_number().over(
+            partition_by=Message.user_id,
+            order_by=[Message.timestamp.desc(), Message.id.desc()],
+        ).label('recency'),
+    ])
+        .select_from(Message.__table__
+                     .join(User.__table__, User.id == Message.user_id))
+        .where(User.followers_count < pull_threshold())
+        .alias('recent'))
+
+    followed = (db.select([
+        Follows.user_following_id,
+        recent.c.id,
+        recent.c.timestamp,
+    ])
+        .select_from(Follows.__table__
+                     .join(recent,
+                           recent.c.user_id == Follows.user_being_followed_id))
+        .where(recent.c.recency <= limit))
+
+    db.session.execute(entries.insert().from_select(
+        ['user_id', 'message_id', 'timestamp'],
+        db.union_all(own, followed),
+    ))
+
+
+def pulled_authors(user_id):
+    """Ids of the users `user_id` follows whose messages aren't pushed."""
+
+    rows = (db.session
+            .query(User.id)
+            .join(Follows, Follows.user_being_followed_id == User.id)
+            .filter(Follows.user_following_id == user_id,
+                    User.followers_count >= pull_threshold()))
+
+    return [id for (id,) in rows]
+
+
+def timeline_page(user_id, before=None, after=None,
+                  per_page=MESSAGES_PER_PAGE, stream=False):
+    """Return a Page of messages on a user's home timeline.
+
+    When the user follows pulled authors, their pages of messages are
+    merged into the page of pushed entries, and the result is not
+    streamed.
+
+    Each pushed entry is read along with whether there are any, so a
+    timeline without pulled authors costs one query. A streamed page has
+    to know before it starts, and looks them up first.
+    """
+
+    query = (Message
+             .query
+             .join(TimelineEntry, TimelineEntry.message_id == Message.id)
+             .filter(TimelineEntry.user_id == user_id)
+             .options(db.joinedload(Message.user)))
+    columns = [TimelineEntry.timestamp, TimelineEntry.message_id]
+
+    if stream:
+        authors = pulled_authors(user_id)
+        if not authors:
+            return paginate(query, columns, message_cursor,
+                            before=before, after=after, per_page=per_page,
+                            stream=True)
+
+    flagged = paginate(query.add_columns(follows_pulled(user_id)), columns,
+                       lambda row: message_cursor(row[0]),
+                       before=before, after=after, per_page=per_page)
+    pushed_page = Page([msg for msg, pulled in flagged],
+                       next=flagged.next, prev=flagged.prev)
+
+    if not stream:
+        # An empty page doesn't say whether there are pulled authors.
+        any_pulled = not flagged.items or flagged.items[0][1]
+        authors = pulled_authors(user_id) if any_pulled else []
+
+    if not authors:
+        return pushed_page
+
+    pages = [pushed_page]
+
+    for author_id in authors:
+        authored = (Message
+                    .query
+                    .filter(Message.user_id == author_id)
+                    .options(db.joinedload(Message.user)))
+        pages.append(paginate(authored, [Message.timestamp, Message.id],
+                              message_cursor,
+                              before=before, after=after, per_page=per_page))
+
+    return merge_pages(pages, lambda msg: (msg.timestamp, msg.id),
+                       message_cursor,
+                       before=before, after=after, per_page=per_page)